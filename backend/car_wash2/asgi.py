@@ -5,6 +5,12 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+The streaming endpoints in wash/async_views.py (e.g. the SSE feed at
+api/appointments_domicile/stream) only work when served through this
+application, e.g. `uvicorn car_wash2.asgi:application` (the Dockerfile
+default). The async list views there also run under WSGI, but only ASGI
+lets a request waiting on the database not hold a thread.
 """
 
 import os
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 from django.core.management.utils import get_random_secret_key
 from decouple import config
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -91,6 +92,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'wash.routers.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'car_wash2.urls'
@@ -117,13 +119,66 @@ WSGI_APPLICATION = 'car_wash2.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=0, cast=int)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'data' / 'db.sqlite3',
+        # The Dockerfile serves the app with uvicorn (ASGI), where sync code runs on
+        # changing threads and a persistent connection is never reused, only leaked:
+        # connections are closed after each request. Under a WSGI server
+        # (gunicorn/runserver) DB_CONN_MAX_AGE=600 keeps them between requests.
+        # Each new connection costs about 0.25 ms to open the file plus ~35 us for
+        # the per-connection PRAGMAs of wash/db.py (measured on the dev database);
+        # journal_mode=WAL is only set on the first one.
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_MAX_AGE != 0,
+        'OPTIONS': {
+            # Take the write lock at BEGIN: waiting writers then go through busy_timeout
+            # instead of failing right away when upgrading a read lock.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 5,
+        },
     }
 }
 
+# Optional read replica for the admin/analytics views (wash/routers.py).
+# Locally: REPLICA_DB_PATH=data/replica.sqlite3, then keep it fresh with `manage.py sync_replica`.
+REPLICA_DB_PATH = config('REPLICA_DB_PATH', default='')
+if REPLICA_DB_PATH:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': REPLICA_DB_PATH,
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_MAX_AGE != 0,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['wash.routers.ReplicaRouter']
+
+# A client that wrote reads from 'default' for PIN_SECONDS afterwards
+# (wash.routers.ReplicaPinMiddleware); keep it above the sync_replica --interval
+WASH_REPLICA = {
+    'PIN_SECONDS': 10,
+}
+
+# SQLite pragmas (wash/db.py): JOURNAL_MODE once per database file, the others on each new connection
+WASH_SQLITE = {
+    'JOURNAL_MODE': 'WAL',
+    'SYNCHRONOUS': 'NORMAL',
+    'CACHE_SIZE': -20000,  # KiB (20 MB)
+    'MMAP_SIZE': 134217728,  # 128 MB
+    'BUSY_TIMEOUT': 5000,  # ms
+}
+
+# Retries of write views that hit "database is locked" (wash.db.retry_on_lock)
+WASH_DB_RETRY = {
+    'ATTEMPTS': 5,
+    'BASE_DELAY': 0.05,  # seconds, doubled on each attempt
+    'MAX_DELAY': 1.0,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -171,6 +226,16 @@ import os
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Media serving (wash/media.py). Behind the nginx front (nginx/default.conf) set
+# MEDIA_ACCEL_REDIRECT=/protected-media/ so nginx streams the files; nginx needs
+# MEDIA_ROOT mounted at /app/media (see the nginx service in docker-compose.yml).
+# Leave it unset whenever nginx is not in front (e.g. the default compose setup):
+# nothing else understands X-Accel-Redirect and the files would come back empty.
+WASH_MEDIA = {
+    'MAX_AGE': 7 * 24 * 3600,  # seconds
+    'ACCEL_REDIRECT_PREFIX': config('MEDIA_ACCEL_REDIRECT', default='') or None,
+}
+
 from datetime import timedelta
 
 # JWT Settings
@@ -178,6 +243,65 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
+    # Same output as DRF's JSON renderer, encoded with orjson (wash/renderers.py).
+    # Request bodies keep DRF's JSONParser: orjson doesn't parse them faster here
+    'DEFAULT_RENDERER_CLASSES': (
+        'wash.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+}
+
+# Keyset pagination for the wash list endpoints (?page_size=N, then ?cursor=<next>)
+# LEGACY_UNPAGINATED keeps the old plain-list response for requests without those params
+WASH_PAGINATION = {
+    'PAGE_SIZE': 50,
+    'MAX_PAGE_SIZE': 500,
+    'LEGACY_UNPAGINATED': True,
+}
+
+# Batch endpoints (appointments_*/create/batch)
+WASH_BATCH = {
+    'MAX_ITEMS': 100,
+}
+
+# Admin leaderboard (wash.views.get_leaderboard), refreshed by `manage.py refresh_leaderboard --interval N`
+WASH_LEADERBOARD = {
+    'DEFAULT_LIMIT': 10,
+    'MAX_LIMIT': 100,
+}
+
+# "Pending near me" search (appointments_domicile/pending/near)
+WASH_NEARBY = {
+    'DEFAULT_RADIUS_KM': 10,
+    'MAX_RADIUS_KM': 50,
+    'DEFAULT_LIMIT': 20,
+    'MAX_LIMIT': 100,
+}
+
+# Visiting order of an employee's In Progress appointments (extern_employee/appointments/route/, wash/routing.py)
+WASH_ROUTE = {
+    'SPEED_KMH': 30,
+    'SERVICE_MINUTES': 30,
+    'LATE_KM_PER_MINUTE': 1.0,  # penalty of 1 minute late, in km of extra driving
+    'MAX_TWO_OPT_STOPS': 40,
+    'CACHE_ENTRIES': 1024,  # plans kept in process, one per employee
+}
+
+# Pending appointments SSE stream (wash/events.py): lifetime of the ?ticket= used to open it
+WASH_EVENTS = {
+    'TICKET_MAX_AGE': 30,  # seconds
+}
+
+# In-process cache of authenticated users (wash.authoo.identity_cache)
+WASH_AUTH_CACHE = {
+    'MAX_ENTRIES': 4096,
+    'TTL': 300,  # seconds
+}
+
+# Password hashing pool used by the async login views (wash/hashing.py)
+WASH_HASHING = {
+    'WORKERS': None,  # None = min(4, number of CPUs)
+    'MAX_PENDING': 32,  # running + queued hashes before answering 503
 }
 
 SIMPLE_JWT = {
@@ -201,3 +325,8 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
+
+# The replica pin (wash.routers.ReplicaPinMiddleware) travels in a header the
+# frontend reads and echoes back: the dev server is cross-origin and sends no cookies
+CORS_EXPOSE_HEADERS = ['X-Wash-Primary-Until']
+CORS_ALLOW_HEADERS = (*default_headers, 'x-wash-primary-until')
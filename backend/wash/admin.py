@@ -9,5 +9,8 @@ admin.site.register(AppointmentLocation)
 admin.site.register(ExternEmployeeHistory)
 admin.site.register(InternEmployeeHistory)
 admin.site.register(Feedback)
+admin.site.register(AppointmentDailyStat)
+admin.site.register(FeedbackCounter)
+admin.site.register(LeaderboardEntry)
 
 admin.site.register(Admin)
\ No newline at end of file
@@ -0,0 +1,263 @@
+import asyncio
+import json
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated, PermissionDenied
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import conditional
+from .auth_serializers import ClientLoginSerializer, AdminLoginSerializer
+from .auth_views import build_token_data
+from .authoo import aauthenticate_raw_token, authenticate_stream_ticket
+from .events import pending_feed, format_sse, OVERFLOW
+from .hashing import HashingPoolSaturated, acheck_password
+from .models import AppointmentDomicile, AppointmentLocation, Client, Admin, ExternEmployee, Feedback
+from .pagination import apaginated_response, json_response, CREATED_AT_ORDERING
+from .projections import (
+    AppointmentDomicileWithClientProjection,
+    AppointmentLocationWithClientProjection,
+    project_domicile,
+    project_location,
+)
+from .routers import replica_reads
+from .serializers import AppointmentDomicileSerializer, FeedbackSerializer
+
+# تعليق دوري يبقي الاتصال مفتوحًا عبر الوكلاء
+KEEPALIVE_SECONDS = 15
+
+
+def error_response(exc):
+    """An APIException rendered like DRF's exception handler does"""
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = json_response(data, status=exc.status_code)
+    if isinstance(exc, (AuthenticationFailed, NotAuthenticated)):
+        response['WWW-Authenticate'] = JWTAuthentication().authenticate_header(None)
+    return response
+
+
+async def authenticate_request(request, stream_ticket=False):
+    """
+    Read the JWT from the Authorization header, or (stream_ticket=True) a stream
+    ticket from ?ticket= for EventSource clients that can't set headers.
+    The user is loaded like CustomJWTAuthentication does. Returns (user, error_response).
+    """
+    header = request.headers.get('Authorization', '')
+    try:
+        if header.startswith('Bearer '):
+            return await aauthenticate_raw_token(header[len('Bearer '):]), None
+        if stream_ticket and request.GET.get('ticket'):
+            return authenticate_stream_ticket(request.GET['ticket']), None
+    except AuthenticationFailed as exc:
+        # InvalidToken is an AuthenticationFailed
+        return None, error_response(exc)
+    return None, error_response(NotAuthenticated())
+
+
+async def authorize_request(request, *user_types, stream_ticket=False):
+    """authenticate_request plus a role check, like IsAuthenticated + IsXxx in DRF"""
+    user, error = await authenticate_request(request, stream_ticket=stream_ticket)
+    if error:
+        return None, error
+    if user_types and user.user_type not in user_types:
+        return None, error_response(PermissionDenied())
+    return user, None
+
+
+# The hot read endpoints, as async views answering like DRF views would (same
+# authentication, errors and pagination). Under ASGI (car_wash2/asgi.py) a request
+# waiting on the database doesn't hold a thread; under WSGI they still work. The
+# lists read the replica when one is configured (wash/routers.py).
+
+@require_GET
+@replica_reads
+async def get_pending_appointments(request):
+    """
+    Extern employees: all 'Pending' domicile appointments
+    """
+    user, error = await authorize_request(request, 'extern_employee')
+    if error:
+        return error
+    appointments = AppointmentDomicile.objects.filter(status='Pending')
+    return await apaginated_response(
+        request, appointments, AppointmentDomicileSerializer, cache_policy=conditional.PRIVATE_LIST
+    )
+
+
+@require_GET
+@replica_reads
+async def get_appointments_domicile(request):
+    """
+    Domicile appointments of the caller (extern employee or client), with client info
+    """
+    user, error = await authorize_request(request)
+    if error:
+        return error
+    if user.user_type == 'extern_employee':
+        appointments = AppointmentDomicile.objects.filter(extern_employee=user.id)
+    elif user.user_type == 'client':
+        appointments = AppointmentDomicile.objects.filter(client=user.id)
+    else:
+        appointments = AppointmentDomicile.objects.all()
+    return await apaginated_response(
+        request, project_domicile(appointments), AppointmentDomicileWithClientProjection,
+        cache_policy=conditional.PRIVATE_LIST_WITH_CLIENT,
+    )
+
+
+@require_GET
+@replica_reads
+async def get_appointments_location(request):
+    """
+    Location appointments of the caller (clients see their own), with client info
+    """
+    user, error = await authorize_request(request)
+    if error:
+        return error
+    if user.user_type == 'client':
+        appointments = AppointmentLocation.objects.filter(client=user.id)
+    else:
+        appointments = AppointmentLocation.objects.all()
+    return await apaginated_response(
+        request, project_location(appointments), AppointmentLocationWithClientProjection,
+        cache_policy=conditional.PRIVATE_LIST_WITH_CLIENT,
+    )
+
+
+@require_GET
+async def get_extern_employee_public_details(request, employee_id):
+    """
+    Clients: public details (full_name, phone, final_rating, rating_count) of an extern employee
+    """
+    # Another user's data: the account is loaded, so a deleted client is refused at once
+    user, error = await authorize_request(request, 'client')
+    if error:
+        return error
+    try:
+        extern_employee = await ExternEmployee.objects.only(
+            'full_name', 'phone', 'final_rating', 'rating_count'
+        ).aget(id=employee_id)
+    except ExternEmployee.DoesNotExist:
+        return json_response({"error": "الموظف غير موجود"}, status=404)
+
+    return json_response({
+        "full_name": extern_employee.full_name,
+        "phone": extern_employee.phone,
+        "final_rating": extern_employee.final_rating,
+        "rating_count": extern_employee.rating_count,
+    })
+
+
+@require_GET
+@replica_reads
+async def get_client_feedbacks(request):
+    """
+    Approved feedback from everyone (public)
+    """
+    feedbacks = Feedback.objects.filter(approved=True)
+    return await apaginated_response(
+        request, feedbacks, FeedbackSerializer, ordering=CREATED_AT_ORDERING, cache_policy=conditional.PUBLIC_LIST
+    )
+
+
+async def pending_appointments_stream(request):
+    """
+    Server-Sent Events feed for extern employees: sends the current pending
+    appointments once ("snapshot"), then "created", "claimed" and "cancelled" deltas.
+    EventSource clients authenticate with ?ticket= from appointments_domicile/stream/ticket.
+    Needs an ASGI server (car_wash2/asgi.py) running a single worker (see wash/events.py).
+    """
+    if not isinstance(request, ASGIRequest):
+        return json_response({"error": "This endpoint needs the ASGI application"}, status=501)
+
+    user, error = await authorize_request(request, 'extern_employee', stream_ticket=True)
+    if error:
+        return error
+
+    # Subscribe before reading the snapshot so no change is missed in between
+    queue = pending_feed.subscribe()
+    try:
+        pending = [
+            appointment
+            async for appointment in AppointmentDomicile.objects.filter(status='Pending').order_by('id')
+        ]
+    except BaseException:
+        pending_feed.unsubscribe(queue)
+        raise
+    snapshot = AppointmentDomicileSerializer(pending, many=True).data
+
+    async def stream():
+        try:
+            yield format_sse(0, 'snapshot', json.dumps(snapshot, ensure_ascii=False, default=str))
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is OVERFLOW:
+                    yield "event: reset\ndata: {}\n\n"
+                    return
+                yield format_sse(*event)
+        finally:
+            pending_feed.unsubscribe(queue)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+    return request.POST
+
+
+async def _async_login(request, model, user_type, serializer_class):
+    """
+    Same contract as the DRF login views, but the PBKDF2 check runs in the
+    bounded hashing pool (wash/hashing.py) so the event loop keeps serving
+    other requests. When the pool is full the caller gets a 503 immediately.
+    """
+    data = _request_data(request)
+    if data is None:
+        return json_response({"error": "JSON غير صالح"}, status=400)
+    serializer = serializer_class(data=data)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status=400)
+
+    try:
+        user = await model.objects.aget(email=serializer.validated_data['email'])
+    except model.DoesNotExist:
+        return json_response({"error": "البريد الإلكتروني غير موجود"}, status=404)
+
+    try:
+        valid = await acheck_password(serializer.validated_data['password'], user.password)
+    except HashingPoolSaturated as exc:
+        response = json_response({"detail": str(exc.detail)}, status=exc.status_code)
+        response['Retry-After'] = str(exc.wait)
+        return response
+
+    if not valid:
+        return json_response({"error": "كلمة المرور غير صحيحة"}, status=401)
+    return json_response(build_token_data(user, user_type), status=200)
+
+
+@csrf_exempt
+@require_POST
+async def async_client_login(request):
+    return await _async_login(request, Client, 'client', ClientLoginSerializer)
+
+
+@csrf_exempt
+@require_POST
+async def async_admin_login(request):
+    return await _async_login(request, Admin, 'admin', AdminLoginSerializer)
+
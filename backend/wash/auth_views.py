@@ -5,6 +5,24 @@ from .models import Client, ExternEmployee, InternEmployee, Admin
 from .auth_serializers import ClientLoginSerializer, ExternEmployeeLoginSerializer, InternEmployeeLoginSerializer, AdminLoginSerializer, TokenSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
 
+
+def build_token_data(user, user_type):
+    """
+    Access/refresh pair returned by the login endpoints
+    """
+    refresh = RefreshToken()
+    refresh['user_id'] = user.id
+    refresh['user_type'] = user_type
+    refresh['full_name'] = user.full_name
+
+    return {
+        'access': str(refresh.access_token),
+        'refresh': str(refresh),
+        'user_type': user_type,
+        'user_id': user.id,
+        'full_name': user.full_name
+    }
+
 # Replace the client_login function with:
 @api_view(['POST'])
 def client_login(request):
@@ -18,18 +36,7 @@ def client_login(request):
             
             if client.check_password(password):  # Use the check_password method
                 # Generate token
-                refresh = RefreshToken()
-                refresh['user_id'] = client.id
-                refresh['user_type'] = 'client'
-                refresh['full_name'] = client.full_name
-                
-                token_data = {
-                    'access': str(refresh.access_token),
-                    'refresh': str(refresh),
-                    'user_type': 'client',
-                    'user_id': client.id,
-                    'full_name': client.full_name
-                }
+                token_data = build_token_data(client, 'client')
                 
                 token_serializer = TokenSerializer(data=token_data)
                 token_serializer.is_valid()
@@ -54,18 +61,7 @@ def extern_employee_login(request):
             
             if employee.password == password:
                 # Generate token
-                refresh = RefreshToken()
-                refresh['user_id'] = employee.id
-                refresh['user_type'] = 'extern_employee'
-                refresh['full_name'] = employee.full_name
-                
-                token_data = {
-                    'access': str(refresh.access_token),
-                    'refresh': str(refresh),
-                    'user_type': 'extern_employee',
-                    'user_id': employee.id,
-                    'full_name': employee.full_name
-                }
+                token_data = build_token_data(employee, 'extern_employee')
                 
                 token_serializer = TokenSerializer(data=token_data)
                 token_serializer.is_valid()
@@ -90,18 +86,7 @@ def intern_employee_login(request):
             
             if employee.password == password:
                 # Generate token
-                refresh = RefreshToken()
-                refresh['user_id'] = employee.id
-                refresh['user_type'] = 'intern_employee'
-                refresh['full_name'] = employee.full_name
-                
-                token_data = {
-                    'access': str(refresh.access_token),
-                    'refresh': str(refresh),
-                    'user_type': 'intern_employee',
-                    'user_id': employee.id,
-                    'full_name': employee.full_name
-                }
+                token_data = build_token_data(employee, 'intern_employee')
                 
                 token_serializer = TokenSerializer(data=token_data)
                 token_serializer.is_valid()
@@ -170,18 +155,7 @@ def admin_login(request):
             
             if admin.check_password(password):
                 # Generate token
-                refresh = RefreshToken()
-                refresh['user_id'] = admin.id
-                refresh['user_type'] = 'admin'
-                refresh['full_name'] = admin.full_name
-                
-                token_data = {
-                    'access': str(refresh.access_token),
-                    'refresh': str(refresh),
-                    'user_type': 'admin',
-                    'user_id': admin.id,
-                    'full_name': admin.full_name
-                }
+                token_data = build_token_data(admin, 'admin')
                 
                 token_serializer = TokenSerializer(data=token_data)
                 token_serializer.is_valid()
@@ -1,64 +1,224 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.db import DEFAULT_DB_ALIAS
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.exceptions import AuthenticationFailed
 from .models import Client, ExternEmployee, InternEmployee, Admin
 from rest_framework_simplejwt.tokens import AccessToken
 
+USER_MODELS = {
+    'client': Client,
+    'extern_employee': ExternEmployee,
+    'intern_employee': InternEmployee,
+    'admin': Admin,
+}
+
+
+class IdentityCache:
+    """
+    Bounded LRU cache of resolved users keyed by (user_type, user_id), with a TTL.
+    Entries are dropped on model save/delete (see wash/signals.py); the TTL covers
+    changes made by other processes.
+    """
+    def __init__(self, max_entries=4096, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # Each request gets its own copy so attribute changes don't leak between requests
+        return copy.copy(user)
+
+    def set(self, key, user):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (copy.copy(user), time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_type, pk):
+        """
+        Drop every entry resolving to this user, including entries keyed by another
+        id (Google clients whose token user_id is not the Client id).
+        """
+        with self._lock:
+            stale = [
+                key for key, (user, _) in self._entries.items()
+                if key[0] == user_type and (key[1] == pk or user.pk == pk)
+            ]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache_settings = getattr(settings, 'WASH_AUTH_CACHE', {})
+identity_cache = IdentityCache(
+    max_entries=_cache_settings.get('MAX_ENTRIES', 4096),
+    ttl=_cache_settings.get('TTL', 300),
+)
+
+
+def _mark_authenticated(user, user_type):
+    # Add user_type attribute to user object
+    user.user_type = user_type
+
+    # Add authentication related attributes
+    user.is_authenticated = True
+    user.is_active = True
+    return user
+
+
 class CustomJWTAuthentication(JWTAuthentication):
     def get_user(self, validated_token):
         """
         Return user based on the token claims
         """
+        user_id, user_type = self.get_identity(validated_token)
+        cache_key = (user_type, user_id)
+        user = identity_cache.get(cache_key)
+        if user is not None:
+            return user
+
+        user = self.load_user(validated_token, user_id, user_type)
+        identity_cache.set(cache_key, user)
+        return user
+
+    async def aget_user(self, validated_token):
+        """get_user for async views: only a cache miss leaves the event loop"""
+        user_id, user_type = self.get_identity(validated_token)
+        cache_key = (user_type, user_id)
+        user = identity_cache.get(cache_key)
+        if user is not None:
+            return user
+
+        user = await sync_to_async(self.load_user)(validated_token, user_id, user_type)
+        identity_cache.set(cache_key, user)
+        return user
+
+    def get_identity(self, validated_token):
         user_id = validated_token.get('user_id')
         user_type = validated_token.get('user_type')
-        
+
         if not user_id or not user_type:
             raise AuthenticationFailed('Token contains no valid user identification')
-        
+
+        if user_type not in USER_MODELS:
+            raise AuthenticationFailed('Invalid user type')
+        return user_id, user_type
+
+    def load_user(self, validated_token, user_id, user_type):
+        # Accounts are read from the primary even in replica_reads views, so a
+        # deleted account is rejected at once and a new one is found at once
         # First try to get user by ID - this is the most reliable method
         try:
-            if user_type == 'client':
-                user = Client.objects.get(id=user_id)
-            elif user_type == 'extern_employee':
-                user = ExternEmployee.objects.get(id=user_id)
-            elif user_type == 'intern_employee':
-                user = InternEmployee.objects.get(id=user_id)
-            elif user_type == 'admin':
-                user = Admin.objects.get(id=user_id)
-            else:
-                raise AuthenticationFailed('Invalid user type')
-            
-            # Add user_type attribute to user object
-            user.user_type = user_type
-            
-            # Add authentication related attributes
-            user.is_authenticated = True
-            user.is_active = True
-            
-            return user
-        except (Client.DoesNotExist, ExternEmployee.DoesNotExist, InternEmployee.DoesNotExist, Admin.DoesNotExist):
+            user = USER_MODELS[user_type].objects.using(DEFAULT_DB_ALIAS).get(id=user_id)
+            return _mark_authenticated(user, user_type)
+        except USER_MODELS[user_type].DoesNotExist:
             # If user not found by ID, it might be a Google Auth situation where user_id might not match
             # Only for Client user_type, try using email as fallback (if available)
             if user_type == 'client':
                 email = validated_token.get('email')
                 if email:
                     try:
-                        user = Client.objects.get(email=email)
-                        
-                        # Add user_type attribute to user object
-                        user.user_type = user_type
-                        
-                        # Add authentication related attributes
-                        user.is_authenticated = True
-                        user.is_active = True
-                        
-                        return user
+                        user = Client.objects.using(DEFAULT_DB_ALIAS).get(email=email)
+                        return _mark_authenticated(user, user_type)
                     except Client.DoesNotExist:
                         pass
-                    
-            raise AuthenticationFailed('User not found')    
-from rest_framework_simplejwt.tokens import AccessToken
 
-def decode_token(token):
-    access_token = AccessToken(token)
-    print("User ID:", access_token['user_id'])
-    print("User Type:", access_token['user_type'])
\ No newline at end of file
+            raise AuthenticationFailed('User not found')
+
+
+class ClaimsPrincipal:
+    """
+    Lightweight user built only from the token claims (no database access).
+    Only id, user_type and the optional email/full_name claims are available.
+    """
+    is_authenticated = True
+    is_active = True
+
+    def __init__(self, user_id, user_type, email=None, full_name=None):
+        self.id = self.pk = user_id
+        self.user_type = user_type
+        self.email = email
+        self.full_name = full_name
+
+    def __str__(self):
+        return f"{self.user_type}:{self.id}"
+
+
+class ClaimsJWTAuthentication(CustomJWTAuthentication):
+    """
+    "Claims-only" mode for endpoints that only need the caller's id and role.
+    A deleted account keeps access until its token expires (ACCESS_TOKEN_LIFETIME),
+    so only use it for low-sensitivity reads of the caller's own data (role
+    checks, an employee's own appointments). Endpoints that write, or that
+    return other users' data (admin lists, stats, feedback), use
+    CustomJWTAuthentication: its cache is dropped when the account is deleted.
+    """
+    def get_user(self, validated_token):
+        user_id, user_type = self.get_identity(validated_token)
+
+        # Google clients carry their Client id in a separate claim
+        if user_type == 'client' and validated_token.get('client_id'):
+            user_id = validated_token['client_id']
+
+        return ClaimsPrincipal(
+            user_id,
+            user_type,
+            email=validated_token.get('email'),
+            full_name=validated_token.get('full_name'),
+        )
+
+
+async def aauthenticate_raw_token(raw_token):
+    """
+    Authentication for plain (async) Django views that don't go through DRF:
+    the account is loaded (through identity_cache) like CustomJWTAuthentication
+    does. Raises InvalidToken / AuthenticationFailed like DRF would.
+    """
+    authentication = CustomJWTAuthentication()
+    return await authentication.aget_user(authentication.get_validated_token(raw_token))
+
+
+# EventSource can't send an Authorization header, and a JWT in the query string
+# ends up in the proxy/server access logs: the stream takes a short-lived ticket
+# that is only valid for it instead.
+STREAM_TICKET_SALT = 'wash.pending-stream-ticket'
+
+
+def get_stream_ticket_max_age():
+    return getattr(settings, 'WASH_EVENTS', {}).get('TICKET_MAX_AGE', 30)
+
+
+def issue_stream_ticket(user):
+    return signing.dumps({'user_id': user.id, 'user_type': user.user_type}, salt=STREAM_TICKET_SALT)
+
+
+def authenticate_stream_ticket(ticket):
+    """ClaimsPrincipal of a ticket from issue_stream_ticket; AuthenticationFailed when invalid or expired"""
+    try:
+        claims = signing.loads(ticket, salt=STREAM_TICKET_SALT, max_age=get_stream_ticket_max_age())
+    except signing.BadSignature:
+        raise AuthenticationFailed('Stream ticket is invalid or expired')
+    return ClaimsPrincipal(claims['user_id'], claims['user_type'])
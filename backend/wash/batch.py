@@ -0,0 +1,163 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import events
+from .models import AppointmentDomicile, AppointmentDailyStat
+
+
+def get_batch_settings():
+    defaults = {
+        'MAX_ITEMS': 100,
+    }
+    defaults.update(getattr(settings, 'WASH_BATCH', {}))
+    return defaults
+
+
+def get_batch_items(data, key):
+    """
+    The list of items of a batch request: either the body itself or body[key].
+    Returns (items, error_response).
+    """
+    items = data.get(key) if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return None, Response(
+            {"error": f"يجب إرسال قائمة غير فارغة ({key})"}, status=status.HTTP_400_BAD_REQUEST
+        )
+    max_items = get_batch_settings()['MAX_ITEMS']
+    if len(items) > max_items:
+        return None, Response(
+            {"error": f"الحد الأقصى هو {max_items} عنصرًا في الطلب الواحد"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return items, None
+
+
+def batch_status(results, success=status.HTTP_201_CREATED):
+    """success when every item succeeded, 400 when none did, 207 (multi-status) otherwise"""
+    succeeded = sum(1 for result in results if result['status'] < 400)
+    if succeeded == len(results):
+        return success
+    if succeeded == 0:
+        return status.HTTP_400_BAD_REQUEST
+    return status.HTTP_207_MULTI_STATUS
+
+
+def batch_create(request, create_serializer_class, output_serializer_class, channel):
+    """
+    Validate every item of the body with create_serializer_class, insert the valid
+    ones for the current client with a single bulk_create, and answer with one
+    result per item (in the request order).
+    bulk_create doesn't call save() nor send post_save, so the daily stats and
+    the pending feed are updated here.
+    """
+    items, error = get_batch_items(request.data, 'appointments')
+    if error:
+        return error
+
+    model = create_serializer_class.Meta.model
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        serializer = create_serializer_class(data=item, context={'request': request})
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results[index] = {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': serializer.errors}
+
+    if valid:
+        appointments = [
+            model(client_id=request.user.id, status='Pending', **validated_data) for _, validated_data in valid
+        ]
+        if model is AppointmentDomicile:
+            for appointment in appointments:
+                appointment.update_grid_cell()
+        with transaction.atomic():
+            model.objects.bulk_create(appointments)
+            buckets = Counter(appointment.stats_bucket() for appointment in appointments)
+            for bucket, count in buckets.items():
+                AppointmentDailyStat.add_to_bucket(channel, bucket, count)
+            if model is AppointmentDomicile:
+                for appointment in appointments:
+                    events.appointment_created(appointment)
+
+        for (index, _), appointment in zip(valid, appointments):
+            results[index] = {
+                'index': index,
+                'status': status.HTTP_201_CREATED,
+                'appointment': output_serializer_class(appointment).data,
+            }
+
+    return Response({'results': results}, status=batch_status(results))
+
+
+def bulk_transition(request, scope, channel, history=None, assign=None):
+    """
+    Move the appointments {"ids": [...]} to {"status": ...} in one UPDATE.
+    scope: the appointments the caller may change; ids outside it (or missing)
+    get a 404 result without telling which. history: the employee history model
+    to record the appointments moving to Completed in (and drop those leaving
+    it from). assign: {fk name: id} set by the same UPDATE on the rows where
+    that foreign key is still empty.
+    update() bypasses save(), so the daily stats, history and pending feed are kept here.
+    """
+    model = scope.model
+    target = request.data.get('status') if isinstance(request.data, dict) else None
+    if target not in dict(model.STATUS_CHOICES):
+        return Response({"error": "حالة غير صالحة"}, status=status.HTTP_400_BAD_REQUEST)
+    ids, error = get_batch_items(request.data, 'ids')
+    if error:
+        return error
+    if not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+        return Response({"error": "معرفات غير صالحة"}, status=status.HTTP_400_BAD_REQUEST)
+
+    with transaction.atomic():
+        # Permission check and read of the current state in one query
+        appointments = {appointment.id: appointment for appointment in scope.filter(id__in=ids)}
+        changed = [a for a in appointments.values() if a.status != target]
+        if changed:
+            assign = assign or {}
+            model.objects.filter(id__in=[a.id for a in changed]).update(
+                status=target,
+                updated_at=timezone.now(),
+                **{name: Coalesce(F(name), Value(value)) for name, value in assign.items()},
+            )
+
+            deltas = Counter()
+            for appointment in changed:
+                for name, value in assign.items():
+                    if getattr(appointment, f'{name}_id') is None:
+                        setattr(appointment, f'{name}_id', value)
+                deltas[appointment.loaded_stats_bucket()] -= 1
+                appointment.status = target
+                deltas[appointment.stats_bucket()] += 1
+            for bucket, count in deltas.items():
+                if bucket is not None and count:
+                    AppointmentDailyStat.add_to_bucket(channel, bucket, count)
+
+            if history is not None and target == 'Completed':
+                history.record_completed([(a, getattr(a, f'{history.employee_field}_id')) for a in changed])
+            elif history is not None:
+                history.record_uncompleted([a.id for a in changed if a._loaded_status == 'Completed'])
+
+            if model is AppointmentDomicile:
+                for appointment in changed:
+                    events.pending_status_changed(appointment, appointment._loaded_status)
+                    appointment._loaded_status = target
+
+    results = []
+    for pk in dict.fromkeys(ids):
+        if pk in appointments:
+            results.append({'id': pk, 'status': status.HTTP_200_OK})
+        else:
+            results.append({'id': pk, 'status': status.HTTP_404_NOT_FOUND, 'error': "الموعد غير موجود"})
+    return Response(
+        {'status': target, 'updated': len(changed), 'results': results},
+        status=batch_status(results, success=status.HTTP_200_OK),
+    )
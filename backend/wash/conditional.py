@@ -0,0 +1,140 @@
+import functools
+import hashlib
+from collections import namedtuple
+
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+# Bump when the serialized form of the endpoints changes, so old ETags stop matching
+REPRESENTATION_VERSION = '2'
+
+# cache_control: kwargs for patch_cache_control
+# timestamps: fields whose Max() changes when the response body changes
+# last_modified: also send Last-Modified (only safe for single objects: for a
+#   list a deleted row doesn't move the max, the ETag covers it through the count)
+CachePolicy = namedtuple('CachePolicy', ['cache_control', 'timestamps', 'last_modified'])
+
+# User specific data: the browser keeps it but revalidates on every use
+PRIVATE_DETAIL = CachePolicy({'private': True, 'no_cache': True}, ('updated_at',), True)
+PRIVATE_LIST = CachePolicy({'private': True, 'no_cache': True}, ('updated_at',), False)
+# Lists that embed client_info: a profile change must change the ETag too
+PRIVATE_LIST_WITH_CLIENT = CachePolicy(
+    {'private': True, 'no_cache': True}, ('updated_at', 'client__updated_at'), False
+)
+# Public data that can be a minute old
+PUBLIC_LIST = CachePolicy({'public': True, 'max_age': 60}, ('updated_at',), False)
+
+Validators = namedtuple('Validators', ['etag', 'last_modified'])
+
+
+def _aggregates(policy):
+    aggregates = {f'_max_{i}': Max(field) for i, field in enumerate(policy.timestamps)}
+    aggregates['_count'] = Count('pk')
+    return aggregates
+
+
+def _query_key(queryset):
+    try:
+        return str(queryset.query)
+    except EmptyResultSet:
+        return ''
+
+
+def _page_values(rows, policy):
+    """
+    The aggregate values of one page from its (pk, *timestamps) rows, plus the
+    ids: a row deleted from the page lets the next one in without moving the
+    count or the max timestamps.
+    """
+    values = {'_count': len(rows), '_ids': ','.join(str(row[0]) for row in rows)}
+    for i in range(len(policy.timestamps)):
+        values[f'_max_{i}'] = max((row[i + 1] for row in rows if row[i + 1] is not None), default=None)
+    return values
+
+
+def _build_validators(request, queryset, policy, values):
+    stamps = [values[f'_max_{i}'] for i in range(len(policy.timestamps))]
+    # The SQL carries the filters (e.g. the caller's id), the path the page/cursor
+    source = '|'.join([
+        REPRESENTATION_VERSION,
+        request.get_full_path(),
+        request.headers.get('Accept', ''),
+        _query_key(queryset),
+        str(values['_count']),
+        values.get('_ids', ''),
+    ] + [stamp.isoformat() if stamp else '' for stamp in stamps])
+    etag = '"%s"' % hashlib.md5(source.encode(), usedforsecurity=False).hexdigest()
+
+    last_modified = None
+    if policy.last_modified:
+        latest = max((stamp for stamp in stamps if stamp), default=None)
+        last_modified = int(latest.timestamp()) if latest else None
+    return Validators(etag, last_modified)
+
+
+def get_validators(request, queryset, policy):
+    """
+    One query instead of building the body: max timestamps + count over the
+    queryset, or for a sliced queryset (one page, see pagination.py) the ids and
+    timestamps of its rows only, so changes on other pages keep its ETag.
+    """
+    if queryset.query.is_sliced:
+        values = _page_values(list(queryset.values_list('pk', *policy.timestamps)), policy)
+    else:
+        values = queryset.order_by().aggregate(**_aggregates(policy))
+    return _build_validators(request, queryset, policy, values)
+
+
+async def aget_validators(request, queryset, policy):
+    if queryset.query.is_sliced:
+        values = _page_values([row async for row in queryset.values_list('pk', *policy.timestamps)], policy)
+    else:
+        values = await queryset.order_by().aaggregate(**_aggregates(policy))
+    return _build_validators(request, queryset, policy, values)
+
+
+def add_headers(response, validators, policy):
+    if validators.etag and not response.has_header('ETag'):
+        response['ETag'] = validators.etag
+    if validators.last_modified is not None and not response.has_header('Last-Modified'):
+        response['Last-Modified'] = http_date(validators.last_modified)
+    patch_cache_control(response, **policy.cache_control)
+    patch_vary_headers(response, ('Authorization', 'Accept'))
+    return response
+
+
+def not_modified(request, validators, policy):
+    """The 304 response when the client's copy is still valid, else None"""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    response = get_conditional_response(
+        request, etag=validators.etag, last_modified=validators.last_modified
+    )
+    if response is None or response.status_code != 304:
+        return None
+    return add_headers(response, validators, policy)
+
+
+def conditional(queryset_for, policy):
+    """
+    For DRF views: answer GET/HEAD with 304 before running the view when the
+    validators of queryset_for(request, *args, **kwargs) match the request.
+    Put it under @permission_classes so authentication runs first.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            validators = get_validators(request, queryset_for(request, *args, **kwargs), policy)
+            response = not_modified(request, validators, policy)
+            if response is not None:
+                return response
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                add_headers(response, validators, policy)
+            return response
+        return wrapper
+    return decorator
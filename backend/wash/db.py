@@ -0,0 +1,77 @@
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection as default_connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# (setting key, pragma) stored in the database file itself: applied once per file
+# and process, not on each connection
+DATABASE_PRAGMAS = (
+    ('JOURNAL_MODE', 'journal_mode'),
+)
+# (setting key, pragma) applied to every new SQLite connection
+CONNECTION_PRAGMAS = (
+    ('SYNCHRONOUS', 'synchronous'),
+    ('CACHE_SIZE', 'cache_size'),
+    ('MMAP_SIZE', 'mmap_size'),
+    ('BUSY_TIMEOUT', 'busy_timeout'),
+)
+_configured_databases = set()
+
+
+def _apply(cursor, pragmas, keys):
+    for key, pragma in keys:
+        value = pragmas.get(key)
+        if value is not None:
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Apply settings.WASH_SQLITE to each new SQLite connection. Under ASGI every
+    request opens a connection (CONN_MAX_AGE=0), so only the cheap
+    per-connection pragmas run each time; journal_mode=WAL needs a lock on the
+    file and persists in it, so it is set on the first connection only.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'WASH_SQLITE', {})
+    with connection.cursor() as cursor:
+        database = connection.settings_dict['NAME']
+        if database not in _configured_databases:
+            _apply(cursor, pragmas, DATABASE_PRAGMAS)
+            _configured_databases.add(database)
+        _apply(cursor, pragmas, CONNECTION_PRAGMAS)
+
+
+def is_lock_error(error):
+    message = str(error).lower()
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+def retry_on_lock(view):
+    """
+    Re-run a write view when SQLite reports lock contention, with exponential
+    backoff and jitter (settings.WASH_DB_RETRY). Only retries when the failure
+    happened outside an enclosing transaction, so a retry always starts clean.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        options = getattr(settings, 'WASH_DB_RETRY', {})
+        attempts = options.get('ATTEMPTS', 5)
+        delay = options.get('BASE_DELAY', 0.05)
+        max_delay = options.get('MAX_DELAY', 1.0)
+
+        for attempt in range(1, attempts + 1):
+            try:
+                return view(*args, **kwargs)
+            except OperationalError as e:
+                if attempt == attempts or not is_lock_error(e) or default_connection.in_atomic_block:
+                    raise
+            time.sleep(random.uniform(0, min(max_delay, delay * 2 ** (attempt - 1))))
+
+    return wrapper
@@ -0,0 +1,100 @@
+import asyncio
+import itertools
+import json
+import threading
+
+from django.db import transaction
+
+
+# حدث خاص يُرسل للمشترك البطيء ليعيد الاتصال ويأخذ لقطة جديدة
+OVERFLOW = object()
+
+
+class PendingAppointmentsFeed:
+    """
+    In-process fan-out of changes to the set of pending domicile appointments.
+    Every change is serialized once and the same payload is pushed to all
+    connected SSE streams, so the cost doesn't grow with the number of employees.
+    Subscribers live in this process only: each ASGI worker has its own feed
+    and only sees the changes made by the requests it served itself. The
+    stream therefore requires a single worker (the Dockerfile runs uvicorn
+    without --workers); scaling out needs a shared channel (e.g. Redis pub/sub).
+    """
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def subscribe(self):
+        """Must be called from the event loop that will read the queue."""
+        queue = asyncio.Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def publish(self, kind, data):
+        """Thread-safe: can be called from sync views running in worker threads."""
+        event = (next(self._ids), kind, json.dumps(data, ensure_ascii=False, default=str))
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+            except RuntimeError:
+                # The loop of this stream is closed
+                self.unsubscribe(queue)
+
+    def _deliver(self, queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too slow to keep up: tell it to reconnect instead of buffering without limit
+            self.unsubscribe(queue)
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(OVERFLOW)
+
+
+pending_feed = PendingAppointmentsFeed()
+
+
+def _publish_on_commit(kind, build_data):
+    if not pending_feed.has_subscribers():
+        return
+    transaction.on_commit(lambda: pending_feed.publish(kind, build_data()))
+
+
+def appointment_created(appointment):
+    from .serializers import AppointmentDomicileSerializer
+    _publish_on_commit('created', lambda: AppointmentDomicileSerializer(appointment).data)
+
+
+def appointment_claimed(appointment_id, extern_employee_id):
+    _publish_on_commit('claimed', lambda: {'id': appointment_id, 'extern_employee': extern_employee_id})
+
+
+def appointment_cancelled(appointment_id):
+    _publish_on_commit('cancelled', lambda: {'id': appointment_id})
+
+
+def pending_status_changed(appointment, previous_status):
+    """Translate a status transition into a feed event (if it touches the pending set)."""
+    if appointment.status == 'Pending' and previous_status != 'Pending':
+        appointment_created(appointment)
+    elif previous_status == 'Pending' and appointment.status != 'Pending':
+        if appointment.status == 'Deleted':
+            appointment_cancelled(appointment.id)
+        else:
+            appointment_claimed(appointment.id, appointment.extern_employee_id)
+
+
+def format_sse(event_id, kind, payload):
+    return f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n"
@@ -0,0 +1,157 @@
+"""
+Grid index for the coordinates of domicile appointments.
+
+The world is cut in GRID_DEGREES x GRID_DEGREES cells numbered row by row, so
+the cells of one row are consecutive integers and a rectangle of cells is one
+BETWEEN range per row on the (partial, pending only) grid_cell index.
+Longitudes don't wrap around the antimeridian.
+"""
+import math
+
+from django.db.models import Q
+
+# ~1.1 km north-south; changing it requires recomputing AppointmentDomicile.grid_cell
+GRID_DEGREES = 0.01
+ROWS = round(180 / GRID_DEGREES)
+COLUMNS = round(360 / GRID_DEGREES)
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+CELL_HEIGHT_KM = GRID_DEGREES * KM_PER_DEGREE
+# SQLite rejects deep OR trees ("Expression tree is too large"): a ring with more
+# ranges than this is read with several queries of at most MAX_RANGES ranges each
+MAX_RANGES = 32
+
+
+def cell_position(latitude, longitude):
+    row = min(int((latitude + 90) / GRID_DEGREES), ROWS - 1)
+    column = min(int((longitude + 180) / GRID_DEGREES), COLUMNS - 1)
+    return row, column
+
+
+def grid_cell(latitude, longitude):
+    """The cell id of a point, None without coordinates"""
+    if latitude is None or longitude is None:
+        return None
+    row, column = cell_position(latitude, longitude)
+    return row * COLUMNS + column
+
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(longitude2 - longitude1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def cell_ranges(row, column, half_rows, half_columns, skip=None):
+    """
+    Sorted (first, last) cell id ranges covering the rectangle of cells within
+    half_rows rows and half_columns columns of (row, column), minus the inner
+    rectangle skip=(half_rows, half_columns). Adjacent ranges are merged.
+    """
+    ranges = []
+
+    def add(first, last):
+        if ranges and ranges[-1][1] + 1 == first:
+            ranges[-1] = (ranges[-1][0], last)
+        else:
+            ranges.append((first, last))
+
+    first_column = max(column - half_columns, 0)
+    last_column = min(column + half_columns, COLUMNS - 1)
+    for r in range(max(row - half_rows, 0), min(row + half_rows, ROWS - 1) + 1):
+        base = r * COLUMNS
+        if skip is None or abs(r - row) > skip[0]:
+            add(base + first_column, base + last_column)
+            continue
+        # A row crossing the inner rectangle: only its left and right parts are new
+        if column - skip[1] - 1 >= first_column:
+            add(base + first_column, base + column - skip[1] - 1)
+        if column + skip[1] + 1 <= last_column:
+            add(base + column + skip[1] + 1, base + last_column)
+    return ranges
+
+
+def row_span_for(radius_km):
+    """Rows on each side of a point's row that the circle of radius_km can reach"""
+    return min(math.ceil(radius_km / CELL_HEIGHT_KM), ROWS)
+
+
+def column_span_for(latitude, radius_km):
+    """
+    Columns on each side of a point's column that the circle of radius_km can
+    reach: its widest longitude difference, asin(sin(r) / cos(latitude)), which
+    is wider than the circle at the point's own latitude. COLUMNS when the circle
+    reaches a pole (every longitude).
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    cos_latitude = math.cos(math.radians(latitude))
+    if angle >= math.pi / 2 or math.sin(angle) >= cos_latitude:
+        return COLUMNS
+    return min(math.ceil(math.degrees(math.asin(math.sin(angle) / cos_latitude)) / GRID_DEGREES), COLUMNS)
+
+
+def covered_km(latitude, half_rows, half_columns):
+    """
+    Lower bound of the distance from a point to anything outside the rectangle
+    of cells around its cell (the point can sit on the cell's edge): half_rows
+    cell heights north-south, and east-west the distance to the meridian
+    half_columns columns away.
+    """
+    longitude_difference = math.radians(min(half_columns * GRID_DEGREES, 90.0))
+    cos_latitude = math.cos(math.radians(latitude))
+    east_west = EARTH_RADIUS_KM * math.asin(min(1.0, cos_latitude * math.sin(longitude_difference)))
+    return min(half_rows * CELL_HEIGHT_KM, east_west)
+
+
+def _in_cells(queryset, ranges, fields, index_condition):
+    """
+    The rows of queryset in the cell ranges, MAX_RANGES ranges per query. Each
+    range repeats the condition of the partial index: SQLite then searches the
+    index once per range (MULTI-INDEX OR) instead of scanning all of it.
+    """
+    for start in range(0, len(ranges), MAX_RANGES):
+        condition = None
+        for first, last in ranges[start:start + MAX_RANGES]:
+            q = Q(grid_cell__range=(first, last)) & index_condition
+            condition = q if condition is None else condition | q
+        yield from queryset.filter(condition).values(*fields)
+
+
+def nearest(queryset, latitude, longitude, radius_km, limit, fields=('id', 'latitude', 'longitude'),
+            index_condition=Q()):
+    """
+    The `limit` rows of queryset nearest to the point and within radius_km, as
+    (distance_km, row) pairs sorted by distance. index_condition is the
+    condition of the partial grid_cell index, which queryset must already
+    filter on (e.g. Q(status='Pending')). Rectangles of cells are
+    searched from the point outwards (doubling each time, as wide east-west as
+    north-south in km, never larger than the circle needs), each new ring with
+    one indexed query per MAX_RANGES cell ranges, and the search stops as soon
+    as the `limit` nearest rows found so far are closer than anything that is
+    still unsearched.
+    """
+    row, column = cell_position(latitude, longitude)
+    max_rows = row_span_for(radius_km)
+    max_columns = column_span_for(latitude, radius_km)
+    # Columns per row for a square in km; cos(±90°) is ~6e-17, not 0
+    columns_per_row = 1 / math.cos(math.radians(latitude))
+    found = []
+    searched = None
+    step = 1
+    while True:
+        half_rows = min(step, max_rows)
+        half_columns = min(math.ceil(step * columns_per_row), max_columns)
+        ranges = cell_ranges(row, column, half_rows, half_columns, searched)
+        # Only the cells of the ring: a row band would read every longitude of its rows
+        for candidate in _in_cells(queryset, ranges, fields, index_condition):
+            distance = haversine_km(latitude, longitude, candidate['latitude'], candidate['longitude'])
+            if distance <= radius_km:
+                found.append((distance, candidate))
+        found.sort(key=lambda item: (item[0], item[1]['id']))
+        if half_rows >= max_rows and half_columns >= max_columns:
+            return found[:limit]
+        if len(found) >= limit and found[limit - 1][0] <= covered_km(latitude, half_rows, half_columns):
+            return found[:limit]
+        searched, step = (half_rows, half_columns), step * 2
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class HashingPoolSaturated(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "الخادم مشغول حاليًا، يرجى المحاولة بعد قليل"
+    default_code = 'hashing_pool_saturated'
+    # DRF turns this into a Retry-After header
+    wait = 1
+
+
+class HashingPool:
+    """
+    Bounded pool of threads for password hashing (PBKDF2).
+    hashlib releases the GIL while hashing, so a few threads use a few cores
+    while the request threads / event loop stay free for the rest of the API.
+    At most `max_pending` jobs (running + queued) are accepted: past that,
+    callers get HashingPoolSaturated right away instead of waiting in line.
+    """
+    def __init__(self, workers=2, max_pending=32):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created on first use so importing this module doesn't start threads
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix='wash-hashing'
+                    )
+        return self._executor
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolSaturated()
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def call(self, fn, *args):
+        """Run fn in the pool and wait for it (sync callers)."""
+        return self.submit(fn, *args).result()
+
+    async def run(self, fn, *args):
+        """Run fn in the pool without blocking the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+
+_pool_settings = getattr(settings, 'WASH_HASHING', {})
+hashing_pool = HashingPool(
+    workers=_pool_settings.get('WORKERS') or min(4, os.cpu_count() or 1),
+    max_pending=_pool_settings.get('MAX_PENDING', 32),
+)
+
+
+def hash_password(raw_password):
+    """
+    make_password through the pool; raises HashingPoolSaturated when it is full.
+    The sync caller (registration) still waits for the result: the pool bounds
+    how many hashes run at once, it doesn't free the request thread.
+    """
+    return hashing_pool.call(make_password, raw_password)
+
+
+async def acheck_password(raw_password, encoded):
+    return await hashing_pool.run(check_password, raw_password, encoded)
@@ -0,0 +1,131 @@
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels; images are only ever scaled down
+VARIANT_SIZES = {
+    'thumb': 128,
+    'medium': 512,
+}
+# extension: (Pillow format, quality)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', 80),
+    'jpg': ('JPEG', 82),
+}
+if not features.check('webp'):
+    del VARIANT_FORMATS['webp']
+
+
+def variant_name(name, size, extension):
+    """
+    clients/photo.png -> clients/variants/photo.png.thumb.webp
+    The whole file name is kept: storage makes it unique, while photo.png and
+    photo.jpg (of two different users) share a stem.
+    """
+    directory, filename = posixpath.split(name)
+    return posixpath.join(directory, 'variants', f'{filename}.{size}.{extension}')
+
+
+def variant_names(name):
+    return [
+        variant_name(name, size, extension) for size in VARIANT_SIZES for extension in VARIANT_FORMATS
+    ]
+
+
+def delete_variants(storage, name):
+    """Remove the variants of a stored image (e.g. the photo it was replaced by is saved)"""
+    if not name:
+        return
+    for variant in variant_names(name):
+        if storage.exists(variant):
+            storage.delete(variant)
+
+
+def _encode(image, image_format, quality):
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha: flatten on white
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def generate_variants(field_file):
+    """
+    Write every size/format variant of an uploaded image next to it (overwriting
+    older ones). Returns the manifest of what was written, {'name': image name,
+    'variants': ['thumb.webp', ...]}, or None: unreadable images are logged and
+    skipped so a bad upload never fails the request.
+    """
+    if not field_file:
+        return None
+    storage = field_file.storage
+    try:
+        with storage.open(field_file.name, 'rb') as source:
+            original = Image.open(source)
+            original.load()
+    except (OSError, UnidentifiedImageError) as e:
+        logger.warning("Cannot build variants for %s: %s", field_file.name, e)
+        return None
+
+    # Phone photos often store their orientation in EXIF only
+    original = ImageOps.exif_transpose(original)
+    written = []
+    for size, longest_side in VARIANT_SIZES.items():
+        image = original.copy()
+        image.thumbnail((longest_side, longest_side), Image.LANCZOS)
+        for extension, (image_format, quality) in VARIANT_FORMATS.items():
+            name = variant_name(field_file.name, size, extension)
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, ContentFile(_encode(image, image_format, quality)))
+            written.append(f'{size}.{extension}')
+    return {'name': field_file.name, 'variants': written}
+
+
+def manifest_field(image_field):
+    """The JSON field recording the variants built for an image field (photo -> photo_variants_manifest)"""
+    return f'{image_field}_variants_manifest'
+
+
+def build_variants(instance, image_field):
+    """generate_variants for one model instance, with the manifest saved on it"""
+    manifest = generate_variants(getattr(instance, image_field))
+    field = manifest_field(image_field)
+    setattr(instance, field, manifest)
+    instance.save(update_fields=[field])
+    return manifest
+
+
+def variant_urls(field_file, manifest, request=None):
+    """
+    {'thumb': {'webp': url, 'jpg': url}, 'medium': {...}} for an image field,
+    or None when there is no image. Only the variants in the manifest written
+    by generate_variants for this very file are listed, without asking the
+    storage (a list page would otherwise stat every variant of every row).
+    """
+    if not field_file:
+        return None
+    return variant_urls_for_name(field_file.storage, field_file.name, manifest, request)
+
+
+def variant_urls_for_name(storage, name, manifest, request=None):
+    """variant_urls from a stored file name and manifest (e.g. a values() row)"""
+    if not name or not manifest or manifest.get('name') != name:
+        return None
+    urls = {}
+    for variant in manifest['variants']:
+        size, extension = variant.split('.')
+        url = storage.url(variant_name(name, size, extension))
+        urls.setdefault(size, {})[extension] = request.build_absolute_uri(url) if request is not None else url
+    return urls or None
@@ -0,0 +1,35 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connections
+
+
+@contextmanager
+def scratch_database(alias='default'):
+    """
+    Run a benchmark against a throwaway, fully migrated database
+    so nothing touches the real data. On SQLite the database is a
+    temporary file, so several threads can share it.
+    """
+    connection = connections[alias]
+    tmpdir = tempfile.mkdtemp(prefix='wash-bench-')
+    if connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield connection
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
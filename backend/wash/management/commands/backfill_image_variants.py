@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from wash.images import build_variants, manifest_field
+from wash.models import Client, ExternEmployee
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the resized image variants of client photos and extern employee profile images, "
+        "and record them in the images' manifests."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="rebuild variants that are already recorded")
+
+    def handle(self, *args, **options):
+        for model, field in ((Client, 'photo'), (ExternEmployee, 'profile_image')):
+            built = skipped = 0
+            manifest = manifest_field(field)
+            queryset = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''}).only(field, manifest)
+            for instance in queryset.iterator():
+                recorded = getattr(instance, manifest)
+                if not options['force'] and recorded and recorded.get('name') == getattr(instance, field).name:
+                    skipped += 1
+                    continue
+                if build_variants(instance, field):
+                    built += 1
+            self.stdout.write(self.style.SUCCESS(
+                f"{model.__name__}.{field}: built variants for {built} image(s), {skipped} already done"
+            ))
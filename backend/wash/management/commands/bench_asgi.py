@@ -0,0 +1,138 @@
+import asyncio
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import RequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from wash import async_views
+from wash.models import Client, ExternEmployee, AppointmentDomicile, Feedback
+from ._scratch import scratch_database, percentile
+
+# (name, url, view, token user type)
+ENDPOINTS = [
+    ('pending', '/api/appointments_domicile/get_all?page_size=50', async_views.get_pending_appointments,
+     'extern_employee'),
+    ('client appts', '/api/appointments_domicile/get?page_size=50', async_views.get_appointments_domicile, 'client'),
+    ('feedback', '/api/feedback/all/?page_size=50', async_views.get_client_feedbacks, None),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the async list views served from a thread pool (WSGI style, each request "
+        "runs the view with async_to_sync like Django's WSGI handler does) with the same "
+        "views on one event loop (ASGI style): throughput and p50/p99 at several numbers "
+        "of concurrent clients."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 128, 512])
+        parser.add_argument('--requests', type=int, default=1000, help="requests per run")
+        parser.add_argument('--workers', type=int, default=8, help="threads of the WSGI-style server")
+        parser.add_argument('--rows', type=int, default=500)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            tokens = self.seed(options['rows'])
+            factory = RequestFactory()
+
+            self.stdout.write(
+                f"{'endpoint':>13} {'server':>6} {'clients':>8} {'req/s':>8} "
+                f"{'p50':>8} {'p99':>9}"
+            )
+            for name, url, view, user_type in ENDPOINTS:
+                headers = {'HTTP_AUTHORIZATION': tokens[user_type]} if user_type else {}
+
+                def make_request():
+                    return factory.get(url, **headers)
+
+                for concurrency in options['concurrency']:
+                    for server, run in (('wsgi', self.run_wsgi), ('asgi', self.run_asgi)):
+                        rate, latencies = run(view, make_request, concurrency, options)
+                        self.stdout.write(
+                            f"{name:>13} {server:>6} {concurrency:>8} {rate:>8.0f} "
+                            f"{percentile(latencies, 50) * 1000:>6.1f}ms {percentile(latencies, 99) * 1000:>7.1f}ms"
+                        )
+
+    def seed(self, rows):
+        client = Client.objects.create(
+            full_name='Bench Client', email='bench@wash.dz', password='bench1234', phone='0555555555', age=30
+        )
+        employee = ExternEmployee.objects.create(
+            full_name='Bench', password='x', phone='0555555555', email='bench-e@wash.dz', age=25
+        )
+        AppointmentDomicile.objects.bulk_create([
+            AppointmentDomicile(
+                time=datetime.time(10, 0), car_type='SUV', car_name='Golf', wash_type='Full',
+                place='Alger', client=client, price='1500.00',
+            )
+            for _ in range(rows)
+        ])
+        Feedback.objects.bulk_create([
+            Feedback(name='Bench', email='bench@wash.dz', content='ok', rating=5, approved=True)
+            for _ in range(rows)
+        ])
+
+        tokens = {}
+        for user, user_type in ((employee, 'extern_employee'), (client, 'client')):
+            token = AccessToken()
+            token['user_id'] = user.id
+            token['user_type'] = user_type
+            tokens[user_type] = f'Bearer {token}'
+        return tokens
+
+    def run_wsgi(self, view, make_request, concurrency, options):
+        """Each client waits for one of `workers` threads, like a threaded WSGI server."""
+        latencies = []
+        lock = threading.Lock()
+        remaining = iter(range(options['requests']))
+
+        sync_view = async_to_sync(view)
+
+        def serve():
+            try:
+                sync_view(make_request())
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as server:
+            def client():
+                while next(remaining, None) is not None:
+                    started = time.perf_counter()
+                    server.submit(serve).result()
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            clients = [threading.Thread(target=client) for _ in range(concurrency)]
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            elapsed = time.perf_counter() - started
+        return len(latencies) / elapsed, latencies
+
+    def run_asgi(self, view, make_request, concurrency, options):
+        """All clients share one event loop; a waiting request holds no thread."""
+        async def main():
+            latencies = []
+            remaining = iter(range(options['requests']))
+
+            async def client():
+                while next(remaining, None) is not None:
+                    started = time.perf_counter()
+                    await view(make_request())
+                    latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(client() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - started
+            return len(latencies) / elapsed, latencies
+
+        return asyncio.run(main())
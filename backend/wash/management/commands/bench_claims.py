@@ -0,0 +1,98 @@
+import datetime
+import logging
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from wash.models import Client, ExternEmployee, AppointmentDomicile
+from ._scratch import scratch_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer claim_appointment from many threads on a scratch database, "
+        "check that exactly one employee wins each appointment and report claims per second."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+        parser.add_argument('--rounds', type=int, default=100, help="appointments raced per thread count")
+
+    def handle(self, *args, **options):
+        # Losing claims are expected 400s, don't log each one
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        with scratch_database():
+            client = Client.objects.create(
+                full_name='Bench Client', email='bench@wash.dz', password='bench1234', phone='0555555555', age=30
+            )
+            employees = [
+                ExternEmployee.objects.create(
+                    full_name=f'Bench {i}', password='x', phone='0555555555', email=f'bench{i}@wash.dz', age=25
+                )
+                for i in range(max(options['threads']))
+            ]
+
+            self.stdout.write(f"{'threads':>8} {'claims/s':>10} {'rounds':>7} {'bad rounds':>11} {'errors':>7}")
+            for thread_count in options['threads']:
+                rate, bad_rounds, errors = self.race(client, employees[:thread_count], options['rounds'])
+                self.stdout.write(
+                    f"{thread_count:>8} {rate:>10.0f} {options['rounds']:>7} {bad_rounds:>11} {errors:>7}"
+                )
+                if bad_rounds:
+                    raise CommandError(f"{bad_rounds} appointment(s) did not have exactly one winner")
+
+    def race(self, client, employees, rounds):
+        appointments = AppointmentDomicile.objects.bulk_create([
+            AppointmentDomicile(
+                time=datetime.time(10, 0), car_type='SUV', car_name='Golf', wash_type='Full',
+                place='Alger', client=client, price='1500.00',
+            )
+            for _ in range(rounds)
+        ])
+        appointment_ids = [appointment.id for appointment in appointments]
+
+        barrier = threading.Barrier(len(employees))
+        wins = {appointment_id: [] for appointment_id in appointment_ids}
+        errors = []
+        lock = threading.Lock()
+
+        def worker(employee):
+            token = AccessToken()
+            token['user_id'] = employee.id
+            token['user_type'] = 'extern_employee'
+            api = APIClient()
+            api.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            try:
+                for appointment_id in appointment_ids:
+                    # Every thread fires at the same appointment at the same moment
+                    barrier.wait()
+                    try:
+                        response = api.post(f'/api/appointments_domicile/{appointment_id}/claim')
+                    except Exception as e:
+                        with lock:
+                            errors.append(e)
+                        continue
+                    if response.status_code == 200:
+                        with lock:
+                            wins[appointment_id].append(employee.id)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(employee,)) for employee in employees]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        bad_rounds = sum(1 for winners in wins.values() if len(winners) != 1)
+        stored = AppointmentDomicile.objects.filter(id__in=appointment_ids, status='In Progress').count()
+        if stored != rounds:
+            bad_rounds = max(bad_rounds, rounds - stored)
+        return len(employees) * rounds / elapsed, bad_rounds, len(errors)
@@ -0,0 +1,58 @@
+import datetime
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from wash.models import Client, AppointmentDomicile
+from wash.renderers import ORJSONRenderer
+from wash.serializers import AppointmentDomicileWithClientSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Render a list of serialized domicile appointments (with client info) "
+        "with DRF's JSON renderer and the orjson one; checks the bytes are identical."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--appointments', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        data = self.payload(options['appointments'])
+        stock, fast = JSONRenderer(), ORJSONRenderer()
+
+        expected = stock.render(data)
+        if fast.render(data) != expected:
+            raise CommandError("ORJSONRenderer output differs from JSONRenderer")
+        self.stdout.write(f"payload: {options['appointments']} appointments, {len(expected) / 1024:.0f} KiB")
+
+        self.stdout.write(f"{'step':>8} {'drf':>10} {'orjson':>10} {'speedup':>8}")
+        render_times = [self.measure(lambda r=r: r.render(data), options['repeat']) for r in (stock, fast)]
+        self.report('render', *render_times)
+
+    def payload(self, count):
+        client = Client(
+            id=1, full_name='عميل تجريبي', email='bench@wash.dz', phone='0555555555', age=30,
+        )
+        appointments = [
+            AppointmentDomicile(
+                id=i, client=client, time=datetime.time(8 + i % 10, 30), car_type='SUV', car_name='Golf',
+                wash_type='Full', place='الجزائر العاصمة، باب الزوار', price=Decimal('1500.00') + i % 7,
+                status='Pending', extern_employee_id=None,
+            )
+            for i in range(1, count + 1)
+        ]
+        return AppointmentDomicileWithClientSerializer(appointments, many=True).data
+
+    def measure(self, fn, repeat):
+        fn()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - started) / repeat
+
+    def report(self, step, stock, fast):
+        self.stdout.write(f"{step:>8} {stock * 1000:>8.1f}ms {fast * 1000:>8.1f}ms {stock / fast:>7.1f}x")
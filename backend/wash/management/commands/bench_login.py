@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import AsyncClient, Client as HttpClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from wash.hashing import hashing_pool
+from wash.models import Client, ExternEmployee
+from ._scratch import scratch_database, percentile
+
+PASSWORD = 'bench1234'
+OTHER_URL = '/api/appointments_domicile/get_all'
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire a burst of client logins while other endpoints are polled, and report "
+        "p50/p99 latency of both for the sync login (hash on a worker thread) and the "
+        "async login (hash in the bounded pool)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=32, help="logins in the burst")
+        parser.add_argument('--workers', type=int, default=4, help="request threads of the simulated WSGI server")
+        parser.add_argument('--pollers', type=int, default=4, help="concurrent clients polling another endpoint")
+
+    def handle(self, *args, **options):
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+
+        with scratch_database():
+            Client.objects.create(
+                full_name='Bench Client', email='bench@wash.dz', password=PASSWORD, phone='0555555555', age=30
+            )
+            employee = ExternEmployee.objects.create(
+                full_name='Bench', password='x', phone='0555555555', email='bench-e@wash.dz', age=25
+            )
+            token = AccessToken()
+            token['user_id'] = employee.id
+            token['user_type'] = 'extern_employee'
+            self.auth_header = f'Bearer {token}'
+
+            self.stdout.write(
+                f"hashing pool: {hashing_pool.workers} workers, {hashing_pool.max_pending} max pending"
+            )
+            self.stdout.write(
+                f"{'mode':>6} {'login p50':>10} {'login p99':>10} {'503s':>5} "
+                f"{'other p50':>10} {'other p99':>10} {'other reqs':>11}"
+            )
+            self.report('sync', self.run_sync(options))
+            self.report('async', asyncio.run(self.run_async(options)))
+
+    def report(self, mode, result):
+        logins, rejected, others = result
+        self.stdout.write(
+            f"{mode:>6} {percentile(logins, 50) * 1000:>8.0f}ms {percentile(logins, 99) * 1000:>8.0f}ms "
+            f"{rejected:>5} {percentile(others, 50) * 1000:>8.0f}ms {percentile(others, 99) * 1000:>8.0f}ms "
+            f"{len(others):>11}"
+        )
+
+    def run_sync(self, options):
+        """Thread-per-request server: a login holds its worker thread while hashing."""
+        server = ThreadPoolExecutor(max_workers=options['workers'])
+        done = threading.Event()
+        logins, others, rejected = [], [], [0]
+        lock = threading.Lock()
+
+        def handle(method, *args, **kwargs):
+            try:
+                return getattr(HttpClient(), method)(*args, **kwargs)
+            finally:
+                connections.close_all()
+
+        def login():
+            started = time.perf_counter()
+            response = server.submit(
+                handle, 'post', '/api/auth/client/login/',
+                {'email': 'bench@wash.dz', 'password': PASSWORD}, content_type='application/json',
+            ).result()
+            with lock:
+                logins.append(time.perf_counter() - started)
+                rejected[0] += response.status_code == 503
+
+        def poll():
+            while not done.is_set():
+                started = time.perf_counter()
+                server.submit(handle, 'get', OTHER_URL, HTTP_AUTHORIZATION=self.auth_header).result()
+                with lock:
+                    others.append(time.perf_counter() - started)
+
+        pollers = [threading.Thread(target=poll) for _ in range(options['pollers'])]
+        for thread in pollers:
+            thread.start()
+        burst = [threading.Thread(target=login) for _ in range(options['logins'])]
+        for thread in burst:
+            thread.start()
+        for thread in burst:
+            thread.join()
+        done.set()
+        for thread in pollers:
+            thread.join()
+        server.shutdown()
+        return logins, rejected[0], others
+
+    async def run_async(self, options):
+        """One event loop: logins wait on the hashing pool without blocking other requests."""
+        done = asyncio.Event()
+        logins, others, rejected = [], [], 0
+
+        async def login():
+            nonlocal rejected
+            started = time.perf_counter()
+            response = await AsyncClient().post(
+                '/api/auth/client/login/async/',
+                {'email': 'bench@wash.dz', 'password': PASSWORD}, content_type='application/json',
+            )
+            logins.append(time.perf_counter() - started)
+            rejected += response.status_code == 503
+
+        async def poll():
+            while not done.is_set():
+                started = time.perf_counter()
+                await AsyncClient().get(OTHER_URL, headers={'Authorization': self.auth_header})
+                others.append(time.perf_counter() - started)
+
+        pollers = [asyncio.create_task(poll()) for _ in range(options['pollers'])]
+        await asyncio.gather(*(login() for _ in range(options['logins'])))
+        done.set()
+        await asyncio.gather(*pollers)
+        return logins, rejected, others
@@ -0,0 +1,108 @@
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.test.utils import CaptureQueriesContext
+
+from wash import geo
+from wash.models import Client, AppointmentDomicile
+from ._scratch import scratch_database, percentile
+
+# Synthetic appointments are spread around Algiers
+CENTER = (36.7538, 3.0588)
+# The sparse case spreads as many appointments this many times wider (400x fewer
+# per km²): most rings are empty, so searches reach the whole circle
+SPARSE_FACTOR = 20
+PENDING = Q(status='Pending')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the 'pending near me' search on the grid index (wash.geo.nearest) with a "
+        "scan of every pending appointment; checks both return the same appointments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--appointments', type=int, default=100000)
+        parser.add_argument('--spread', type=float, default=0.5, help="degrees around the center")
+        parser.add_argument('--searches', type=int, default=50)
+        parser.add_argument('--radius', type=float, default=10, help="km")
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--sparse-radius', type=float, default=50, help="km, for the sparse case")
+        parser.add_argument('--case', choices=['dense', 'sparse', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        cases = {
+            'dense': (options['spread'], options['radius']),
+            'sparse': (options['spread'] * SPARSE_FACTOR, options['sparse_radius']),
+        }
+        for case, (spread, radius) in cases.items():
+            if options['case'] in (case, 'both'):
+                self.run(case, {**options, 'spread': spread, 'radius': radius})
+
+    def run(self, case, options):
+        rng = random.Random(1)
+        with scratch_database():
+            self.seed(options['appointments'], options['spread'], rng)
+            pending = AppointmentDomicile.objects.filter(PENDING)
+            points = [
+                (CENTER[0] + rng.uniform(-options['spread'], options['spread']),
+                 CENTER[1] + rng.uniform(-options['spread'], options['spread']))
+                for _ in range(options['searches'])
+            ]
+
+            timings = {'scan': [], 'grid': []}
+            grid_queries = []
+            for latitude, longitude in points:
+                started = time.perf_counter()
+                expected = self.scan(pending, latitude, longitude, options['radius'], options['limit'])
+                timings['scan'].append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                with CaptureQueriesContext(connection) as queries:
+                    found = geo.nearest(
+                        pending, latitude, longitude, options['radius'], options['limit'], index_condition=PENDING
+                    )
+                timings['grid'].append(time.perf_counter() - started)
+                grid_queries.append(len(queries))
+
+                if [row['id'] for _, row in found] != expected:
+                    raise CommandError(f"grid search differs from the scan at ({latitude}, {longitude})")
+
+        self.stdout.write(
+            f"{case}: {options['appointments']} appointments over ±{options['spread']:g}°, "
+            f"radius {options['radius']:g} km, "
+            f"k={options['limit']}, {sum(grid_queries) / len(grid_queries):.1f} queries per grid search"
+        )
+        self.stdout.write(f"{'search':>6} {'p50':>9} {'p99':>9}")
+        for name, values in timings.items():
+            self.stdout.write(
+                f"{name:>6} {percentile(values, 50) * 1000:>7.1f}ms {percentile(values, 99) * 1000:>7.1f}ms"
+            )
+
+    def seed(self, count, spread, rng):
+        client = Client.objects.create(
+            full_name='Bench Client', email='bench@wash.dz', password='x', phone='0555555555', age=30
+        )
+        statuses = ['Pending'] * 3 + ['In Progress', 'Completed']
+        batch = []
+        for i in range(count):
+            latitude = CENTER[0] + rng.uniform(-spread, spread)
+            longitude = CENTER[1] + rng.uniform(-spread, spread)
+            batch.append(AppointmentDomicile(
+                client=client, time=datetime.time(8 + i % 10, 30), car_type='SUV', car_name='Golf',
+                wash_type='Full', place='Alger', price='1500.00', status=rng.choice(statuses),
+                latitude=latitude, longitude=longitude, grid_cell=geo.grid_cell(latitude, longitude),
+            ))
+        AppointmentDomicile.objects.bulk_create(batch, batch_size=2000)
+
+    def scan(self, pending, latitude, longitude, radius_km, limit):
+        """What get_pending_appointments allows today: read every pending row"""
+        distances = sorted(
+            (geo.haversine_km(latitude, longitude, row['latitude'], row['longitude']), row['id'])
+            for row in pending.filter(latitude__isnull=False).values('id', 'latitude', 'longitude')
+        )
+        return [pk for distance, pk in distances if distance <= radius_km][:limit]
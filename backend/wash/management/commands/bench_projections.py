@@ -0,0 +1,95 @@
+import datetime
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wash.models import Client, AppointmentDomicile, AppointmentLocation
+from wash.projections import (
+    AppointmentDomicileWithClientProjection,
+    AppointmentLocationWithClientProjection,
+    project_domicile,
+    project_location,
+)
+from wash.renderers import ORJSONRenderer
+from wash.serializers import AppointmentDomicileWithClientSerializer, AppointmentLocationWithClientSerializer
+from ._scratch import scratch_database
+
+# (name, model, serializer, projection, values())
+LISTS = [
+    ('domicile', AppointmentDomicile, AppointmentDomicileWithClientSerializer,
+     AppointmentDomicileWithClientProjection, project_domicile),
+    ('location', AppointmentLocation, AppointmentLocationWithClientSerializer,
+     AppointmentLocationWithClientProjection, project_location),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the appointment list JSON (query + serialize + render) with the WithClient "
+        "serializers and with the values() projections; checks the bytes are identical."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--appointments', type=int, default=5000)
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--page-size', type=int, default=50, help="also time one page of this size")
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.seed(options['appointments'], options['clients'])
+            renderer = ORJSONRenderer()
+
+            self.stdout.write(f"{'list':>9} {'rows':>6} {'serializer':>11} {'projection':>11} {'speedup':>8} {'rows/s':>9}")
+            for name, model, serializer, projection, project in LISTS:
+                for rows in (options['appointments'], options['page_size']):
+                    queryset = model.objects.order_by('id')[:rows]
+
+                    def with_serializer(queryset=queryset, serializer=serializer):
+                        objects = list(queryset.select_related('client'))
+                        return renderer.render(serializer(objects, many=True).data)
+
+                    def with_projection(queryset=queryset, projection=projection, project=project):
+                        return renderer.render(projection(list(project(queryset)), many=True).data)
+
+                    if with_serializer() != with_projection():
+                        raise CommandError(f"{name}: projection output differs from the serializer")
+                    slow = self.measure(with_serializer, options['repeat'])
+                    fast = self.measure(with_projection, options['repeat'])
+                    self.stdout.write(
+                        f"{name:>9} {rows:>6} {slow * 1000:>9.1f}ms {fast * 1000:>9.1f}ms "
+                        f"{slow / fast:>7.1f}x {rows / fast:>9.0f}"
+                    )
+
+    def seed(self, appointments, clients):
+        Client.objects.bulk_create([
+            Client(
+                full_name=f'Client {i}', email=f'bench{i}@wash.dz', password='x', phone='0555555555',
+                age=30, photo=f'clients/bench{i}.png' if i % 2 else None,
+            )
+            for i in range(clients)
+        ])
+        client_ids = list(Client.objects.values_list('id', flat=True))
+        AppointmentDomicile.objects.bulk_create([
+            AppointmentDomicile(
+                client_id=client_ids[i % len(client_ids)], time=datetime.time(8 + i % 10, 30),
+                car_type='SUV', car_name='Golf', wash_type='Full', place='الجزائر العاصمة',
+                price=Decimal('1500.00') + i % 7,
+            )
+            for i in range(appointments)
+        ])
+        AppointmentLocation.objects.bulk_create([
+            AppointmentLocation(
+                client_id=client_ids[i % len(client_ids)], date=datetime.date(2025, 1, 1) + datetime.timedelta(days=i % 60),
+                time=datetime.time(8 + i % 10, 30), car_type='Sedan', car_name='Clio', wash_type='Basic',
+                price=Decimal('800.00') + i % 5,
+            )
+            for i in range(appointments)
+        ])
+
+    def measure(self, fn, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - started) / repeat
@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test import override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from wash.models import Client, ExternEmployee, AppointmentDomicile
+from ._scratch import scratch_database, percentile
+
+APPOINTMENT = {
+    'time': '10:00', 'car_type': 'SUV', 'car_name': 'Golf', 'wash_type': 'Full',
+    'place': 'Alger', 'price': '1500.00',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Concurrent clients creating domicile appointments while employees claim them, "
+        "on a scratch SQLite file: Django's defaults (rollback journal, deferred "
+        "transactions, no retry) against WASH_SQLITE / transaction_mode / retry_on_lock."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, nargs='+', default=[4, 16])
+        parser.add_argument('--writes', type=int, default=50, help="appointments created per client thread")
+
+    def handle(self, *args, **options):
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+
+        with scratch_database() as connection:
+            if connection.vendor != 'sqlite':
+                self.stderr.write("This benchmark is for SQLite")
+                return
+            users = self.seed(max(options['threads']))
+
+            self.stdout.write(
+                f"{'mode':>8} {'threads':>8} {'writes/s':>9} {'p50':>8} {'p99':>9} {'locked':>7}"
+            )
+            for thread_count in options['threads']:
+                for mode in ('default', 'tuned'):
+                    with self.mode(mode):
+                        rate, latencies, failures = self.run(users, thread_count, options['writes'])
+                    self.stdout.write(
+                        f"{mode:>8} {thread_count:>8} {rate:>9.0f} {percentile(latencies, 50) * 1000:>6.1f}ms "
+                        f"{percentile(latencies, 99) * 1000:>7.1f}ms {failures:>7}"
+                    )
+
+    @contextmanager
+    def mode(self, mode):
+        connections.close_all()
+        db_settings = connections.settings['default']
+        old_options = db_settings.get('OPTIONS', {})
+        if mode == 'tuned':
+            yield
+        else:
+            db_settings['OPTIONS'] = {'timeout': old_options.get('timeout', 5)}
+            try:
+                with override_settings(WASH_SQLITE={'JOURNAL_MODE': 'DELETE'}, WASH_DB_RETRY={'ATTEMPTS': 1}):
+                    yield
+            finally:
+                db_settings['OPTIONS'] = old_options
+        connections.close_all()
+
+    def seed(self, count):
+        users = []
+        for i in range(count):
+            client = Client.objects.create(
+                full_name=f'Bench Client {i}', email=f'bench{i}@wash.dz', password='bench1234',
+                phone='0555555555', age=30,
+            )
+            employee = ExternEmployee.objects.create(
+                full_name=f'Bench {i}', password='x', phone='0555555555', email=f'bench-e{i}@wash.dz', age=25
+            )
+            users.append((self.api(client, 'client'), self.api(employee, 'extern_employee')))
+        return users
+
+    def api(self, user, user_type):
+        token = AccessToken()
+        token['user_id'] = user.id
+        token['user_type'] = user_type
+        api = APIClient()
+        api.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        return api
+
+    def run(self, users, thread_count, writes):
+        latencies = []
+        failures = [0]
+        lock = threading.Lock()
+        barrier = threading.Barrier(thread_count * 2)
+
+        def timed(call):
+            started = time.perf_counter()
+            try:
+                response = call()
+                if response is None:
+                    return
+                ok = response.status_code < 500
+            except Exception:
+                ok = False
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                failures[0] += not ok
+
+        def client_worker(api):
+            barrier.wait()
+            try:
+                for _ in range(writes):
+                    timed(lambda: api.post('/api/appointments_domicile/create', APPOINTMENT, format='json'))
+            finally:
+                connections.close_all()
+
+        def claim_next(api):
+            pending = AppointmentDomicile.objects.filter(status='Pending').values_list('id', flat=True).first()
+            if pending is None:
+                time.sleep(0.001)
+                return None
+            return api.post(f'/api/appointments_domicile/{pending}/claim')
+
+        def employee_worker(api):
+            barrier.wait()
+            try:
+                for _ in range(writes):
+                    timed(lambda: claim_next(api))
+            finally:
+                connections.close_all()
+
+        threads = []
+        for client_api, employee_api in users[:thread_count]:
+            threads.append(threading.Thread(target=client_worker, args=(client_api,)))
+            threads.append(threading.Thread(target=employee_worker, args=(employee_api,)))
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return len(latencies) / elapsed, latencies, failures[0]
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from wash.models import AppointmentDomicile, AppointmentLocation, AppointmentDailyStat
+from wash.rollups import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily appointment statistics table (AppointmentDailyStat) from the appointments."
+
+    def handle(self, *args, **options):
+        buckets = rebuild_daily_stats(AppointmentDomicile, AppointmentLocation, AppointmentDailyStat)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {buckets} daily stat bucket(s)"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from wash.models import FeedbackCounter
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the FeedbackCounter row from the Feedback table "
+        "(repairs drift from queryset.update() or raw SQL, which bypass save())."
+    )
+
+    def handle(self, *args, **options):
+        old, counts = FeedbackCounter.rebuild()
+        if old == counts:
+            self.stdout.write(self.style.SUCCESS(f"Feedback counter was correct: {counts}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Repaired feedback counter: {old} -> {counts}"))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from wash.models import ExternEmployee, Rating
+from wash.rollups import rebuild_employee_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored rating totals and final_rating of the extern employees from the Rating table."
+
+    def handle(self, *args, **options):
+        repaired, total = rebuild_employee_ratings(ExternEmployee, Rating)
+        self.stdout.write(self.style.SUCCESS(f"Repaired {repaired} of {total} extern employee(s)"))
@@ -0,0 +1,48 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from wash.db import retry_on_lock
+from wash.models import AppointmentDomicile, ExternEmployee, ExternEmployeeHistory, LeaderboardEntry
+from wash.rollups import rebuild_leaderboard
+
+logger = logging.getLogger(__name__)
+
+
+@retry_on_lock
+def refresh():
+    return rebuild_leaderboard(ExternEmployee, ExternEmployeeHistory, AppointmentDomicile, LeaderboardEntry)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the extern employee leaderboard (LeaderboardEntry) served by the "
+        "leaderboard endpoints. Use --interval to keep refreshing it (the leaderboard "
+        "service of docker-compose.yml)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help="seconds between refreshes (0 = refresh once)")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            try:
+                # "database is locked" is retried with backoff (settings.WASH_DB_RETRY)
+                employees = refresh()
+            except Exception:
+                if not options['interval']:
+                    raise
+                # A failed refresh keeps the previous leaderboard; try again next time
+                logger.exception("Leaderboard refresh failed")
+                close_old_connections()
+            else:
+                self.stdout.write(
+                    f"leaderboard refreshed for {employees} extern employee(s) in "
+                    f"{(time.perf_counter() - started) * 1000:.0f}ms"
+                )
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,44 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from wash.routers import REPLICA
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the default SQLite database into the 'replica' alias with SQLite's online "
+        "backup API (consistent snapshot, writers are not blocked for the whole copy). "
+        "Use --interval to keep syncing."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0, help="seconds between syncs (0 = sync once)")
+        parser.add_argument('--pages', type=int, default=1024, help="pages copied per backup step")
+
+    def handle(self, *args, **options):
+        if REPLICA not in connections.settings:
+            raise CommandError("No 'replica' database configured (set REPLICA_DB_PATH)")
+        source, replica = connections['default'], connections[REPLICA]
+        if source.vendor != 'sqlite' or replica.vendor != 'sqlite':
+            raise CommandError("sync_replica only copies SQLite databases")
+
+        while True:
+            started = time.perf_counter()
+            self.sync(source, replica, options['pages'])
+            self.stdout.write(f"replica synced in {(time.perf_counter() - started) * 1000:.0f}ms")
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def sync(self, source, replica, pages):
+        source.ensure_connection()
+        # A separate connection: the replica alias may be open read-only elsewhere
+        target = sqlite3.connect(replica.settings_dict['NAME'])
+        try:
+            # Sleep between steps so writers on the primary get the lock in between
+            source.connection.backup(target, pages=pages, sleep=0.005)
+        finally:
+            target.close()
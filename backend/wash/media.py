@@ -0,0 +1,139 @@
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def get_media_settings():
+    options = getattr(settings, 'WASH_MEDIA', {})
+    return {
+        'MAX_AGE': options.get('MAX_AGE', 7 * 24 * 3600),
+        'ACCEL_REDIRECT_PREFIX': options.get('ACCEL_REDIRECT_PREFIX'),
+    }
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a single "bytes=a-b" range, None when the header
+    should be ignored (absent, malformed, last < first or several ranges), or
+    False when it can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first == '':
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        # Syntactically invalid (RFC 7233 section 2.1): send the whole file
+        return None
+    if start >= size:
+        return False
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def _if_range_matches(request, etag, mtime):
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith('"') or value.startswith('W/'):
+        return value == etag
+    return parse_http_date_safe(value) == mtime
+
+
+def _read_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve an uploaded file from MEDIA_ROOT with ETag / Last-Modified (answering
+    304 from the file metadata alone), single byte ranges and long-lived cache
+    headers. With WASH_MEDIA['ACCEL_REDIRECT_PREFIX'] set, nginx sends the bytes
+    (X-Accel-Redirect) and Django only does the lookup.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        file_stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404("الملف غير موجود")
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise Http404("الملف غير موجود")
+
+    options = get_media_settings()
+    size = file_stat.st_size
+    mtime = int(file_stat.st_mtime)
+    etag = f'"{file_stat.st_mtime_ns:x}-{size:x}"'
+
+    def finish(response, cacheable=True):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(mtime)
+        response['Accept-Ranges'] = 'bytes'
+        if cacheable:
+            patch_cache_control(response, public=True, max_age=options['MAX_AGE'])
+        else:
+            patch_cache_control(response, no_store=True)
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if not_modified is not None:
+        return finish(not_modified)
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    if options['ACCEL_REDIRECT_PREFIX']:
+        # nginx serves the file itself (ranges included) from an internal location
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = options['ACCEL_REDIRECT_PREFIX'].rstrip('/') + '/' + quote(path)
+        return finish(response)
+
+    byte_range = None
+    if _if_range_matches(request, etag, mtime):
+        byte_range = parse_range(request.headers.get('Range'), size)
+    if byte_range is False:
+        response = HttpResponse(status=416, content_type=content_type)
+        response['Content-Range'] = f'bytes */{size}'
+        # A cache must not answer later requests (or other ranges) with this error
+        return finish(response, cacheable=False)
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = size
+    elif byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(_read_range(full_path, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return finish(response)
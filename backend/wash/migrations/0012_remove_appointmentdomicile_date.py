@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def drop_date_column(apps, schema_editor):
+    # 0009 dropped the column by hand on the deployed databases without recording it
+    # in the migration state, so only drop it where it still exists (fresh databases).
+    AppointmentDomicile = apps.get_model('wash', 'AppointmentDomicile')
+    table = AppointmentDomicile._meta.db_table
+    with schema_editor.connection.cursor() as cursor:
+        columns = [
+            column.name
+            for column in schema_editor.connection.introspection.get_table_description(cursor, table)
+        ]
+    if 'date' in columns:
+        schema_editor.remove_field(AppointmentDomicile, AppointmentDomicile._meta.get_field('date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0011_remove_appointmentdomicile_date'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(drop_date_column, migrations.RunPython.noop),
+            ],
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='appointmentdomicile',
+                    name='date',
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:58
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_daily_stats(apps, schema_editor):
+    # Frozen copy of wash.rollups.rebuild_daily_stats as of this migration (no employee
+    # column yet), so later changes to rollups.py don't change what it does
+    AppointmentDomicile = apps.get_model('wash', 'AppointmentDomicile')
+    AppointmentLocation = apps.get_model('wash', 'AppointmentLocation')
+    AppointmentDailyStat = apps.get_model('wash', 'AppointmentDailyStat')
+    domicile_rows = (
+        AppointmentDomicile.objects
+        .filter(created_at__isnull=False)
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'status', 'wash_type')
+        .annotate(count=Count('id'), revenue=Sum('price'))
+        .order_by()
+    )
+    location_rows = (
+        AppointmentLocation.objects
+        .values('date', 'status', 'wash_type')
+        .annotate(count=Count('id'), revenue=Sum('price'))
+        .order_by()
+    )
+    AppointmentDailyStat.objects.bulk_create([
+        AppointmentDailyStat(
+            day=row['day'], channel='domicile', status=row['status'], wash_type=row['wash_type'],
+            count=row['count'], revenue=row['revenue'] or 0,
+        )
+        for row in domicile_rows
+    ] + [
+        AppointmentDailyStat(
+            day=row['date'], channel='location', status=row['status'], wash_type=row['wash_type'],
+            count=row['count'], revenue=row['revenue'] or 0,
+        )
+        for row in location_rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0012_remove_appointmentdomicile_date'),
+    ]
+
+    operations = [
+        # Existing appointments have no known creation time: they stay NULL (and out of
+        # the daily stats) instead of all being stamped with the time of this migration
+        migrations.AddField(
+            model_name='appointmentdomicile',
+            name='created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='appointmentdomicile',
+            name='created_at',
+            field=models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True),
+        ),
+        migrations.CreateModel(
+            name='AppointmentDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('channel', models.CharField(choices=[('domicile', 'Domicile'), ('location', 'Location')], max_length=10)),
+                ('status', models.CharField(max_length=20)),
+                ('wash_type', models.CharField(max_length=50)),
+                ('count', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('day', 'channel', 'status', 'wash_type'), name='unique_daily_stat_bucket')],
+            },
+        ),
+        migrations.RunPython(populate_daily_stats, migrations.RunPython.noop),
+    ]
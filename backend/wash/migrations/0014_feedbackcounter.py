@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0013_appointmentdailystat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedbackCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total', models.IntegerField(default=0)),
+                ('approved', models.IntegerField(default=0)),
+                ('rating_sum', models.IntegerField(default=0)),
+            ],
+        ),
+    ]
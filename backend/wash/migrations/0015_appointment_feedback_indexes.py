@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0014_feedbackcounter'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointmentdomicile',
+            index=models.Index(condition=models.Q(('status', 'Pending')), fields=['id'], name='appt_dom_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentdomicile',
+            index=models.Index(fields=['extern_employee', 'status'], name='appt_dom_employee_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentdomicile',
+            index=models.Index(fields=['client', 'status'], name='appt_dom_client_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentdomicile',
+            index=models.Index(fields=['created_at'], name='appt_dom_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentlocation',
+            index=models.Index(fields=['date', 'status'], name='appt_loc_date_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentlocation',
+            index=models.Index(fields=['client', 'status'], name='appt_loc_client_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(condition=models.Q(('approved', True)), fields=['created_at'], name='feedback_approved_created_idx'),
+        ),
+    ]
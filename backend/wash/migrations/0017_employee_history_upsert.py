@@ -0,0 +1,90 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:24
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def prepare_history(apps, schema_editor):
+    AppointmentLocation = apps.get_model('wash', 'AppointmentLocation')
+    for model_name, appointment_model, employee_field in (
+        ('ExternEmployeeHistory', 'AppointmentDomicile', 'extern_employee'),
+        ('InternEmployeeHistory', 'AppointmentLocation', 'intern_employee'),
+    ):
+        History = apps.get_model('wash', model_name)
+        Appointment = apps.get_model('wash', appointment_model)
+        # One row per appointment: keep the oldest one
+        first_rows = History.objects.values('appointment').annotate(first=Min('id')).values('first')
+        History.objects.exclude(id__in=Subquery(first_rows)).delete()
+        History.objects.update(completed_at=Subquery(
+            Appointment.objects.filter(pk=OuterRef('appointment')).values('updated_at')[:1]
+        ))
+        # Frozen copy of wash.rollups.refresh_employee_counters as of this migration
+        Employee = History._meta.get_field(employee_field).related_model
+        history = History.objects.filter(**{employee_field: OuterRef('pk')}).order_by().values(employee_field)
+        Employee.objects.update(
+            total_cars_washed=Coalesce(Subquery(history.annotate(total=Sum('cars_washed')).values('total')), 0),
+            total_clients=Coalesce(Subquery(history.annotate(total=Count('client', distinct=True)).values('total')), 0),
+        )
+
+    # The intern employee credited so far becomes the one assigned to the appointment
+    InternEmployeeHistory = apps.get_model('wash', 'InternEmployeeHistory')
+    AppointmentLocation.objects.filter(intern_employee__isnull=True).update(intern_employee=Subquery(
+        InternEmployeeHistory.objects.filter(appointment=OuterRef('pk')).values('intern_employee')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0016_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointmentlocation',
+            name='intern_employee',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='wash.internemployee'),
+        ),
+        migrations.AddField(
+            model_name='externemployee',
+            name='total_cars_washed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='externemployee',
+            name='total_clients',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='externemployeehistory',
+            name='completed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='internemployee',
+            name='total_cars_washed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='internemployee',
+            name='total_clients',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='internemployeehistory',
+            name='completed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(prepare_history, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='externemployeehistory',
+            constraint=models.UniqueConstraint(fields=('appointment',), name='unique_extern_history_appointment'),
+        ),
+        migrations.AddConstraint(
+            model_name='internemployeehistory',
+            constraint=models.UniqueConstraint(fields=('appointment',), name='unique_intern_history_appointment'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:26
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Subquery, Sum
+
+
+def prepare_ratings(apps, schema_editor):
+    Rating = apps.get_model('wash', 'Rating')
+    ExternEmployee = apps.get_model('wash', 'ExternEmployee')
+    # One rating per client and employee: keep the latest one
+    latest = Rating.objects.values('client', 'extern_employee').annotate(latest=Max('id')).values('latest')
+    Rating.objects.exclude(id__in=Subquery(latest)).delete()
+
+    # Frozen copy of wash.rollups.rebuild_employee_ratings as of this migration
+    totals = {
+        row['extern_employee']: (row['count'], row['total'])
+        for row in Rating.objects.values('extern_employee').annotate(count=Count('id'), total=Sum('rating')).order_by()
+    }
+    employees = list(ExternEmployee.objects.only('rating_count', 'rating_sum', 'final_rating'))
+    for employee in employees:
+        count, total = totals.get(employee.pk, (0, 0))
+        employee.rating_count, employee.rating_sum = count, total
+        employee.final_rating = total / count if count else 0.0
+    ExternEmployee.objects.bulk_update(employees, ['rating_count', 'rating_sum', 'final_rating'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0017_employee_history_upsert'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='externemployee',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='externemployee',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(prepare_ratings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='rating',
+            constraint=models.UniqueConstraint(fields=('client', 'extern_employee'), name='unique_client_employee_rating'),
+        ),
+    ]
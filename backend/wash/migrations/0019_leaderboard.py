@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0018_employee_ratings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('rating', 'Rating'), ('week', 'Cars washed this week'), ('month', 'Cars washed this month'), ('completion', 'Completion rate')], max_length=20)),
+                ('full_name', models.CharField(max_length=255)),
+                ('rank', models.IntegerField()),
+                ('value', models.FloatField()),
+                ('out_of', models.IntegerField()),
+                ('computed_at', models.DateTimeField()),
+                ('extern_employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='wash.externemployee')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('metric', 'rank'), name='unique_leaderboard_rank'), models.UniqueConstraint(fields=('extern_employee', 'metric'), name='unique_leaderboard_employee_metric')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:29
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0019_leaderboard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointmentdomicile',
+            name='grid_cell',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='appointmentdomicile',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='appointmentdomicile',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+        migrations.AddIndex(
+            model_name='appointmentdomicile',
+            index=models.Index(condition=models.Q(('status', 'Pending')), fields=['grid_cell'], name='appt_dom_pending_cell_idx'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:48
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def split_buckets_by_employee(apps, schema_editor):
+    # Frozen copy of wash.rollups.rebuild_daily_stats as of this migration, so later
+    # changes to rollups.py don't change what it does
+    AppointmentDomicile = apps.get_model('wash', 'AppointmentDomicile')
+    AppointmentLocation = apps.get_model('wash', 'AppointmentLocation')
+    AppointmentDailyStat = apps.get_model('wash', 'AppointmentDailyStat')
+    domicile_rows = (
+        AppointmentDomicile.objects
+        .filter(created_at__isnull=False)
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'status', 'wash_type', 'extern_employee')
+        .annotate(count=Count('id'), revenue=Sum('price'))
+        .order_by()
+    )
+    location_rows = (
+        AppointmentLocation.objects
+        .values('date', 'status', 'wash_type')
+        .annotate(count=Count('id'), revenue=Sum('price'))
+        .order_by()
+    )
+    AppointmentDailyStat.objects.all().delete()
+    AppointmentDailyStat.objects.bulk_create([
+        AppointmentDailyStat(
+            day=row['day'], channel='domicile', status=row['status'], wash_type=row['wash_type'],
+            employee=row['extern_employee'] or 0, count=row['count'], revenue=row['revenue'] or 0,
+        )
+        for row in domicile_rows
+    ] + [
+        AppointmentDailyStat(
+            day=row['date'], channel='location', status=row['status'], wash_type=row['wash_type'],
+            count=row['count'], revenue=row['revenue'] or 0,
+        )
+        for row in location_rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0020_appointment_coordinates'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='appointmentdailystat',
+            name='unique_daily_stat_bucket',
+        ),
+        migrations.AddField(
+            model_name='appointmentdailystat',
+            name='employee',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='appointmentdailystat',
+            constraint=models.UniqueConstraint(fields=('day', 'channel', 'status', 'wash_type', 'employee'), name='unique_daily_stat_bucket'),
+        ),
+        migrations.RunPython(split_buckets_by_employee, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:46
+
+import posixpath
+
+from django.db import migrations, models
+
+# Frozen copy of wash.images naming at the time of this migration
+VARIANTS = ('thumb.webp', 'thumb.jpg', 'medium.webp', 'medium.jpg')
+IMAGE_FIELDS = (('Client', 'photo'), ('ExternEmployee', 'profile_image'))
+
+
+def record_existing_variants(apps, schema_editor):
+    """Variants already on disk get a manifest, so they stay listed without stat calls"""
+    for model_name, field in IMAGE_FIELDS:
+        model = apps.get_model('wash', model_name)
+        storage = model._meta.get_field(field).storage
+        rows = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''}).values_list('pk', field)
+        for pk, name in rows:
+            directory, filename = posixpath.split(name)
+            variants = [
+                variant for variant in VARIANTS
+                if storage.exists(posixpath.join(directory, 'variants', f'{filename}.{variant}'))
+            ]
+            if variants:
+                model.objects.filter(pk=pk).update(
+                    **{f'{field}_variants_manifest': {'name': name, 'variants': variants}}
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wash', '0021_daily_stat_employee'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='photo_variants_manifest',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='externemployee',
+            name='profile_image_variants_manifest',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(record_existing_variants, migrations.RunPython.noop),
+    ]
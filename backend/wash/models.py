@@ -1,8 +1,15 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
+from django.db.models.functions import Cast, Coalesce, NullIf
 from django.contrib.auth.hashers import make_password, check_password
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.utils import timezone
+from decimal import Decimal
 import datetime
 
+from . import geo
+from .rollups import refresh_employee_counters
+
 # جدول العملاء
 class Client(models.Model):
     full_name = models.CharField(max_length=255)
@@ -11,6 +18,10 @@ class Client(models.Model):
     phone = models.CharField(max_length=20)
     age = models.IntegerField()
     photo = models.ImageField(upload_to='clients/', blank=True, null=True)
+    # النسخ المصغّرة المولّدة للصورة الحالية (wash/images.py)، حتى لا يُسأل التخزين عنها عند كل قراءة
+    photo_variants_manifest = models.JSONField(null=True, blank=True, editable=False)
+    # Validator for conditional GET (wash/conditional.py)
+    updated_at = models.DateTimeField(auto_now=True)
         
     def save(self, *args, **kwargs):
         # Hash password if it's not already hashed
@@ -30,10 +41,31 @@ class ExternEmployee(models.Model):
     full_name = models.CharField(max_length=255)
     password = models.CharField(max_length=255)
     profile_image = models.ImageField(upload_to='profile_images/')
+    profile_image_variants_manifest = models.JSONField(null=True, blank=True, editable=False)
     phone = models.CharField(max_length=20)
     email = models.EmailField(unique=True)
     age = models.IntegerField()
     final_rating = models.FloatField(default=0.0)
+    # عدد ومجموع تقييمات العملاء (Rating) حتى لا يُجمَّع جدول التقييمات عند القراءة
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    # Kept from ExternEmployeeHistory (see EmployeeHistoryMixin), never summed on read
+    total_cars_washed = models.IntegerField(default=0)
+    total_clients = models.IntegerField(default=0)
+
+    @classmethod
+    def apply_rating(cls, employee_id, count=0, rating_sum=0):
+        """
+        Add deltas to the rating totals and recompute final_rating (their average)
+        in the same UPDATE. Call it in the same transaction as the Rating change.
+        """
+        new_count = F('rating_count') + count
+        new_sum = F('rating_sum') + rating_sum
+        return cls.objects.filter(pk=employee_id).update(
+            rating_count=new_count,
+            rating_sum=new_sum,
+            final_rating=Coalesce(Cast(new_sum, models.FloatField()) / NullIf(new_count, 0), 0.0),
+        )
 
     def __str__(self):
         return self.full_name
@@ -47,6 +79,9 @@ class InternEmployee(models.Model):
     phone = models.CharField(max_length=20)
     email = models.EmailField(unique=True)
     age = models.IntegerField(default=0)
+    # Kept from InternEmployeeHistory (see EmployeeHistoryMixin), never summed on read
+    total_cars_washed = models.IntegerField(default=0)
+    total_clients = models.IntegerField(default=0)
 
     def __str__(self):
         return self.full_name
@@ -76,6 +111,12 @@ class Rating(models.Model):
     rating = models.IntegerField()
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # تقييم واحد لكل عميل وموظف، يمكن تعديله
+            models.UniqueConstraint(fields=['client', 'extern_employee'], name='unique_client_employee_rating'),
+        ]
+
     def __str__(self):
         return f"{self.client.full_name} → {self.extern_employee.full_name}: {self.rating}"
 
@@ -94,23 +135,85 @@ class AppointmentDomicile(models.Model):
     car_name = models.CharField(max_length=50)
     wash_type = models.CharField(max_length=50)
     place = models.CharField(max_length=255)
+    # إحداثيات اختيارية يرسلها العميل عند الحجز، و grid_cell هي خانة الشبكة المحسوبة منها (wash/geo.py)
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    grid_cell = models.IntegerField(null=True, blank=True, editable=False)
     client = models.ForeignKey(Client, on_delete=models.CASCADE)
     extern_employee = models.ForeignKey(ExternEmployee, on_delete=models.SET_NULL, null=True, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
+    # NULL for appointments booked before this field existed: their day is unknown,
+    # so they are left out of the daily stats and the revenue by date
+    created_at = models.DateTimeField(default=timezone.now, null=True, blank=True)
+    # auto_now only applies in save(): set it explicitly in queryset.update() calls
+    updated_at = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
+    class Meta:
+        indexes = [
+            # قائمة المواعيد قيد الانتظار (مرتبة حسب المعرف)
+            models.Index(fields=['id'], condition=models.Q(status='Pending'), name='appt_dom_pending_idx'),
+            models.Index(fields=['extern_employee', 'status'], name='appt_dom_employee_status_idx'),
+            models.Index(fields=['client', 'status'], name='appt_dom_client_status_idx'),
+            models.Index(fields=['created_at'], name='appt_dom_created_at_idx'),
+            # المواعيد قيد الانتظار القريبة (wash.geo.nearest)
+            models.Index(fields=['grid_cell'], condition=models.Q(status='Pending'), name='appt_dom_pending_cell_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # نحتفظ بالحالة كما قُرئت من قاعدة البيانات لمعرفة تغيّرها عند الحفظ
+        instance._loaded_status = instance.__dict__.get('status')
+        # القيم الخام فقط: الفئة نفسها لا تُحسب إلا عند الحفظ أو الحذف
+        instance._loaded_stats_values = instance.stats_values()
+        return instance
+
+    STATS_FIELDS = ('created_at', 'status', 'wash_type', 'price', 'extern_employee_id')
+
+    def stats_values(self):
+        """The loaded fields stats_bucket() is derived from"""
+        values = self.__dict__
+        return {name: values[name] for name in self.STATS_FIELDS if name in values}
+
+    def stats_bucket(self, values=None):
+        """(day, status, wash_type, price, employee) used by AppointmentDailyStat, from values (by default the current fields)"""
+        values = self.__dict__ if values is None else values
+        if any(values.get(name) is None for name in ('created_at', 'status', 'wash_type', 'price')):
+            return None
+        if 'extern_employee_id' not in values:
+            return None
+        return (
+            timezone.localdate(values['created_at']), values['status'], values['wash_type'],
+            Decimal(str(values['price'])), values['extern_employee_id'] or AppointmentDailyStat.NO_EMPLOYEE,
+        )
+
+    def loaded_stats_bucket(self):
+        """The bucket as last loaded or saved, None for a new appointment"""
+        loaded = getattr(self, '_loaded_stats_values', None)
+        return None if loaded is None else self.stats_bucket(loaded)
+
+    def update_grid_cell(self):
+        self.grid_cell = geo.grid_cell(self.latitude, self.longitude)
 
-        # إذا كان الموعد مكتملًا، نقوم بتحديث السجل التاريخي للموظف الخارجي
-        if self.status == "Completed" and self.extern_employee:
-            history, created = ExternEmployeeHistory.objects.get_or_create(
-                extern_employee=self.extern_employee,
-                client=self.client,
-                appointment=self
-            )
-            history.cars_washed += 1
-            history.save()
+    def save(self, *args, **kwargs):
+        previous_status = getattr(self, '_loaded_status', None)
+        self.update_grid_cell()
+        if kwargs.get('update_fields') is not None and {'latitude', 'longitude'} & set(kwargs['update_fields']):
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'grid_cell'}
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            AppointmentDailyStat.record_change('domicile', self.loaded_stats_bucket(), self.stats_bucket())
+
+            # عند اكتمال الموعد فقط (وليس عند كل حفظ) نسجّله في تاريخ الموظف الخارجي
+            if self.status == "Completed" and previous_status != "Completed" and self.extern_employee_id:
+                ExternEmployeeHistory.record_completed([(self, self.extern_employee_id)])
+            # وإن خرج من حالة الاكتمال نحذف سجله حتى لا يبقى محسوبًا في المجاميع
+            elif previous_status == "Completed" and self.status != "Completed":
+                ExternEmployeeHistory.record_uncompleted([self.id])
+
+        self._loaded_status = self.status
+        self._loaded_stats_values = self.stats_values()
 
     def __str__(self):
         return f"{self.car_name} ({self.status})"
@@ -132,44 +235,219 @@ class AppointmentLocation(models.Model):
     wash_type = models.CharField(max_length=50)
     client = models.ForeignKey(Client, on_delete=models.CASCADE)
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    # intern_employee = models.ForeignKey(InternEmployee, on_delete=models.SET_NULL, null=True, blank=True)
+    # الموظف الداخلي الذي يتكفل بالموعد (يُسجَّل له عند الاكتمال)
+    intern_employee = models.ForeignKey(InternEmployee, on_delete=models.SET_NULL, null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'status'], name='appt_loc_date_status_idx'),
+            models.Index(fields=['client', 'status'], name='appt_loc_client_status_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_stats_values = instance.stats_values()
+        return instance
+
+    STATS_FIELDS = ('date', 'status', 'wash_type', 'price')
+
+    def stats_values(self):
+        """The loaded fields stats_bucket() is derived from"""
+        values = self.__dict__
+        return {name: values[name] for name in self.STATS_FIELDS if name in values}
+
+    def stats_bucket(self, values=None):
+        """(day, status, wash_type, price, employee) used by AppointmentDailyStat, from values (by default the current fields)"""
+        values = self.__dict__ if values is None else values
+        if any(values.get(name) is None for name in self.STATS_FIELDS):
+            return None
+        return (
+            values['date'], values['status'], values['wash_type'], Decimal(str(values['price'])),
+            AppointmentDailyStat.NO_EMPLOYEE,
+        )
+
+    def loaded_stats_bucket(self):
+        """The bucket as last loaded or saved, None for a new appointment"""
+        loaded = getattr(self, '_loaded_stats_values', None)
+        return None if loaded is None else self.stats_bucket(loaded)
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
+        previous_status = getattr(self, '_loaded_status', None)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            AppointmentDailyStat.record_change('location', self.loaded_stats_bucket(), self.stats_bucket())
 
-        # إذا كان الموعد مكتملًا، نقوم بتحديث السجل التاريخي للموظف الداخلي
-        if self.status == "Completed":
-            intern_employee = InternEmployee.objects.first()  # تحتاج إلى تعيين الموظف الصحيح هنا
-            history, created = InternEmployeeHistory.objects.get_or_create(
-                intern_employee=intern_employee,
-                client=self.client,
-                appointment=self
-            )
-            history.cars_washed += 1
-            history.save()
+            # عند اكتمال الموعد فقط نسجّله في تاريخ الموظف الداخلي المكلّف به
+            if self.status == "Completed" and previous_status != "Completed" and self.intern_employee_id:
+                InternEmployeeHistory.record_completed([(self, self.intern_employee_id)])
+            elif previous_status == "Completed" and self.status != "Completed":
+                InternEmployeeHistory.record_uncompleted([self.id])
+
+        self._loaded_status = self.status
+        self._loaded_stats_values = self.stats_values()
 
     def __str__(self):
         return f"{self.car_name} ({self.status})"
 
 
+# إحصائيات المواعيد اليومية المجمّعة (تُحدَّث مع كل تغيير في حالة الموعد)
+class AppointmentDailyStat(models.Model):
+    CHANNEL_CHOICES = [
+        ('domicile', 'Domicile'),
+        ('location', 'Location'),
+    ]
+
+    day = models.DateField()
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    status = models.CharField(max_length=20)
+    wash_type = models.CharField(max_length=50)
+    # معرّف الموظف الخارجي حتى نعدّ الموظفين النشطين في اليوم، و 0 إن لم يوجد (مواعيد الموقع أو غير المحجوزة)
+    employee = models.IntegerField(default=0)
+    count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    NO_EMPLOYEE = 0
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'channel', 'status', 'wash_type', 'employee'], name='unique_daily_stat_bucket'
+            ),
+        ]
+
+    @classmethod
+    def record_change(cls, channel, old_bucket, new_bucket):
+        """
+        Move one appointment from its old (day, status, wash_type, price, employee) bucket to the new one.
+        Called inside the appointment's save transaction.
+        """
+        if old_bucket == new_bucket:
+            return
+        if old_bucket is not None:
+            cls.add_to_bucket(channel, old_bucket, -1)
+        if new_bucket is not None:
+            cls.add_to_bucket(channel, new_bucket, 1)
+
+    @classmethod
+    def add_to_bucket(cls, channel, bucket, count, revenue=None):
+        day, status, wash_type, price, employee = bucket
+        if revenue is None:
+            revenue = price * count
+        key = dict(day=day, channel=channel, status=status, wash_type=wash_type, employee=employee)
+
+        updated = cls.objects.filter(**key).update(count=F('count') + count, revenue=F('revenue') + revenue)
+        if updated:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(count=count, revenue=revenue, **key)
+        except IntegrityError:
+            # Another transaction created the bucket first
+            cls.objects.filter(**key).update(count=F('count') + count, revenue=F('revenue') + revenue)
+
+    @classmethod
+    def unassign_employee(cls, employee_id):
+        """
+        A deleted employee's appointments are set to NULL by the foreign key
+        (no save() involved): move their buckets to NO_EMPLOYEE as well.
+        """
+        with transaction.atomic():
+            rows = list(cls.objects.filter(employee=employee_id))
+            for row in rows:
+                cls.add_to_bucket(
+                    row.channel, (row.day, row.status, row.wash_type, None, cls.NO_EMPLOYEE), row.count, row.revenue
+                )
+            cls.objects.filter(pk__in=[row.pk for row in rows]).delete()
+
+    def __str__(self):
+        return f"{self.day} {self.channel} {self.status} {self.wash_type}: {self.count}"
+
+
+class EmployeeHistoryMixin:
+    """
+    Bookkeeping shared by the employee history tables: one row per completed
+    appointment, summarized in the employee's total_cars_washed / total_clients.
+    """
+    employee_field = None
+
+    @classmethod
+    def record_completed(cls, rows):
+        """
+        rows: [(appointment, employee_id)] that just moved to Completed.
+        One upsert keyed on the appointment (completing it again never counts
+        it twice), then the counters of the employees involved are refreshed.
+        """
+        rows = [(appointment, employee_id) for appointment, employee_id in rows if employee_id]
+        if not rows:
+            return
+        employee_id_field = f'{cls.employee_field}_id'
+        # The appointment may have been credited to someone else before
+        employee_ids = set(
+            cls.objects.filter(appointment_id__in=[appointment.id for appointment, _ in rows])
+            .values_list(employee_id_field, flat=True)
+        )
+        completed_at = timezone.now()
+        cls.objects.bulk_create(
+            [
+                cls(**{employee_id_field: employee_id}, client_id=appointment.client_id,
+                    appointment_id=appointment.id, cars_washed=1, completed_at=completed_at)
+                for appointment, employee_id in rows
+            ],
+            update_conflicts=True,
+            unique_fields=['appointment'],
+            update_fields=[cls.employee_field, 'client', 'completed_at'],
+        )
+        employee_ids.update(employee_id for _, employee_id in rows)
+        refresh_employee_counters(cls, cls.employee_field, employee_ids)
+
+    @classmethod
+    def record_uncompleted(cls, appointment_ids):
+        """
+        The appointments left Completed (back to In Progress, or Deleted): drop
+        their history rows. The post_delete receiver (signals.py) refreshes the
+        employees' counters.
+        """
+        if appointment_ids:
+            cls.objects.filter(appointment_id__in=appointment_ids).delete()
+
+
 # 🟢 **جدول تاريخ الموظف الخارجي (ExternEmployee History)**
-class ExternEmployeeHistory(models.Model):
+class ExternEmployeeHistory(EmployeeHistoryMixin, models.Model):
     extern_employee = models.ForeignKey(ExternEmployee, on_delete=models.CASCADE)
     client = models.ForeignKey(Client, on_delete=models.CASCADE)
     cars_washed = models.IntegerField(default=0)
     appointment = models.ForeignKey(AppointmentDomicile, on_delete=models.CASCADE)
+    completed_at = models.DateTimeField(default=timezone.now)
+
+    employee_field = 'extern_employee'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['appointment'], name='unique_extern_history_appointment'),
+        ]
 
     def __str__(self):
         return f"{self.extern_employee.full_name} - {self.client.full_name} ({self.cars_washed} cars)"
 
 
 # 🟢 **جدول تاريخ الموظف الداخلي (InternEmployee History)**
-class InternEmployeeHistory(models.Model):
+class InternEmployeeHistory(EmployeeHistoryMixin, models.Model):
     intern_employee = models.ForeignKey(InternEmployee, on_delete=models.CASCADE)
     client = models.ForeignKey(Client, on_delete=models.CASCADE)
     cars_washed = models.IntegerField(default=0)
     appointment = models.ForeignKey(AppointmentLocation, on_delete=models.CASCADE)
+    completed_at = models.DateTimeField(default=timezone.now)
+
+    employee_field = 'intern_employee'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['appointment'], name='unique_intern_history_appointment'),
+        ]
 
     def __str__(self):
         return f"{self.intern_employee.full_name} - {self.client.full_name} ({self.cars_washed} cars)"
@@ -183,11 +461,133 @@ class Feedback(models.Model):
     email = models.EmailField()
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     rating = models.IntegerField()
     approved = models.BooleanField(default=False)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_counts = instance.counter_values()
+        return instance
+
+    def counter_values(self):
+        """What this row adds to FeedbackCounter: (total, approved, rating_sum)"""
+        values = self.__dict__
+        if values.get('approved') is None or values.get('rating') is None:
+            return None
+        return (1, int(self.approved), self.rating)
+
+    def save(self, *args, **kwargs):
+        # إضافة الرأي الجديد أو فرق التعديل إلى العدادات في نفس المعاملة
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            FeedbackCounter.record_change(getattr(self, '_loaded_counts', None), self.counter_values())
+        self._loaded_counts = self.counter_values()
+
     def __str__(self):
         return f"{self.name} - {self.rating}"
     
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # Django يكتب approved=True على شكل WHERE "approved"، لذلك نستعمل فهرسا جزئيا
+            models.Index(fields=['created_at'], condition=models.Q(approved=True), name='feedback_approved_created_idx'),
+        ]
+
+
+# عدّادات الآراء (صف واحد) حتى يكون ملخص الآراء قراءة واحدة
+class FeedbackCounter(models.Model):
+    total = models.IntegerField(default=0)
+    approved = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+
+    SINGLETON_ID = 1
+
+    @classmethod
+    def compute(cls):
+        """Single-pass conditional aggregate over the Feedback table."""
+        totals = Feedback.objects.aggregate(
+            total=models.Count('id'),
+            approved=models.Count('id', filter=models.Q(approved=True)),
+            rating_sum=models.Sum('rating'),
+        )
+        totals['rating_sum'] = totals['rating_sum'] or 0
+        return totals
+
+    @classmethod
+    def get_counts(cls):
+        counts = cls.objects.filter(pk=cls.SINGLETON_ID).values('total', 'approved', 'rating_sum').first()
+        if counts is None:
+            counts = cls.compute()
+            cls.objects.get_or_create(pk=cls.SINGLETON_ID, defaults=counts)
+        return counts
+
+    @classmethod
+    def apply(cls, total=0, approved=0, rating_sum=0):
+        """
+        Add deltas to the counters. Call it in the same transaction as the
+        Feedback change; if the row doesn't exist yet it is seeded from the table.
+        """
+        updated = cls.objects.filter(pk=cls.SINGLETON_ID).update(
+            total=F('total') + total,
+            approved=F('approved') + approved,
+            rating_sum=F('rating_sum') + rating_sum,
+        )
+        if not updated:
+            cls.objects.get_or_create(pk=cls.SINGLETON_ID, defaults=cls.compute())
+
+    @classmethod
+    def record_change(cls, old_values, new_values):
+        """Apply the difference between a feedback row's old and new counter_values()"""
+        if old_values == new_values:
+            return
+        old_values = old_values or (0, 0, 0)
+        new_values = new_values or (0, 0, 0)
+        total, approved, rating_sum = (new - old for old, new in zip(old_values, new_values))
+        cls.apply(total=total, approved=approved, rating_sum=rating_sum)
+
+    @classmethod
+    def rebuild(cls):
+        """Recompute the row from the Feedback table. Returns (old counts or None, new counts)"""
+        with transaction.atomic():
+            old = (
+                cls.objects.select_for_update().filter(pk=cls.SINGLETON_ID)
+                .values('total', 'approved', 'rating_sum').first()
+            )
+            counts = cls.compute()
+            cls.objects.update_or_create(pk=cls.SINGLETON_ID, defaults=counts)
+        return old, counts
+
+    def __str__(self):
+        return f"{self.total} feedback ({self.approved} approved)"
+
+
+
+# ترتيب الموظفين الخارجيين، يُعاد حسابه دوريًا (refresh_leaderboard) حتى تكون القراءة استعلامًا واحدًا
+class LeaderboardEntry(models.Model):
+    METRIC_CHOICES = [
+        ('rating', 'Rating'),
+        ('week', 'Cars washed this week'),
+        ('month', 'Cars washed this month'),
+        ('completion', 'Completion rate'),
+    ]
+
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    extern_employee = models.ForeignKey(ExternEmployee, on_delete=models.CASCADE)
+    # Copied so a page of the leaderboard needs no join
+    full_name = models.CharField(max_length=255)
+    rank = models.IntegerField()
+    value = models.FloatField()
+    out_of = models.IntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'rank'], name='unique_leaderboard_rank'),
+            # Also the index of the per-employee lookup
+            models.UniqueConstraint(fields=['extern_employee', 'metric'], name='unique_leaderboard_employee_metric'),
+        ]
+
+    def __str__(self):
+        return f"{self.metric} #{self.rank}: {self.full_name} ({self.value})"
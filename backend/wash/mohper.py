@@ -15,9 +15,9 @@ class IsClient(BasePermission):
         if isinstance(request.user, Client):
             return True
             
-        # Check if this is a User with user_type attribute set to 'client'
-        if hasattr(request.user, 'user_type') and request.user.user_type == 'client':
-            return True
+        # Users resolved from our tokens carry their role, no need to query
+        if hasattr(request.user, 'user_type'):
+            return request.user.user_type == 'client'
             
         # If we reach here, try to match by email
         try:
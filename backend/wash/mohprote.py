@@ -1,7 +1,7 @@
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .authoo import CustomJWTAuthentication
+from .authoo import CustomJWTAuthentication, ClaimsJWTAuthentication
 
 from .mohper import IsClient, IsExternEmployee, IsInternEmployee, IsAdmin
 @api_view(['GET'])
@@ -24,7 +24,7 @@ def get_current_user(request):
     return Response(user_data)
 
 @api_view(['GET'])
-@authentication_classes([CustomJWTAuthentication])
+@authentication_classes([ClaimsJWTAuthentication])
 @permission_classes([IsClient])
 def client_only_view(request):
     """
@@ -33,7 +33,7 @@ def client_only_view(request):
     return Response({"message": "You are authenticated as a client", "user_id": request.user.id})
 
 @api_view(['GET'])
-@authentication_classes([CustomJWTAuthentication])
+@authentication_classes([ClaimsJWTAuthentication])
 @permission_classes([IsExternEmployee])
 def extern_employee_only_view(request):
     """
@@ -42,7 +42,7 @@ def extern_employee_only_view(request):
     return Response({"message": "You are authenticated as an external employee", "user_id": request.user.id})
 
 @api_view(['GET'])
-@authentication_classes([CustomJWTAuthentication])
+@authentication_classes([ClaimsJWTAuthentication])
 @permission_classes([IsInternEmployee])
 def intern_employee_only_view(request):
     """
@@ -52,7 +52,7 @@ def intern_employee_only_view(request):
 
 
 @api_view(['GET'])
-@authentication_classes([CustomJWTAuthentication])
+@authentication_classes([ClaimsJWTAuthentication])
 @permission_classes([IsAdmin])
 def admin_only_view(request):
     """
@@ -0,0 +1,219 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponse
+from django.utils.dateparse import parse_datetime
+from rest_framework.response import Response
+
+from . import conditional
+from .renderers import ORJSONRenderer
+
+
+# ترتيب افتراضي ثابت حسب المعرف
+ID_ORDERING = ('id',)
+# ترتيب الآراء: الأحدث أولاً ثم المعرف لكسر التعادل
+CREATED_AT_ORDERING = ('-created_at', '-id')
+
+
+class PaginationError(Exception):
+    pass
+
+
+def get_pagination_settings():
+    defaults = {
+        'PAGE_SIZE': 50,
+        'MAX_PAGE_SIZE': 500,
+        'LEGACY_UNPAGINATED': False,
+    }
+    defaults.update(getattr(settings, 'WASH_PAGINATION', {}))
+    return defaults
+
+
+def get_page_params(query_params):
+    """
+    Read page_size / cursor from the query string.
+    Returns None when the caller should get the legacy unpaginated list.
+    """
+    config = get_pagination_settings()
+    raw_size = query_params.get('page_size')
+    cursor = query_params.get('cursor')
+
+    if raw_size is None and cursor is None:
+        # The unpaginated shape is only kept when explicitly enabled
+        if config['LEGACY_UNPAGINATED'] or query_params.get('paginate') == 'false':
+            return None
+
+    page_size = config['PAGE_SIZE']
+    if raw_size is not None:
+        try:
+            page_size = int(raw_size)
+        except ValueError:
+            raise PaginationError("حجم الصفحة غير صالح")
+        if page_size < 1:
+            raise PaginationError("حجم الصفحة غير صالح")
+        page_size = min(page_size, config['MAX_PAGE_SIZE'])
+
+    return page_size, decode_cursor(cursor) if cursor else None
+
+
+def encode_cursor(values):
+    payload = json.dumps([v.isoformat() if hasattr(v, 'isoformat') else v for v in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise PaginationError("مؤشر الصفحة غير صالح")
+    if not isinstance(values, list):
+        raise PaginationError("مؤشر الصفحة غير صالح")
+    return values
+
+
+def _cursor_filter(ordering, values):
+    """
+    Build the keyset condition "rows strictly after the cursor" for the given ordering,
+    e.g. for ('-created_at', '-id'): created_at < c OR (created_at = c AND id < i)
+    """
+    if len(values) != len(ordering):
+        raise PaginationError("مؤشر الصفحة غير صالح")
+
+    condition = Q()
+    equal_so_far = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        if name == 'created_at':
+            try:
+                value = parse_datetime(value) if isinstance(value, str) else None
+            except ValueError:
+                value = None
+        elif not isinstance(value, int) or isinstance(value, bool):
+            value = None
+        if value is None:
+            raise PaginationError("مؤشر الصفحة غير صالح")
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal_so_far & Q(**{f'{name}__{lookup}': value})
+        equal_so_far &= Q(**{name: value})
+    return condition
+
+
+def keyset_queryset(queryset, ordering, page_params):
+    """
+    Apply ordering, cursor condition and limit (page_size + 1 to detect a next page)
+    """
+    page_size, cursor = page_params
+    queryset = queryset.order_by(*ordering)
+    if cursor is not None:
+        queryset = queryset.filter(_cursor_filter(ordering, cursor))
+    return queryset[:page_size + 1]
+
+
+def build_page(rows, data, ordering, page_size):
+    """
+    rows: the fetched objects or value dicts (page_size + 1 at most),
+    data: the serialized form of the first page_size rows
+    """
+    next_cursor = None
+    if len(rows) > page_size:
+        last = rows[page_size - 1]
+        next_cursor = encode_cursor([
+            last[f.lstrip('-')] if isinstance(last, dict) else getattr(last, f.lstrip('-'))
+            for f in ordering
+        ])
+    return {'results': data, 'next': next_cursor}
+
+
+def _validator_queryset(params, queryset, ordering):
+    """
+    The rows the response is built from: the requested page and its look-ahead
+    row when paginating (their validators ignore the other pages), the whole
+    queryset otherwise. None when the request fails with 400 anyway.
+    """
+    try:
+        page_params = get_page_params(params)
+        if page_params is None:
+            return queryset
+        return keyset_queryset(queryset, ordering, page_params)
+    except PaginationError:
+        return None
+
+
+def paginated_response(request, queryset, serializer_class, ordering=ID_ORDERING, cache_policy=None):
+    """
+    Serialize a list endpoint with opt-in keyset pagination.
+    ?page_size=N starts paginating, ?cursor=<next> fetches the following page.
+    With a cache_policy (wash/conditional.py) the list answers 304 when unchanged.
+    """
+    validators = None
+    validator_queryset = _validator_queryset(request.query_params, queryset, ordering) if cache_policy else None
+    if validator_queryset is not None:
+        validators = conditional.get_validators(request, validator_queryset, cache_policy)
+        cached = conditional.not_modified(request, validators, cache_policy)
+        if cached is not None:
+            return cached
+
+    response = _paginated_response(request, queryset, serializer_class, ordering)
+    if validators is not None and response.status_code == 200:
+        conditional.add_headers(response, validators, cache_policy)
+    return response
+
+
+def _paginated_response(request, queryset, serializer_class, ordering):
+    try:
+        page_params = get_page_params(request.query_params)
+        if page_params is None:
+            return Response(serializer_class(queryset, many=True).data)
+
+        rows = list(keyset_queryset(queryset, ordering, page_params))
+    except PaginationError as e:
+        return Response({"error": str(e)}, status=400)
+
+    page_size = page_params[0]
+    data = serializer_class(rows[:page_size], many=True).data
+    return Response(build_page(rows, data, ordering, page_size))
+
+
+def json_response(data, status=200):
+    """Plain Django response rendered like DRF's Response (for the async views)"""
+    return HttpResponse(ORJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+async def apaginated_response(request, queryset, serializer_class, ordering=ID_ORDERING, cache_policy=None):
+    """
+    Async counterpart of paginated_response for plain async Django views.
+    Related objects the serializer reads must be loaded with select_related
+    (or the rows projected with values(), see projections.py).
+    """
+    validators = None
+    validator_queryset = _validator_queryset(request.GET, queryset, ordering) if cache_policy else None
+    if validator_queryset is not None:
+        validators = await conditional.aget_validators(request, validator_queryset, cache_policy)
+        cached = conditional.not_modified(request, validators, cache_policy)
+        if cached is not None:
+            return cached
+
+    response = await _apaginated_response(request, queryset, serializer_class, ordering)
+    if validators is not None and response.status_code == 200:
+        conditional.add_headers(response, validators, cache_policy)
+    return response
+
+
+async def _apaginated_response(request, queryset, serializer_class, ordering):
+    try:
+        page_params = get_page_params(request.GET)
+        if page_params is None:
+            rows = [row async for row in queryset]
+            return json_response(serializer_class(rows, many=True).data)
+
+        rows = [row async for row in keyset_queryset(queryset, ordering, page_params)]
+    except PaginationError as e:
+        return json_response({"error": str(e)}, status=400)
+
+    page_size = page_params[0]
+    data = serializer_class(rows[:page_size], many=True).data
+    return json_response(build_page(rows, data, ordering, page_size))
+
@@ -0,0 +1,120 @@
+"""
+Read-only fast path for the appointment list endpoints: the same JSON as
+AppointmentDomicileWithClientSerializer / AppointmentLocationWithClientSerializer,
+built from one values() query joined to the client, without model instances
+or nested serializers. Keep the field order and formats in sync with them
+(tests.ProjectionParityTests checks it).
+"""
+from rest_framework import serializers
+
+from .images import variant_urls_for_name
+from .models import AppointmentDomicile, AppointmentLocation, Client
+
+CLIENT_VALUES = (
+    'client__full_name', 'client__email', 'client__phone', 'client__age', 'client__photo',
+    'client__photo_variants_manifest',
+)
+DOMICILE_VALUES = (
+    'id', 'time', 'car_type', 'car_name', 'wash_type', 'place', 'latitude', 'longitude', 'price', 'status',
+    'client_id', 'extern_employee_id',
+) + CLIENT_VALUES
+LOCATION_VALUES = (
+    'id', 'date', 'time', 'car_type', 'car_name', 'wash_type', 'price', 'status', 'client_id',
+) + CLIENT_VALUES
+
+
+def _decimal_field(model):
+    field = model._meta.get_field('price')
+    return serializers.DecimalField(max_digits=field.max_digits, decimal_places=field.decimal_places)
+
+
+# DRF's own formatting (quantize + string) for the prices
+_domicile_price = _decimal_field(AppointmentDomicile)
+_location_price = _decimal_field(AppointmentLocation)
+_photo_storage = Client._meta.get_field('photo').storage
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def _float(value):
+    return float(value) if value is not None else None
+
+
+def _client_info(row, request):
+    photo = row['client__photo']
+    photo_url = None
+    if photo:
+        photo_url = _photo_storage.url(photo)
+        if request is not None:
+            photo_url = request.build_absolute_uri(photo_url)
+    return {
+        'id': row['client_id'],
+        'full_name': row['client__full_name'],
+        'email': row['client__email'],
+        'phone': row['client__phone'],
+        'age': row['client__age'],
+        'photo': photo_url,
+        'photo_variants': variant_urls_for_name(_photo_storage, photo, row['client__photo_variants_manifest'], request),
+    }
+
+
+def project_domicile(queryset):
+    return queryset.values(*DOMICILE_VALUES)
+
+
+def project_location(queryset):
+    return queryset.values(*LOCATION_VALUES)
+
+
+class _Projection:
+    """Serializer-like wrapper so the pagination helpers can use it as serializer_class"""
+    def __init__(self, rows, many=True, context=None):
+        self.rows = rows
+        self.request = (context or {}).get('request')
+
+    @property
+    def data(self):
+        # A client usually has many appointments: build its client_info once
+        self._client_infos = {}
+        return [self.to_representation(row) for row in self.rows]
+
+    def client_info(self, row):
+        info = self._client_infos.get(row['client_id'])
+        if info is None:
+            info = self._client_infos[row['client_id']] = _client_info(row, self.request)
+        return info
+
+
+class AppointmentDomicileWithClientProjection(_Projection):
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'time': _iso(row['time']),
+            'car_type': row['car_type'],
+            'car_name': row['car_name'],
+            'wash_type': row['wash_type'],
+            'place': row['place'],
+            'latitude': _float(row['latitude']),
+            'longitude': _float(row['longitude']),
+            'price': _domicile_price.to_representation(row['price']),
+            'status': row['status'],
+            'client_info': self.client_info(row),
+            'extern_employee': row['extern_employee_id'],
+        }
+
+
+class AppointmentLocationWithClientProjection(_Projection):
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'date': _iso(row['date']),
+            'time': _iso(row['time']),
+            'car_type': row['car_type'],
+            'car_name': row['car_name'],
+            'wash_type': row['wash_type'],
+            'price': _location_price.to_representation(row['price']),
+            'status': row['status'],
+            'client_info': self.client_info(row),
+        }
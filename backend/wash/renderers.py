@@ -0,0 +1,45 @@
+from rest_framework.utils import encoders
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # the stock json module is used instead
+    orjson = None
+
+
+# DRF's encoder for what orjson doesn't handle natively (Decimal as a number, lazy strings...)
+_encoder = encoders.JSONEncoder()
+
+if orjson is not None:
+    # Datetimes go through the DRF encoder too ("Z" suffix, same precision)
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer output (compact, UTF-8 without escapes, \\u2028/\\u2029 escaped)
+    produced by orjson. Pretty-printing (indent) and anything orjson refuses
+    (e.g. integers over 64 bits) fall back to the stock renderer.
+
+    Two differences with JSONRenderer: NaN and +/-Infinity render as null where
+    the stock renderer (STRICT_JSON) raises ValueError, and some floats are
+    spelled differently (1e20 instead of 1e+20) for the same value.
+    """
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=_encoder.default, option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same JavaScript-safe escaping as JSONRenderer
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
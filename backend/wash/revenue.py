@@ -0,0 +1,114 @@
+import datetime
+from decimal import Decimal
+
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import AppointmentDomicile, AppointmentLocation, AppointmentDailyStat
+
+TRUNC_FUNCTIONS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+BREAKDOWNS = ('wash_type', 'car_type')
+CHANNELS = ('domicile', 'location')
+# أقصى عدد من النقاط في السلسلة الواحدة
+MAX_PERIODS = 400
+CENTS = Decimal('0.01')
+
+
+def period_start(day, bucket):
+    if bucket == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def count_periods(date_from, date_to, bucket):
+    """Number of periods iter_periods yields, without walking the range"""
+    if bucket == 'day':
+        return (date_to - date_from).days + 1
+    if bucket == 'week':
+        return (period_start(date_to, bucket) - period_start(date_from, bucket)).days // 7 + 1
+    return (date_to.year - date_from.year) * 12 + date_to.month - date_from.month + 1
+
+
+def iter_periods(date_from, date_to, bucket):
+    # Computed from the first period rather than stepped past the last one, so a
+    # range ending near date.max doesn't overflow
+    first = period_start(date_from, bucket)
+    for index in range(count_periods(date_from, date_to, bucket)):
+        if bucket == 'day':
+            yield first + datetime.timedelta(days=index)
+        elif bucket == 'week':
+            yield first + datetime.timedelta(weeks=index)
+        else:
+            year, month = divmod(first.month - 1 + index, 12)
+            yield first.replace(year=first.year + year, month=month + 1)
+
+
+def _completed_rows(channel, date_from, date_to, bucket, breakdown):
+    """
+    One grouped query per channel: completed revenue and count per period (and per breakdown value).
+    car_type is not in the rollup, so that breakdown groups the appointments table directly.
+    """
+    trunc = TRUNC_FUNCTIONS[bucket]
+    group_by = ['period'] + ([breakdown] if breakdown else [])
+
+    if breakdown != 'car_type':
+        queryset = AppointmentDailyStat.objects.filter(
+            channel=channel, status='Completed', day__gte=date_from, day__lte=date_to
+        ).annotate(period=trunc('day', output_field=DateField()))
+        totals = dict(total=Sum('revenue'), count=Sum('count'))
+    elif channel == 'location':
+        queryset = AppointmentLocation.objects.filter(
+            status='Completed', date__gte=date_from, date__lte=date_to
+        ).annotate(period=trunc('date', output_field=DateField()))
+        totals = dict(total=Sum('price'), count=Count('id'))
+    else:
+        start = timezone.make_aware(datetime.datetime.combine(date_from, datetime.time.min))
+        end = timezone.make_aware(datetime.datetime.combine(date_to + datetime.timedelta(days=1), datetime.time.min))
+        queryset = AppointmentDomicile.objects.filter(
+            status='Completed', created_at__gte=start, created_at__lt=end
+        ).annotate(period=trunc('created_at', output_field=DateField()))
+        totals = dict(total=Sum('price'), count=Count('id'))
+
+    return queryset.values(*group_by).annotate(**totals).order_by(*group_by)
+
+
+def _money(value):
+    # Sums come back as Decimal; keep them Decimal and send them as strings
+    return str(Decimal(value or 0).quantize(CENTS))
+
+
+def revenue_series(channel, date_from, date_to, bucket, breakdown=None):
+    points = {
+        period: {'total': Decimal('0'), 'count': 0, 'breakdown': {}}
+        for period in iter_periods(date_from, date_to, bucket)
+    }
+    for row in _completed_rows(channel, date_from, date_to, bucket, breakdown):
+        if not row['count']:
+            continue
+        point = points[row['period']]
+        point['total'] += row['total'] or 0
+        point['count'] += row['count']
+        if breakdown:
+            point['breakdown'][row[breakdown]] = {
+                'total_revenue': _money(row['total']),
+                'appointment_count': row['count'],
+            }
+
+    series = []
+    for period, point in points.items():
+        item = {
+            'period': period.strftime('%Y-%m-%d'),
+            'total_revenue': _money(point['total']),
+            'appointment_count': point['count'],
+        }
+        if breakdown:
+            item['breakdown'] = point['breakdown']
+        series.append(item)
+    return series
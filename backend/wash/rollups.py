@@ -0,0 +1,145 @@
+import datetime
+
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+
+def rebuild_daily_stats(AppointmentDomicile, AppointmentLocation, AppointmentDailyStat):
+    """
+    Recompute AppointmentDailyStat from scratch with one grouped query per channel.
+    Migrations 0013 and 0021 keep their own frozen copy of it.
+    """
+    # Appointments from before created_at existed have no day and are left out
+    domicile_rows = (
+        AppointmentDomicile.objects
+        .filter(created_at__isnull=False)
+        .annotate(day=TruncDate('created_at'))
+        .values('day', 'status', 'wash_type', 'extern_employee')
+        .annotate(count=Count('id'), revenue=Sum('price'))
+        .order_by()
+    )
+    location_rows = (
+        AppointmentLocation.objects
+        .values('date', 'status', 'wash_type')
+        .annotate(count=Count('id'), revenue=Sum('price'))
+        .order_by()
+    )
+
+    stats = [
+        AppointmentDailyStat(
+            day=row['day'], channel='domicile', status=row['status'], wash_type=row['wash_type'],
+            employee=row['extern_employee'] or 0, count=row['count'], revenue=row['revenue'] or 0,
+        )
+        for row in domicile_rows
+    ] + [
+        AppointmentDailyStat(
+            day=row['date'], channel='location', status=row['status'], wash_type=row['wash_type'],
+            count=row['count'], revenue=row['revenue'] or 0,
+        )
+        for row in location_rows
+    ]
+
+    with transaction.atomic():
+        AppointmentDailyStat.objects.all().delete()
+        AppointmentDailyStat.objects.bulk_create(stats, batch_size=500)
+    return len(stats)
+
+
+def refresh_employee_counters(History, employee_field, employee_ids=None):
+    """
+    Recompute total_cars_washed / total_clients of the given employees (all when None)
+    from their History rows, in one UPDATE with correlated subqueries.
+    Takes the History model of either employee kind; migration 0017 keeps its own frozen copy.
+    """
+    Employee = History._meta.get_field(employee_field).related_model
+    history = History.objects.filter(**{employee_field: OuterRef('pk')}).order_by().values(employee_field)
+    employees = Employee.objects.all() if employee_ids is None else Employee.objects.filter(pk__in=employee_ids)
+    return employees.update(
+        total_cars_washed=Coalesce(Subquery(history.annotate(total=Sum('cars_washed')).values('total')), 0),
+        total_clients=Coalesce(Subquery(history.annotate(total=Count('client', distinct=True)).values('total')), 0),
+    )
+
+
+def rebuild_employee_ratings(ExternEmployee, Rating):
+    """
+    Recompute rating_count / rating_sum / final_rating of every extern employee
+    from the Rating table with one grouped query. Returns (repaired, total).
+    Migration 0018 keeps its own frozen copy.
+    """
+    totals = {
+        row['extern_employee']: (row['count'], row['total'])
+        for row in Rating.objects.values('extern_employee').annotate(count=Count('id'), total=Sum('rating')).order_by()
+    }
+    employees = list(ExternEmployee.objects.only('rating_count', 'rating_sum', 'final_rating'))
+    drifted = []
+    for employee in employees:
+        count, total = totals.get(employee.pk, (0, 0))
+        final_rating = total / count if count else 0.0
+        if (employee.rating_count, employee.rating_sum, employee.final_rating) != (count, total, final_rating):
+            employee.rating_count, employee.rating_sum, employee.final_rating = count, total, final_rating
+            drifted.append(employee)
+
+    with transaction.atomic():
+        ExternEmployee.objects.bulk_update(drifted, ['rating_count', 'rating_sum', 'final_rating'], batch_size=500)
+    return len(drifted), len(employees)
+
+
+def leaderboard_periods(now):
+    """Start of the current week (Monday) and month, local time"""
+    today = timezone.localdate(now)
+    week = today - datetime.timedelta(days=today.weekday())
+    month = today.replace(day=1)
+    return tuple(
+        timezone.make_aware(datetime.datetime.combine(day, datetime.time.min)) for day in (week, month)
+    )
+
+
+def rebuild_leaderboard(ExternEmployee, ExternEmployeeHistory, AppointmentDomicile, LeaderboardEntry, now=None):
+    """
+    Rank every extern employee on each LeaderboardEntry metric with three grouped
+    queries, then replace the table in one transaction (readers see the old or
+    the new ranking, never a mix). Ties keep the employee id order.
+    """
+    now = now or timezone.now()
+    week_start, month_start = leaderboard_periods(now)
+    washed = {
+        row['extern_employee']: row
+        for row in ExternEmployeeHistory.objects.values('extern_employee').annotate(
+            week=Sum('cars_washed', filter=Q(completed_at__gte=week_start)),
+            month=Sum('cars_washed', filter=Q(completed_at__gte=month_start)),
+        ).order_by()
+    }
+    # Completed out of everything claimed (Pending ones have no employee)
+    appointments = {
+        row['extern_employee']: row
+        for row in AppointmentDomicile.objects.filter(extern_employee__isnull=False).values('extern_employee').annotate(
+            completed=Count('id', filter=Q(status='Completed')),
+            assigned=Count('id'),
+        ).order_by()
+    }
+    employees = list(ExternEmployee.objects.values_list('id', 'full_name', 'final_rating').order_by('id'))
+
+    values = {metric: [] for metric in ('rating', 'week', 'month', 'completion')}
+    for pk, full_name, final_rating in employees:
+        counts = washed.get(pk, {})
+        claimed = appointments.get(pk, {})
+        values['rating'].append((final_rating, pk, full_name))
+        values['week'].append((counts.get('week') or 0, pk, full_name))
+        values['month'].append((counts.get('month') or 0, pk, full_name))
+        rate = claimed['completed'] / claimed['assigned'] if claimed else 0.0
+        values['completion'].append((rate, pk, full_name))
+
+    entries = [
+        LeaderboardEntry(
+            metric=metric, extern_employee_id=pk, full_name=full_name, rank=rank,
+            value=value, out_of=len(employees), computed_at=now,
+        )
+        for metric, rows in values.items()
+        for rank, (value, pk, full_name) in enumerate(sorted(rows, key=lambda row: (-row[0], row[1])), start=1)
+    ]
+    with transaction.atomic():
+        LeaderboardEntry.objects.all().delete()
+        LeaderboardEntry.objects.bulk_create(entries, batch_size=500)
+    return len(employees)
@@ -0,0 +1,175 @@
+import contextlib
+import contextvars
+import functools
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+REPLICA = 'replica'
+
+# Cookie holding the time until which a client that just wrote reads from 'default'
+PIN_COOKIE = 'wash_primary_until'
+# The same value as a response header, for cross-origin clients (the Vite dev server)
+# that don't send cookies: they echo it back on their next requests
+PIN_HEADER = 'X-Wash-Primary-Until'
+
+
+class _RoutingState:
+    def __init__(self, pinned=False):
+        # Reads may go to the replica (set by replica_reads)
+        self.replica = False
+        self.wrote = False
+        # The client wrote recently (ReplicaPinMiddleware)
+        self.pinned = pinned
+
+
+# Set by ReplicaPinMiddleware (and replica_reads) for the duration of one request
+_routing = contextvars.ContextVar('wash_db_routing', default=None)
+
+
+def get_pin_seconds():
+    return getattr(settings, 'WASH_REPLICA', {}).get('PIN_SECONDS', 10)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+class ReplicaRouter:
+    """
+    Send reads to the 'replica' alias while a replica_reads view handles a safe
+    request, and everything else to 'default'. After the first write of the
+    request, or inside a transaction, reads stay on 'default' so the request
+    sees its own writes; a client that wrote in an earlier request is pinned
+    to 'default' for a while (ReplicaPinMiddleware), until the replica has
+    caught up.
+    """
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or not state.replica or state.wrote or state.pinned or not replica_configured():
+            return None
+        if connections['default'].in_atomic_block:
+            return None
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same data on both aliases
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of default (see the sync_replica command)
+        return db != REPLICA
+
+
+@contextlib.contextmanager
+def _replica_routing(request):
+    if request.method not in SAFE_METHODS:
+        yield
+        return
+    state = _routing.get()
+    if state is not None:
+        # Inside ReplicaPinMiddleware
+        previous = state.replica
+        state.replica = True
+        try:
+            yield
+        finally:
+            state.replica = previous
+        return
+    state = _RoutingState()
+    state.replica = True
+    token = _routing.set(state)
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+def replica_reads(view):
+    """
+    Route the ORM reads of a GET/HEAD/OPTIONS request to the replica.
+    Use it on admin/analytics views and read-only lists that can tolerate a
+    slightly stale copy. Works on DRF views and on async views: the ORM calls
+    of an async view run with its context (sync_to_async copies it).
+    """
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with _replica_routing(request):
+                return await view(request, *args, **kwargs)
+
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with _replica_routing(request):
+            return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaPinMiddleware:
+    """
+    Read-your-writes across requests: when a request writes to 'default', the
+    response sets a cookie that keeps the client's replica_reads views on
+    'default' for WASH_REPLICA['PIN_SECONDS'] (longer than the sync_replica
+    interval), so a GET right after a POST doesn't miss the write.
+    Cross-origin requests carry no cookie, so the pin is also sent in the
+    PIN_HEADER response header and honoured when the client sends it back
+    (frontend/src/api.ts). A forged pin only sends reads to 'default'.
+    """
+    sync_capable = True
+    # Don't push the async views (wash/async_views.py) onto a thread
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = _RoutingState(pinned=self.is_pinned(request))
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.pin(state, response)
+
+    async def __acall__(self, request):
+        state = _RoutingState(pinned=self.is_pinned(request))
+        token = _routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self.pin(state, response)
+
+    def pin(self, state, response):
+        if state.wrote and replica_configured():
+            pin_seconds = get_pin_seconds()
+            until = str(time.time() + pin_seconds)
+            response.set_cookie(PIN_COOKIE, until, max_age=pin_seconds, httponly=True, samesite='Lax')
+            response[PIN_HEADER] = until
+        return response
+
+    def is_pinned(self, request):
+        now = time.time()
+        for value in (request.headers.get(PIN_HEADER), request.COOKIES.get(PIN_COOKIE)):
+            try:
+                if value and float(value) > now:
+                    return True
+            except ValueError:
+                pass
+        return False
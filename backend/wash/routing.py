@@ -0,0 +1,229 @@
+"""
+Visiting order for an extern employee's In Progress appointments.
+
+The order is built by nearest neighbour and improved by 2-opt (reversing a
+segment of the route while that lowers its cost). The cost of an order is the
+distance driven plus a penalty per minute of lateness against each
+appointment's time: the employee drives at SPEED_KMH, waits when early and
+spends SERVICE_MINUTES at each stop. Appointments without coordinates can't be
+placed and come last, by time.
+
+Plans are cached per employee and reused as long as the appointments they were
+built from (and the start point) are unchanged.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from . import geo
+
+DEFAULTS = {
+    'SPEED_KMH': 30,
+    'SERVICE_MINUTES': 30,
+    # 1 minute late costs as much as LATE_KM_PER_MINUTE km of extra driving
+    'LATE_KM_PER_MINUTE': 1.0,
+    # 2-opt is O(n^3) with time windows; larger routes keep the nearest neighbour order
+    'MAX_TWO_OPT_STOPS': 40,
+    'CACHE_ENTRIES': 1024,
+}
+
+
+def get_route_settings():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'WASH_ROUTE', {}))
+    return config
+
+
+def minutes_of(value):
+    return value.hour * 60 + value.minute + value.second / 60
+
+
+def format_minutes(minutes):
+    minutes = int(round(minutes))
+    return f'{minutes // 60 % 24:02d}:{minutes % 60:02d}'
+
+
+class RoutePlanner:
+    """
+    stops: (id, latitude, longitude, minutes) tuples, all with coordinates.
+    start: optional (latitude, longitude) the employee leaves from.
+    depart: departure time in minutes; by default the employee reaches the
+    earliest appointment on time.
+    """
+    def __init__(self, stops, start=None, depart=None, config=None):
+        self.config = config or get_route_settings()
+        self.stops = stops
+        self.start = start
+        self.windows = [minutes for _, _, _, minutes in stops]
+        self.distances = [
+            [geo.haversine_km(a[1], a[2], b[1], b[2]) for b in stops] for a in stops
+        ]
+        self.from_start = [
+            geo.haversine_km(start[0], start[1], stop[1], stop[2]) if start else 0.0 for stop in stops
+        ]
+        if depart is None and stops:
+            # Leave just in time for the earliest appointment
+            first = min(range(len(stops)), key=lambda i: (self.windows[i], stops[i][0]))
+            depart = self.windows[first] - self.from_start[first] / self.config['SPEED_KMH'] * 60
+        self.depart = depart
+
+    def leg(self, previous, index):
+        return self.from_start[index] if previous is None else self.distances[previous][index]
+
+    def arrive(self, clock, distance, index):
+        """(time the stop starts, minutes late) when driving distance km from clock"""
+        arrival = clock + distance / self.config['SPEED_KMH'] * 60
+        begin = max(arrival, self.windows[index])
+        return begin, begin - self.windows[index]
+
+    def cost(self, order):
+        total = 0.0
+        clock = self.depart
+        previous = None
+        for index in order:
+            distance = self.leg(previous, index)
+            clock, late = self.arrive(clock, distance, index)
+            total += distance + late * self.config['LATE_KM_PER_MINUTE']
+            clock += self.config['SERVICE_MINUTES']
+            previous = index
+        return total
+
+    def nearest_neighbour(self):
+        """
+        Greedy order: next is the stop cheapest to add, counting the drive, the
+        lateness penalty and the wait (as the distance that could be driven
+        meanwhile), so a stop booked for the evening isn't visited first.
+        Without a start point the route begins at the earliest appointment.
+        """
+        remaining = set(range(len(self.stops)))
+        order = []
+        clock = self.depart
+        previous = None
+        if self.start is None and remaining:
+            previous = min(remaining, key=lambda i: (self.windows[i], self.stops[i][0]))
+            remaining.remove(previous)
+            order.append(previous)
+            clock = max(clock, self.windows[previous]) + self.config['SERVICE_MINUTES']
+        while remaining:
+            best = None
+            for index in remaining:
+                distance = self.leg(previous, index)
+                arrival = clock + distance / self.config['SPEED_KMH'] * 60
+                wait = max(0.0, self.windows[index] - arrival)
+                late = max(0.0, arrival - self.windows[index])
+                score = (
+                    distance + wait * self.config['SPEED_KMH'] / 60 + late * self.config['LATE_KM_PER_MINUTE'],
+                    self.stops[index][0],
+                )
+                if best is None or score < best[0]:
+                    best = (score, index)
+            index = best[1]
+            clock, _ = self.arrive(clock, self.leg(previous, index), index)
+            clock += self.config['SERVICE_MINUTES']
+            remaining.remove(index)
+            order.append(index)
+            previous = index
+        return order
+
+    def two_opt(self, order):
+        """Reverse order[i:j + 1] while that makes the route cheaper (first improvement)"""
+        best_cost = self.cost(order)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(len(order) - 1):
+                for j in range(i + 1, len(order)):
+                    candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                    candidate_cost = self.cost(candidate)
+                    # Ignore float noise so equal-cost reversals can't loop forever
+                    if candidate_cost < best_cost - 1e-9:
+                        order, best_cost = candidate, candidate_cost
+                        improved = True
+        return order
+
+    def plan(self):
+        order = self.nearest_neighbour()
+        if len(order) <= self.config['MAX_TWO_OPT_STOPS']:
+            order = self.two_opt(order)
+        legs = []
+        clock = self.depart
+        previous = None
+        covered = 0.0
+        for index in order:
+            distance = self.leg(previous, index)
+            clock, late = self.arrive(clock, distance, index)
+            covered += distance
+            legs.append({
+                'id': self.stops[index][0],
+                # No leg before the first stop when there is no start point
+                'leg_km': round(distance, 3) if previous is not None or self.start else None,
+                'cumulative_km': round(covered, 3),
+                'eta': format_minutes(clock),
+                'late_minutes': int(round(late)),
+            })
+            clock += self.config['SERVICE_MINUTES']
+            previous = index
+        return legs
+
+
+def plan_signature(appointments, start, depart):
+    """Changes whenever an appointment is added, removed or edited, or the start/departure differ"""
+    digest = hashlib.md5(repr((start, depart)).encode())
+    for appointment in sorted(appointments, key=lambda a: a.id):
+        digest.update(repr((
+            appointment.id, appointment.latitude, appointment.longitude,
+            appointment.time.isoformat(), appointment.updated_at.isoformat(),
+        )).encode())
+    return digest.hexdigest()
+
+
+def plan_route(appointments, start=None, depart=None, config=None):
+    """
+    The route over the appointments: one entry per appointment, in visiting
+    order, with the leg and cumulative distance and the estimated start time.
+    """
+    located = [a for a in appointments if a.latitude is not None and a.longitude is not None]
+    unlocated = sorted((a for a in appointments if a.latitude is None or a.longitude is None),
+                       key=lambda a: (a.time, a.id))
+    planner = RoutePlanner(
+        [(a.id, a.latitude, a.longitude, minutes_of(a.time)) for a in located], start, depart, config
+    )
+    legs = planner.plan()
+    total = legs[-1]['cumulative_km'] if legs else 0.0
+    for appointment in unlocated:
+        legs.append({'id': appointment.id, 'leg_km': None, 'cumulative_km': None, 'eta': None, 'late_minutes': None})
+    return {'total_km': total, 'stops': legs}
+
+
+class RoutePlanCache:
+    """Last plan of each employee, with the signature it was built for (LRU bounded)"""
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, employee_id, signature):
+        with self._lock:
+            entry = self._entries.get(employee_id)
+            if entry is None or entry[0] != signature:
+                return None
+            self._entries.move_to_end(employee_id)
+            return entry[1]
+
+    def set(self, employee_id, signature, plan):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[employee_id] = (signature, plan)
+            self._entries.move_to_end(employee_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+plan_cache = RoutePlanCache(max_entries=get_route_settings()['CACHE_ENTRIES'])
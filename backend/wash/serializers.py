@@ -2,6 +2,8 @@ from rest_framework import serializers
 import re
 from django.contrib.auth import authenticate
 from django.contrib.auth.hashers import make_password
+from .hashing import hash_password
+from .images import build_variants, delete_variants, variant_urls
 from rest_framework_simplejwt.settings import api_settings
 from .models import (
     Client, 
@@ -18,6 +20,15 @@ from .models import (
 
 
 
+# الإحداثيات اختيارية لكن تُرسل معًا
+def validate_coordinates(attrs, instance=None):
+    latitude = attrs.get('latitude', getattr(instance, 'latitude', None))
+    longitude = attrs.get('longitude', getattr(instance, 'longitude', None))
+    if (latitude is None) != (longitude is None):
+        raise serializers.ValidationError("يجب إرسال خط العرض وخط الطول معًا.")
+    return attrs
+
+
 # دالة للتحقق من قوة كلمة المرور
 def validate_password(password):
     if len(password) < 8:
@@ -46,28 +57,53 @@ def validate_email(email):
         raise serializers.ValidationError("البريد الإلكتروني غير صالح.")
     return email
 
+class ImageVariantsMixin:
+    """
+    Build the resized variants (wash/images.py) of `image_field` whenever
+    a new file is uploaded through the serializer, and drop the variants of
+    the image it replaces.
+    """
+    image_field = None
+
+    def save(self, **kwargs):
+        previous = getattr(self.instance, self.image_field, None) if self.instance is not None else None
+        previous_name = previous.name if previous else None
+        instance = super().save(**kwargs)
+        if self.validated_data.get(self.image_field):
+            field_file = getattr(instance, self.image_field)
+            build_variants(instance, self.image_field)
+            if previous_name and previous_name != field_file.name:
+                delete_variants(field_file.storage, previous_name)
+        return instance
+
+
 # Serializer لتسجيل العملاء
-class ClientSerializer(serializers.ModelSerializer):
+class ClientSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, validators=[validate_password])
     phone = serializers.CharField(validators=[validate_phone])
     email = serializers.EmailField(validators=[validate_email])
     age = serializers.IntegerField(validators=[validate_age])
     photo = serializers.ImageField(required=False, allow_null=True) #####
 
+    image_field = 'photo'
+
     class Meta:
         model = Client
         fields = ['full_name', 'email', 'phone', 'age', 'password','photo']######
 
     def create(self, validated_data):
+        # Hash in the bounded pool; Client.save skips passwords that are already hashed
+        validated_data['password'] = hash_password(validated_data['password'])
         return Client.objects.create(**validated_data)
 
 # Serializer لتسجيل الموظفين الخارجيين
-class ExternEmployeeSerializer(serializers.ModelSerializer):
+class ExternEmployeeSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, validators=[validate_password])
     phone = serializers.CharField(validators=[validate_phone])
     email = serializers.EmailField(validators=[validate_email])
     age = serializers.IntegerField(validators=[validate_age])
     profile_image = serializers.ImageField(required=False, allow_null=True) #####
+    image_field = 'profile_image'
 
     class Meta:
         model = ExternEmployee
@@ -95,15 +131,24 @@ from .models import ExternEmployeeHistory, InternEmployeeHistory, AppointmentDom
 
 # Serializer for extern employee detailed information
 class ExternEmployeeDetailSerializer(serializers.ModelSerializer):
+    # thumb/medium, webp/jpg URLs of the resized copies
+    profile_image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = ExternEmployee
-        fields = ['id', 'full_name', 'phone', 'age', 'final_rating', 'email','profile_image']
+        fields = ['id', 'full_name', 'phone', 'age', 'final_rating', 'email','profile_image', 'profile_image_variants']
+
+    def get_profile_image_variants(self, obj):
+        return variant_urls(obj.profile_image, obj.profile_image_variants_manifest, self.context.get('request'))
 
 # Serializer for appointment domicile information
 class AppointmentDomicileSerializer(serializers.ModelSerializer):
     class Meta:
         model = AppointmentDomicile
-        fields = ['id', 'time', 'car_type', 'car_name', 'wash_type', 'place', 'price', 'status']
+        fields = ['id', 'time', 'car_type', 'car_name', 'wash_type', 'place', 'latitude', 'longitude', 'price', 'status']
+
+    def validate(self, attrs):
+        return validate_coordinates(attrs, self.instance)
 
 # Serializer for extern employee history
 class ExternEmployeeHistorySerializer(serializers.ModelSerializer):
@@ -138,9 +183,15 @@ class InternEmployeeHistorySerializer(serializers.ModelSerializer):
 
 # Client detail serializer
 class ClientDetailSerializer(serializers.ModelSerializer):
+    # thumb/medium, webp/jpg URLs of the resized copies
+    photo_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Client
-        fields = ['id', 'full_name', 'email', 'phone', 'age','photo']
+        fields = ['id', 'full_name', 'email', 'phone', 'age','photo', 'photo_variants']
+
+    def get_photo_variants(self, obj):
+        return variant_urls(obj.photo, obj.photo_variants_manifest, self.context.get('request'))
 
 # Appointment Domicile serializer with client information
 class AppointmentDomicileWithClientSerializer(serializers.ModelSerializer):
@@ -148,7 +199,7 @@ class AppointmentDomicileWithClientSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = AppointmentDomicile
-        fields = ['id', 'time', 'car_type', 'car_name', 'wash_type', 'place', 'price', 'status', 'client_info','extern_employee']
+        fields = ['id', 'time', 'car_type', 'car_name', 'wash_type', 'place', 'latitude', 'longitude', 'price', 'status', 'client_info','extern_employee']
 
 # Appointment Location serializer with client information
 class AppointmentLocationWithClientSerializer(serializers.ModelSerializer):
@@ -162,7 +213,10 @@ class AppointmentLocationWithClientSerializer(serializers.ModelSerializer):
 class CreateAppointmentDomicileSerializer(serializers.ModelSerializer):
     class Meta:
         model = AppointmentDomicile
-        fields = ['time', 'car_type', 'car_name', 'wash_type', 'place', 'price']
+        fields = ['time', 'car_type', 'car_name', 'wash_type', 'place', 'latitude', 'longitude', 'price']
+
+    def validate(self, attrs):
+        return validate_coordinates(attrs)
         
     def create(self, validated_data):
         # Set default status to 'Pending'
@@ -190,7 +244,7 @@ class AdminSerializer(serializers.ModelSerializer):
         fields = ['id', 'full_name', 'email', 'password']
 
     def create(self, validated_data):
-        validated_data['password'] = make_password(validated_data['password'])
+        validated_data['password'] = hash_password(validated_data['password'])
         return Admin.objects.create(**validated_data)
     
 from .models import Feedback
@@ -198,4 +252,14 @@ class FeedbackSerializer(serializers.ModelSerializer):
     class Meta:
         model = Feedback
         fields = ['id', 'name', 'email', 'content', 'created_at', 'rating', 'approved']
-        read_only_fields = ['created_at']
\ No newline at end of file
+        read_only_fields = ['created_at']
+
+
+from .models import Rating
+# Serializer for a client's rating of an extern employee
+class RatingSerializer(serializers.ModelSerializer):
+    rating = serializers.IntegerField(min_value=1, max_value=5)
+
+    class Meta:
+        model = Rating
+        fields = ['rating']
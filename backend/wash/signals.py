@@ -0,0 +1,78 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import (
+    Client, ExternEmployee, InternEmployee, Admin, AppointmentDomicile, AppointmentLocation, AppointmentDailyStat,
+    ExternEmployeeHistory, InternEmployeeHistory, Rating, Feedback, FeedbackCounter,
+)
+from .rollups import refresh_employee_counters
+from .authoo import identity_cache
+from . import events
+
+USER_TYPES = {
+    Client: 'client',
+    ExternEmployee: 'extern_employee',
+    InternEmployee: 'intern_employee',
+    Admin: 'admin',
+}
+
+
+# تحديث ذاكرة الهويات عند تعديل أو حذف أي مستخدم
+@receiver(post_save, sender=Client)
+@receiver(post_save, sender=ExternEmployee)
+@receiver(post_save, sender=InternEmployee)
+@receiver(post_save, sender=Admin)
+@receiver(post_delete, sender=Client)
+@receiver(post_delete, sender=ExternEmployee)
+@receiver(post_delete, sender=InternEmployee)
+@receiver(post_delete, sender=Admin)
+def invalidate_cached_identity(sender, instance, **kwargs):
+    identity_cache.invalidate(USER_TYPES[sender], instance.pk)
+
+
+# إعلام الموظفين المتصلين بتغيّر قائمة المواعيد قيد الانتظار
+@receiver(post_save, sender=AppointmentDomicile)
+def publish_pending_change(sender, instance, created, **kwargs):
+    events.pending_status_changed(instance, None if created else getattr(instance, '_loaded_status', None))
+
+
+@receiver(post_delete, sender=AppointmentDomicile)
+def publish_pending_delete(sender, instance, **kwargs):
+    if instance.status == 'Pending':
+        events.appointment_cancelled(instance.id)
+
+
+# إنقاص الإحصائيات اليومية عند حذف موعد (مثلاً عند حذف العميل)
+@receiver(post_delete, sender=AppointmentDomicile)
+@receiver(post_delete, sender=AppointmentLocation)
+def remove_from_daily_stats(sender, instance, **kwargs):
+    channel = 'domicile' if sender is AppointmentDomicile else 'location'
+    bucket = instance.loaded_stats_bucket() if hasattr(instance, '_loaded_stats_values') else instance.stats_bucket()
+    AppointmentDailyStat.record_change(channel, bucket, None)
+
+
+# تحديث عدادات الموظف عند تعديل سجل تاريخي أو حذفه خارج record_completed (لوحة الإدارة، الحذف المتتالي)
+@receiver(post_save, sender=ExternEmployeeHistory)
+@receiver(post_save, sender=InternEmployeeHistory)
+@receiver(post_delete, sender=ExternEmployeeHistory)
+@receiver(post_delete, sender=InternEmployeeHistory)
+def refresh_history_counters(sender, instance, **kwargs):
+    refresh_employee_counters(sender, sender.employee_field, [getattr(instance, f'{sender.employee_field}_id')])
+
+
+# مواعيد الموظف المحذوف تصبح بلا موظف (SET_NULL) دون المرور بـ save()، فننقل إحصائياتها كذلك
+@receiver(post_delete, sender=ExternEmployee)
+def unassign_daily_stats(sender, instance, **kwargs):
+    AppointmentDailyStat.unassign_employee(instance.pk)
+
+
+# إنقاص مجموع تقييمات الموظف عند حذف تقييم (مثلاً عند حذف العميل)
+@receiver(post_delete, sender=Rating)
+def remove_rating(sender, instance, **kwargs):
+    ExternEmployee.apply_rating(instance.extern_employee_id, count=-1, rating_sum=-instance.rating)
+
+
+# إنقاص عدادات الآراء عند حذف رأي بأي طريقة (لوحة الإدارة، queryset.delete()، الحذف المتتالي)
+@receiver(post_delete, sender=Feedback)
+def remove_feedback_from_counter(sender, instance, **kwargs):
+    FeedbackCounter.record_change(getattr(instance, '_loaded_counts', instance.counter_values()), None)
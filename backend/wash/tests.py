@@ -1,3 +1,2050 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import io
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+import time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.db.models import Q
+from django.test import (
+    AsyncRequestFactory, RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import AuthenticationFailed, ErrorDetail
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient
+from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
+from rest_framework_simplejwt.tokens import AccessToken
+
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image
+
+from . import geo, images, revenue, rollups, routing
+from .async_views import pending_appointments_stream
+from .authoo import ClaimsPrincipal, authenticate_stream_ticket, identity_cache, issue_stream_ticket
+from .db import retry_on_lock
+from .events import OVERFLOW, PendingAppointmentsFeed, pending_feed
+from .hashing import HashingPool, HashingPoolSaturated
+from .models import (
+    Admin,
+    Client,
+    ExternEmployee,
+    InternEmployee,
+    AppointmentDomicile,
+    AppointmentLocation,
+    AppointmentDailyStat,
+    ExternEmployeeHistory,
+    InternEmployeeHistory,
+    Feedback,
+    FeedbackCounter,
+    LeaderboardEntry,
+    Rating,
+)
+from .pagination import (
+    ID_ORDERING, CREATED_AT_ORDERING, decode_cursor, encode_cursor, keyset_queryset, paginated_response,
+)
+from .projections import (
+    AppointmentDomicileWithClientProjection,
+    AppointmentLocationWithClientProjection,
+    project_domicile,
+    project_location,
+)
+from .renderers import ORJSONRenderer
+from .routers import PIN_COOKIE, PIN_HEADER, REPLICA, ReplicaRouter, replica_reads
+from .serializers import (
+    AppointmentDomicileSerializer,
+    AppointmentDomicileWithClientSerializer,
+    AppointmentLocationWithClientSerializer,
+    ClientDetailSerializer,
+    ClientSerializer,
+    FeedbackSerializer,
+)
+
+
+def api_client_for(user, user_type):
+    token = AccessToken()
+    token['user_id'] = user.id
+    token['user_type'] = user_type
+    api_client = APIClient()
+    api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    return api_client
+
+
+class KeysetPaginationTests(TestCase):
+    """Paging through a list must return every row once, even with equal created_at values"""
+    URL = '/api/feedback/all/'
+
+    def setUp(self):
+        for i in range(11):
+            Feedback.objects.create(name=f'F{i}', email='f@wash.dz', content='ok', rating=5, approved=i != 3)
+        # Four rows per timestamp so the id tie-break decides inside each group
+        base = timezone.now()
+        for i, feedback in enumerate(Feedback.objects.order_by('id')):
+            Feedback.objects.filter(pk=feedback.pk).update(created_at=base - datetime.timedelta(minutes=i // 4))
+        self.expected = list(
+            Feedback.objects.filter(approved=True).order_by(*CREATED_AT_ORDERING).values_list('id', flat=True)
+        )
+
+    def test_pages_have_no_gaps_or_repeats(self):
+        for page_size in (1, 3, 4, 10, 50):
+            with self.subTest(page_size=page_size):
+                seen, cursor = [], None
+                while True:
+                    params = {'page_size': page_size}
+                    if cursor:
+                        params['cursor'] = cursor
+                    body = self.client.get(self.URL, params).json()
+                    self.assertLessEqual(len(body['results']), page_size)
+                    seen += [row['id'] for row in body['results']]
+                    cursor = body['next']
+                    if cursor is None:
+                        break
+                self.assertEqual(seen, self.expected)
+
+    def test_cursor_round_trip(self):
+        created_at = timezone.now()
+        values = decode_cursor(encode_cursor([created_at, 7]))
+        self.assertEqual(values, [created_at.isoformat(), 7])
+
+    def test_bad_cursor(self):
+        for cursor in ('not-base64!', encode_cursor({'a': 1}), encode_cursor(['x', 1]), encode_cursor([1])):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(self.URL, {'page_size': 2, 'cursor': cursor}).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, {'page_size': 0}).status_code, 400)
+
+    def test_unpaginated_shapes(self):
+        with override_settings(WASH_PAGINATION={'LEGACY_UNPAGINATED': True}):
+            self.assertEqual([row['id'] for row in self.client.get(self.URL).json()], self.expected)
+        with override_settings(WASH_PAGINATION={'LEGACY_UNPAGINATED': False, 'PAGE_SIZE': 4}):
+            body = self.client.get(self.URL).json()
+            self.assertEqual([row['id'] for row in body['results']], self.expected[:4])
+            plain = self.client.get(self.URL, {'paginate': 'false'}).json()
+            self.assertEqual([row['id'] for row in plain], self.expected)
+
+
+class EmployeesDetailsQueryCountTests(TestCase):
+    """
+    The admin employee lists must run a fixed number of queries
+    whatever the number of employees and history rows.
+    """
+    # employees (with their stored totals) + prefetched history; auth comes from the identity cache
+    QUERY_BUDGET = 2
+
+    def setUp(self):
+        self.admin = Admin.objects.create(full_name='Admin', email='admin@wash.dz', password='admin1234')
+        self.client_user = Client.objects.create(
+            full_name='Client', email='client@wash.dz', password='client1234', phone='0555555555', age=30
+        )
+        self.api = api_client_for(self.admin, 'admin')
+        # Warm the identity cache so the measured requests hit the hot path
+        identity_cache.clear()
+        self.api.get('/api/admin/extern_employees/')
+
+    def add_extern_employees(self, count):
+        start = ExternEmployee.objects.count()
+        for i in range(start, start + count):
+            employee = ExternEmployee.objects.create(
+                full_name=f'Extern {i}', password='x', phone='0555555555', email=f'extern{i}@wash.dz', age=25
+            )
+            for _ in range(2):
+                appointment = AppointmentDomicile.objects.create(
+                    time=datetime.time(10, 0), car_type='SUV', car_name='Golf', wash_type='Full',
+                    place='Alger', client=self.client_user, extern_employee=employee, price='1500.00',
+                    status='Completed',
+                )
+                ExternEmployeeHistory.objects.get_or_create(
+                    extern_employee=employee, client=self.client_user, appointment=appointment
+                )
+
+    def add_intern_employees(self, count):
+        start = InternEmployee.objects.count()
+        for i in range(start, start + count):
+            employee = InternEmployee.objects.create(
+                full_name=f'Intern {i}', password='x', phone='0555555555', email=f'intern{i}@wash.dz', age=25
+            )
+            for _ in range(2):
+                appointment = AppointmentLocation.objects.create(
+                    date=datetime.date(2025, 4, 1), time=datetime.time(10, 0), car_type='SUV', car_name='Golf',
+                    wash_type='Full', client=self.client_user, price='1500.00',
+                )
+                InternEmployeeHistory.objects.create(
+                    intern_employee=employee, client=self.client_user, appointment=appointment, cars_washed=1
+                )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.api.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()
+
+    def test_extern_employees_query_budget(self):
+        self.add_extern_employees(1)
+        few, _ = self.count_queries('/api/admin/extern_employees/')
+        self.add_extern_employees(20)
+        many, data = self.count_queries('/api/admin/extern_employees/')
+
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, self.QUERY_BUDGET)
+        self.assertEqual(len(data), 21)
+        self.assertEqual(data[0]['total_cars_washed'], 2)
+        self.assertEqual(data[0]['total_clients'], 1)
+        self.assertEqual(data[0]['history'][0]['client_name'], 'Client')
+
+    def test_intern_employees_query_budget(self):
+        self.add_intern_employees(1)
+        few, _ = self.count_queries('/api/admin/intern_employees/')
+        self.add_intern_employees(20)
+        many, data = self.count_queries('/api/admin/intern_employees/')
+
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, self.QUERY_BUDGET)
+        self.assertEqual(len(data), 21)
+        self.assertEqual(data[0]['total_cars_washed'], 2)
+        self.assertEqual(data[0]['total_clients'], 1)
+
+
+class DeletedAccountTests(TestCase):
+    """A deleted admin loses access to admin data at once, not when the token expires"""
+
+    def setUp(self):
+        identity_cache.clear()
+        self.admin = Admin.objects.create(full_name='Admin', email='admin@wash.dz', password='x')
+        Client.objects.create(full_name='Client', email='client@wash.dz', phone='0555000090', age=30, password='x')
+
+    def test_admin_endpoints_reject_a_deleted_admin(self):
+        api = api_client_for(self.admin, 'admin')
+        urls = ['/api/admin/clients/', '/api/admin/feedbacks/', '/api/admin/feedbacks/summary/',
+                '/api/admin/appointments/revenue/e']
+        for url in urls:
+            self.assertEqual(api.get(url).status_code, 200, url)
+        self.admin.delete()
+        for url in urls:
+            with self.subTest(url):
+                self.assertEqual(api.get(url).status_code, 401)
+
+
+class PendingFeedTests(TestCase):
+    """Fan-out of the pending appointments feed and the SSE stream that reads it"""
+
+    def setUp(self):
+        self.employee = ExternEmployee.objects.create(
+            full_name='Employee', email='employee@wash.dz', phone='0555000095', age=25, password='x',
+        )
+
+    def test_publish_reaches_every_subscriber(self):
+        async def scenario():
+            feed = PendingAppointmentsFeed()
+            queues = [feed.subscribe(), feed.subscribe()]
+            # From a worker thread, like a sync view would
+            thread = threading.Thread(target=feed.publish, args=('claimed', {'id': 1}))
+            thread.start()
+            thread.join()
+            events = [await asyncio.wait_for(queue.get(), 1) for queue in queues]
+            feed.unsubscribe(queues[0])
+            return feed, events
+
+        feed, events = async_to_sync(scenario)()
+        self.assertEqual(events[0], events[1])
+        self.assertEqual(events[0][1:], ('claimed', '{"id": 1}'))
+        self.assertEqual(len(feed._subscribers), 1)
+
+    def test_slow_subscriber_is_dropped(self):
+        async def scenario():
+            feed = PendingAppointmentsFeed(max_queue=2)
+            queue = feed.subscribe()
+            for i in range(3):
+                feed.publish('cancelled', {'id': i})
+            await asyncio.sleep(0)
+            return feed, [queue.get_nowait() for _ in range(queue.qsize())]
+
+        feed, events = async_to_sync(scenario)()
+        self.assertEqual(events, [OVERFLOW])
+        self.assertFalse(feed.has_subscribers())
+
+    def test_stream_ticket(self):
+        api = api_client_for(self.employee, 'extern_employee')
+        response = api.post('/api/appointments_domicile/stream/ticket')
+        self.assertEqual(response.status_code, 200, response.content)
+        principal = authenticate_stream_ticket(response.json()['ticket'])
+        self.assertEqual((principal.id, principal.user_type), (self.employee.id, 'extern_employee'))
+
+        # A JWT is not a ticket, and tickets expire
+        with self.assertRaises(AuthenticationFailed):
+            authenticate_stream_ticket(str(AccessToken()))
+        with override_settings(WASH_EVENTS={'TICKET_MAX_AGE': -1}):
+            with self.assertRaises(AuthenticationFailed):
+                authenticate_stream_ticket(response.json()['ticket'])
+        client_user = Client.objects.create(
+            full_name='Client', email='client@wash.dz', phone='0555000096', age=30, password='x',
+        )
+        client_api = api_client_for(client_user, 'client')
+        self.assertEqual(client_api.post('/api/appointments_domicile/stream/ticket').status_code, 403)
+
+    def test_stream_unsubscribes_on_disconnect(self):
+        ticket = issue_stream_ticket(ClaimsPrincipal(self.employee.id, 'extern_employee'))
+
+        async def scenario():
+            factory = AsyncRequestFactory()
+            rejected = await pending_appointments_stream(factory.get('/api/appointments_domicile/stream', {'token': 'x'}))
+            response = await pending_appointments_stream(
+                factory.get('/api/appointments_domicile/stream', {'ticket': ticket})
+            )
+            chunks = aiter(response.streaming_content)
+            snapshot = await anext(chunks)
+            subscribed = pending_feed.has_subscribers()
+            pending_feed.publish('claimed', {'id': 5})
+            claimed = await asyncio.wait_for(anext(chunks), 1)
+            # The client goes away: the ASGI handler cancels the response
+            reader = asyncio.ensure_future(anext(chunks))
+            await asyncio.sleep(0)
+            reader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await reader
+            return rejected.status_code, snapshot, subscribed, claimed
+
+        status_code, snapshot, subscribed, claimed = async_to_sync(scenario)()
+        self.assertEqual(status_code, 401)
+        self.assertTrue(snapshot.startswith(b'id: 0\nevent: snapshot'))
+        self.assertTrue(subscribed)
+        self.assertIn(b'event: claimed\ndata: {"id": 5}', claimed)
+        self.assertFalse(pending_feed.has_subscribers())
+
+
+class DailyStatsTests(TestCase):
+    """AppointmentDailyStat kept up to date by every write path must equal a rebuild from scratch"""
+
+    def setUp(self):
+        self.client_user = Client.objects.create(
+            full_name='Client', email='client@wash.dz', phone='0555000100', age=30, password='x',
+        )
+        self.employees = [
+            ExternEmployee.objects.create(
+                full_name=f'Employee {i}', email=f'e{i}@wash.dz', phone='0555000101', age=25, password='x',
+            )
+            for i in range(2)
+        ]
+
+    def domicile(self, **fields):
+        return AppointmentDomicile.objects.create(**{
+            'client': self.client_user, 'time': datetime.time(9), 'car_type': 'SUV', 'car_name': 'Golf',
+            'wash_type': 'Full', 'place': 'Alger', 'price': '1000', **fields,
+        })
+
+    def snapshot(self):
+        return sorted(
+            AppointmentDailyStat.objects.exclude(count=0)
+            .values_list('day', 'channel', 'status', 'wash_type', 'employee', 'count', 'revenue')
+        )
+
+    def test_record_change(self):
+        today = timezone.localdate()
+        bucket = (today, 'Pending', 'Full', Decimal('1000'), 0)
+        claimed = (today, 'In Progress', 'Full', Decimal('1000'), 7)
+        AppointmentDailyStat.add_to_bucket('domicile', bucket, 2)
+        AppointmentDailyStat.record_change('domicile', bucket, claimed)
+        AppointmentDailyStat.record_change('domicile', claimed, claimed)
+        AppointmentDailyStat.record_change('domicile', None, bucket)
+        self.assertEqual(self.snapshot(), [
+            (today, 'domicile', 'In Progress', 'Full', 7, 1, Decimal('1000')),
+            (today, 'domicile', 'Pending', 'Full', 0, 2, Decimal('2000')),
+        ])
+
+    def test_write_paths_match_a_rebuild(self):
+        employee_api = api_client_for(self.employees[0], 'extern_employee')
+        client_api = api_client_for(self.client_user, 'client')
+        appointments = [self.domicile(wash_type=wash_type) for wash_type in ('Full', 'Full', 'Basic', 'Full')]
+        employee_api.post(f'/api/appointments_domicile/{appointments[0].id}/claim')
+        employee_api.post(f'/api/appointments_domicile/{appointments[1].id}/claim')
+        employee_api.post('/api/appointments_domicile/status/bulk',
+                          {'ids': [appointments[0].id], 'status': 'Completed'}, format='json')
+        appointments[2].extern_employee = self.employees[1]
+        appointments[2].status = 'In Progress'
+        appointments[2].save()
+        appointments[3].delete()
+        client_api.post('/api/appointments_domicile/create/batch', {'appointments': [
+            {'time': '10:00', 'car_type': 'SUV', 'car_name': 'Golf', 'wash_type': 'Full', 'place': 'Alger',
+             'price': '1500.00'},
+        ]}, format='json')
+        client_api.post('/api/appointments_location/create/batch', {'appointments': [
+            {'date': '2025-03-01', 'time': '10:00', 'car_type': 'Sedan', 'car_name': 'Clio',
+             'wash_type': 'Basic', 'price': '800'},
+        ]}, format='json')
+        self.employees[1].delete()
+
+        maintained = self.snapshot()
+        self.assertEqual(len(maintained), 5)
+        call_command('rebuild_appointment_stats', stdout=io.StringIO())
+        self.assertEqual(self.snapshot(), maintained)
+
+    def test_unknown_creation_time_is_left_out(self):
+        appointment = self.domicile()
+        AppointmentDomicile.objects.filter(pk=appointment.pk).update(created_at=None)
+        self.assertIsNone(AppointmentDomicile.objects.get(pk=appointment.pk).stats_bucket())
+        call_command('rebuild_appointment_stats', stdout=io.StringIO())
+        self.assertEqual(self.snapshot(), [])
+
+    def test_loading_does_not_compute_buckets(self):
+        appointment = self.domicile()
+        with mock.patch.object(AppointmentDomicile, 'stats_bucket') as stats_bucket:
+            list(AppointmentDomicile.objects.all())
+        stats_bucket.assert_not_called()
+        loaded = AppointmentDomicile.objects.get(pk=appointment.pk)
+        self.assertEqual(loaded.loaded_stats_bucket(), appointment.stats_bucket())
+        self.assertIsNone(AppointmentDomicile().loaded_stats_bucket())
+
+    def test_claim_without_creation_time(self):
+        appointment = self.domicile()
+        AppointmentDomicile.objects.filter(pk=appointment.pk).update(created_at=None)
+        call_command('rebuild_appointment_stats', stdout=io.StringIO())
+        api = api_client_for(self.employees[0], 'extern_employee')
+        response = api.post(f'/api/appointments_domicile/{appointment.pk}/claim')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['status'], 'In Progress')
+        self.assertEqual(self.snapshot(), [])
+
+    def test_stats_endpoint_counts_employees_from_the_rollup(self):
+        for employee in self.employees + [None, None]:
+            self.domicile(extern_employee=employee, status='In Progress' if employee else 'Pending')
+        self.domicile(extern_employee=self.employees[0], status='Completed')
+        identity_cache.clear()
+        admin = api_client_for(Admin.objects.create(full_name='Admin', email='admin@wash.dz', password='x'), 'admin')
+        admin.get('/api/admin/appointments/stats/e')
+        with CaptureQueriesContext(connection) as queries:
+            data = admin.get('/api/admin/appointments/stats/e').json()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(data['total_appointments'], 5)
+        self.assertEqual(data['total_employees_with_appointments'], 2)
+        self.assertEqual(data['status_breakdown'], {'Pending': 2, 'In Progress': 2, 'Completed': 1, 'Deleted': 0})
+
+
+class RevenueRangeTests(TestCase):
+    """admin/appointments/revenue/range: buckets, limits and dates at the ends of the calendar"""
+    URL = '/api/admin/appointments/revenue/range'
+
+    def setUp(self):
+        client_user = Client.objects.create(
+            full_name='Client', email='client@wash.dz', phone='0555000110', age=30, password='x',
+        )
+        common = dict(client=client_user, time=datetime.time(9), car_type='SUV', car_name='Golf', price='100')
+        # 2025-03-03 is a Monday
+        for day, wash_type, status in (
+            ('2025-03-03', 'Full', 'Completed'), ('2025-03-09', 'Basic', 'Completed'),
+            ('2025-03-10', 'Full', 'Completed'), ('2025-04-01', 'Full', 'Completed'),
+            ('2025-03-03', 'Full', 'Pending'),
+        ):
+            AppointmentLocation.objects.create(date=day, wash_type=wash_type, status=status, **common)
+        appointment = AppointmentDomicile.objects.create(
+            wash_type='Full', place='Alger', status='Completed', created_at=timezone.make_aware(datetime.datetime(2025, 3, 4, 10)),
+            **common,
+        )
+        self.assertEqual(appointment.stats_bucket()[0], datetime.date(2025, 3, 4))
+        self.api = api_client_for(Admin.objects.create(full_name='Admin', email='admin@wash.dz', password='x'), 'admin')
+
+    def series(self, channel, **params):
+        response = self.api.get(self.URL, {'channel': channel, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(p['period'], p['total_revenue'], p['appointment_count']) for p in response.json()[channel]]
+
+    def test_buckets(self):
+        self.assertEqual(self.series('location', **{'from': '2025-03-08', 'to': '2025-03-10'}), [
+            ('2025-03-08', '0.00', 0), ('2025-03-09', '100.00', 1), ('2025-03-10', '100.00', 1),
+        ])
+        self.assertEqual(self.series('location', **{'from': '2025-03-05', 'to': '2025-03-16', 'bucket': 'week'}), [
+            ('2025-03-03', '100.00', 1), ('2025-03-10', '100.00', 1),
+        ])
+        self.assertEqual(self.series('location', **{'from': '2025-02-15', 'to': '2025-04-15', 'bucket': 'month'}), [
+            ('2025-02-01', '0.00', 0), ('2025-03-01', '300.00', 3), ('2025-04-01', '100.00', 1),
+        ])
+        self.assertEqual(self.series('domicile', **{'from': '2025-03-01', 'to': '2025-03-31', 'bucket': 'month'}), [
+            ('2025-03-01', '100.00', 1),
+        ])
+        by_type = self.api.get(self.URL, {'channel': 'location', 'from': '2025-03-01', 'to': '2025-03-31',
+                                          'bucket': 'month', 'breakdown': 'wash_type'}).json()['location'][0]
+        self.assertEqual(by_type['breakdown']['Full'], {'total_revenue': '200.00', 'appointment_count': 2})
+
+    def test_period_count(self):
+        for date_from, date_to, bucket in (
+            ('2025-03-01', '2025-03-01', 'day'), ('2024-02-27', '2024-03-02', 'day'),
+            ('2025-03-05', '2025-03-16', 'week'), ('2025-03-03', '2025-03-09', 'week'),
+            ('2024-11-30', '2026-01-01', 'month'), ('0001-01-01', '0001-03-01', 'month'),
+        ):
+            date_from, date_to = datetime.date.fromisoformat(date_from), datetime.date.fromisoformat(date_to)
+            periods = list(revenue.iter_periods(date_from, date_to, bucket))
+            self.assertEqual(revenue.count_periods(date_from, date_to, bucket), len(periods))
+            self.assertEqual(periods, sorted(set(periods)))
+            self.assertLessEqual(periods[-1], date_to)
+
+    def test_limits_and_edge_dates(self):
+        too_large = {'channel': 'location', 'from': '0001-01-01', 'to': '9999-12-30'}
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.api.get(self.URL, too_large).status_code, 400)
+        self.assertLessEqual(len(queries), 1)  # rejected before any period is walked or queried
+        self.assertEqual(self.api.get(self.URL, {**too_large, 'bucket': 'month'}).status_code, 400)
+        self.assertEqual(self.api.get(self.URL, {'from': '2025-01-01', 'to': '9999-12-31'}).status_code, 400)
+        self.assertEqual(self.api.get(self.URL, {'from': '2025-03-02', 'to': '2025-03-01'}).status_code, 400)
+
+        self.assertEqual(len(self.series('domicile', **{'from': '9999-12-01', 'to': '9999-12-30',
+                                                        'breakdown': 'car_type'})), 30)
+        self.assertEqual(len(self.series('location', **{'from': '9999-01-01', 'to': '9999-12-30', 'bucket': 'month'})), 12)
+        self.assertEqual(len(self.series('location', **{'from': '9999-12-20', 'to': '9999-12-30', 'bucket': 'week'})), 2)
+        self.assertEqual(len(self.series('location', **{'from': '0001-01-01', 'to': '0001-01-31'})), 31)
+
+
+class FeedbackCounterTests(TestCase):
+    """FeedbackCounter must match compute() whatever path created, changed or deleted the feedback"""
+
+    def setUp(self):
+        self.client_user = Client.objects.create(
+            full_name='Client', email='client@wash.dz', phone='0555000120', age=30, password='x',
+        )
+        self.admin = api_client_for(Admin.objects.create(full_name='Admin', email='admin@wash.dz', password='x'), 'admin')
+
+    def counts(self):
+        return FeedbackCounter.objects.values('total', 'approved', 'rating_sum').get(pk=FeedbackCounter.SINGLETON_ID)
+
+    def test_counter_follows_every_write_path(self):
+        client_api = api_client_for(self.client_user, 'client')
+        for rating in (5, 4, 2):
+            response = client_api.post('/api/feedback/', {'name': 'C', 'email': 'c@wash.dz', 'content': 'ok',
+                                                         'rating': rating}, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+        first, second, third = Feedback.objects.order_by('id')
+        self.admin.put(f'/api/admin/feedbacks/{first.id}/approve/', {'approved': True}, format='json')
+        self.admin.put(f'/api/admin/feedbacks/{second.id}/approve/', {'approved': True}, format='json')
+        self.admin.put(f'/api/admin/feedbacks/{second.id}/approve/', {'approved': False}, format='json')
+        self.admin.delete(f'/api/admin/feedbacks/{third.id}/delete/')
+        self.assertEqual(self.counts(), FeedbackCounter.compute())
+
+        # Django admin edits go through save(), bulk deletes through post_delete
+        second.rating = 1
+        second.approved = True
+        second.save()
+        Feedback.objects.create(name='D', email='d@wash.dz', content='ok', rating=3, approved=True)
+        self.assertEqual(self.counts(), FeedbackCounter.compute())
+        Feedback.objects.filter(rating__lt=4).delete()
+        self.assertEqual(self.counts(), FeedbackCounter.compute())
+        self.assertEqual(self.counts(), {'total': 1, 'approved': 1, 'rating_sum': 5})
+
+    def test_recompute_command_repairs_drift(self):
+        Feedback.objects.create(name='C', email='c@wash.dz', content='ok', rating=5)
+        # update() bypasses save()
+        Feedback.objects.update(approved=True)
+        self.assertNotEqual(self.counts(), FeedbackCounter.compute())
+        out = io.StringIO()
+        call_command('recompute_feedback_counter', stdout=out)
+        self.assertIn('Repaired', out.getvalue())
+        self.assertEqual(self.counts(), {'total': 1, 'approved': 1, 'rating_sum': 5})
+
+
+class HashingPoolTests(TestCase):
+    """The hashing pool refuses work past max_pending, and the async logins answer like the sync ones"""
+
+    def test_pool_is_bounded(self):
+        pool = HashingPool(workers=1, max_pending=2)
+        release = threading.Event()
+        futures = [pool.submit(release.wait, 5) for _ in range(2)]
+        with self.assertRaises(HashingPoolSaturated):
+            pool.submit(release.wait, 5)
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+        # Slots come back once the jobs are done
+        self.assertEqual(pool.call(sum, [1, 2]), 3)
+        self.assertEqual(async_to_sync(pool.run)(max, [1, 2]), 2)
+
+    def test_async_login_matches_sync_login(self):
+        Client.objects.create(full_name='Client', email='client@wash.dz', phone='0555000130', age=30,
+                              password='secret123')
+        Admin.objects.create(full_name='Admin', email='admin@wash.dz', password='secret123')
+        for user_type in ('client', 'admin'):
+            with self.subTest(user_type):
+                url = f'/api/auth/{user_type}/login/'
+                credentials = {'email': f'{user_type}@wash.dz', 'password': 'secret123'}
+                sync = self.client.post(url, credentials, content_type='application/json')
+                response = self.client.post(url + 'async/', credentials, content_type='application/json')
+                self.assertEqual(response.status_code, 200, response.content)
+                body, expected = response.json(), sync.json()
+                self.assertEqual(set(body), set(expected))
+                for key in ('user_type', 'user_id', 'full_name'):
+                    self.assertEqual(body[key], expected[key])
+                self.assertEqual(AccessToken(body['access'])['user_type'], user_type)
+
+                for data, code in (({**credentials, 'password': 'wrong'}, 401),
+                                   ({**credentials, 'email': 'nobody@wash.dz'}, 404), ({}, 400)):
+                    sync = self.client.post(url, data, content_type='application/json')
+                    response = self.client.post(url + 'async/', data, content_type='application/json')
+                    self.assertEqual((sync.status_code, response.status_code), (code, code))
+                    # Same bytes: the Arabic messages are not escaped to \uXXXX
+                    self.assertEqual(response.content, sync.content)
+
+    def test_async_login_when_the_pool_is_full(self):
+        Client.objects.create(full_name='Client', email='client@wash.dz', phone='0555000131', age=30,
+                              password='secret123')
+        with mock.patch('wash.hashing.hashing_pool.submit', side_effect=HashingPoolSaturated()):
+            response = self.client.post('/api/auth/client/login/async/',
+                                        {'email': 'client@wash.dz', 'password': 'secret123'},
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+
+class AsyncViewParityTests(TestCase):
+    """The async list views answer like DRF views would, with the same authentication and errors"""
+
+    def setUp(self):
+        identity_cache.clear()
+        self.client_user = Client.objects.create(
+            full_name='Client', email='client@wash.dz', phone='0555000140', age=30, password='x',
+        )
+        other = Client.objects.create(
+            full_name='Other', email='other@wash.dz', phone='0555000141', age=31, password='x',
+        )
+        self.employee = ExternEmployee.objects.create(
+            full_name='Employee', email='employee@wash.dz', phone='0555000142', age=25, password='x',
+        )
+        self.admin = Admin.objects.create(full_name='Admin', email='admin@wash.dz', password='x')
+        for i in range(5):
+            owner = self.client_user if i % 2 else other
+            AppointmentDomicile.objects.create(
+                client=owner, extern_employee=self.employee if i < 2 else None,
+                status='In Progress' if i < 2 else 'Pending', time=datetime.time(9 + i),
+                car_type='SUV', car_name=f'Car {i}', wash_type='Full', place='Alger', price='1500',
+            )
+            AppointmentLocation.objects.create(
+                client=owner, date=datetime.date(2025, 3, 1), time=datetime.time(9 + i),
+                car_type='Sedan', car_name=f'Car {i}', wash_type='Basic', price='800',
+            )
+            Feedback.objects.create(name=f'Client {i}', email=f'c{i}@wash.dz', content=f'Feedback {i}', rating=4,
+                                    approved=i != 3)
+
+    def token_for(self, user, user_type, **claims):
+        token = AccessToken()
+        token['user_id'] = user.id
+        token['user_type'] = user_type
+        for name, value in claims.items():
+            token[name] = value
+        return f'Bearer {token}'
+
+    def drf_response(self, path, queryset, serializer_class, ordering=ID_ORDERING):
+        """What a DRF list view built on paginated_response answers"""
+        response = paginated_response(Request(RequestFactory().get(path)), queryset, serializer_class, ordering)
+        return response.status_code, json.loads(ORJSONRenderer().render(response.data))
+
+    def assertAnswers(self, path, authorization, expected):
+        headers = {'Authorization': authorization} if authorization else {}
+        response = self.client.get('/api/' + path, headers=headers)
+        self.assertEqual((response.status_code, json.loads(response.content)), expected, path)
+
+    def assertSameError(self, path, authorization, reference='extern_employee/appointments/'):
+        """Same status, body and WWW-Authenticate as the DRF view at reference (same permissions)"""
+        headers = {'Authorization': authorization} if authorization else {}
+        expected = self.client.get('/api/' + reference, headers=headers)
+        self.assertGreaterEqual(expected.status_code, 400)
+        response = self.client.get('/api/' + path, headers=headers)
+        self.assertEqual(response.status_code, expected.status_code, path)
+        self.assertEqual(json.loads(response.content), json.loads(expected.content), path)
+        self.assertEqual(response.get('WWW-Authenticate'), expected.get('WWW-Authenticate'), path)
+
+    def test_lists(self):
+        client = self.token_for(self.client_user, 'client')
+        employee = self.token_for(self.employee, 'extern_employee')
+        admin = self.token_for(self.admin, 'admin')
+        domicile, location = AppointmentDomicile.objects, AppointmentLocation.objects
+        cases = [
+            ('appointments_domicile/get_all', employee, domicile.filter(status='Pending'),
+             AppointmentDomicileSerializer, ID_ORDERING),
+            ('appointments_domicile/get', client, domicile.filter(client=self.client_user),
+             AppointmentDomicileWithClientSerializer, ID_ORDERING),
+            ('appointments_domicile/get', employee, domicile.filter(extern_employee=self.employee),
+             AppointmentDomicileWithClientSerializer, ID_ORDERING),
+            ('appointments_domicile/get', admin, domicile.all(), AppointmentDomicileWithClientSerializer, ID_ORDERING),
+            ('appointments_location/get', client, location.filter(client=self.client_user),
+             AppointmentLocationWithClientSerializer, ID_ORDERING),
+            ('appointments_location/get', admin, location.all(), AppointmentLocationWithClientSerializer, ID_ORDERING),
+            ('feedback/all/', None, Feedback.objects.filter(approved=True), FeedbackSerializer, CREATED_AT_ORDERING),
+            ('feedback/all/', client, Feedback.objects.filter(approved=True), FeedbackSerializer, CREATED_AT_ORDERING),
+        ]
+        for path, authorization, queryset, serializer_class, ordering in cases:
+            for query in ('', '?page_size=2', '?page_size=0', '?cursor=bad', '?paginate=false'):
+                with self.subTest(path=path + query, authorization=authorization is not None):
+                    self.assertAnswers(
+                        path + query, authorization,
+                        self.drf_response(path + query, queryset, serializer_class, ordering),
+                    )
+
+        for path in ('appointments_domicile/get_all', 'appointments_domicile/get', 'appointments_location/get'):
+            for authorization in (None, 'Bearer not-a-token'):
+                with self.subTest(path=path, authorization=authorization):
+                    self.assertSameError(path, authorization)
+        self.assertSameError('appointments_domicile/get_all', client)
+
+    def test_employee_public_details(self):
+        client = self.token_for(self.client_user, 'client')
+        self.assertAnswers(f'extern_employee/{self.employee.id}/', client, (200, {
+            'full_name': 'Employee', 'phone': '0555000142', 'final_rating': 0.0, 'rating_count': 0,
+        }))
+        self.assertAnswers('extern_employee/999/', client, (404, {'error': 'الموظف غير موجود'}))
+        for authorization in (None, self.token_for(self.employee, 'extern_employee')):
+            self.assertSameError(f'extern_employee/{self.employee.id}/', authorization, reference='client/profile/')
+
+    def test_employee_public_details_reject_a_deleted_client(self):
+        authorization = self.token_for(self.client_user, 'client')
+        path = f'/api/extern_employee/{self.employee.id}/'
+        self.assertEqual(self.client.get(path, HTTP_AUTHORIZATION=authorization).status_code, 200)
+        self.client_user.delete()
+        self.assertEqual(self.client.get(path, HTTP_AUTHORIZATION=authorization).status_code, 401)
+
+    def test_google_client_resolves_by_email(self):
+        """A Google token whose user_id isn't the Client id lists that client's appointments"""
+        authorization = self.token_for(Client(id=999), 'client', email=self.client_user.email)
+        response = self.client.get('/api/appointments_domicile/get?paginate=false', HTTP_AUTHORIZATION=authorization)
+        self.assertEqual(len(response.json()), 2)
+
+    def test_deleted_account_is_rejected(self):
+        authorization = self.token_for(self.employee, 'extern_employee')
+        path = '/api/appointments_domicile/get_all'
+        self.assertEqual(self.client.get(path, HTTP_AUTHORIZATION=authorization).status_code, 200)
+        self.employee.delete()
+        self.assertEqual(self.client.get(path, HTTP_AUTHORIZATION=authorization).status_code, 401)
+
+
+class SQLiteTuningTests(TransactionTestCase):
+    """Connection pragmas (wash.db.configure_sqlite) and the "database is locked" retries (retry_on_lock)"""
+
+    def test_pragmas_on_new_connections(self):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = SQLiteDatabaseWrapper(
+                {**connection.settings_dict, 'NAME': os.path.join(directory, 'db.sqlite3')}, alias='pragmas'
+            )
+            try:
+                with wrapper.cursor() as cursor:
+                    values = {}
+                    for pragma in ('journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'busy_timeout'):
+                        cursor.execute(f'PRAGMA {pragma}')
+                        values[pragma] = cursor.fetchone()[0]
+            finally:
+                wrapper.close()
+        self.assertEqual(values, {
+            'journal_mode': 'wal', 'synchronous': 1, 'cache_size': -20000, 'mmap_size': 134217728,
+            'busy_timeout': 5000,
+        })
+
+    def test_journal_mode_is_set_once(self):
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = {**connection.settings_dict, 'NAME': os.path.join(directory, 'db.sqlite3')}
+            modes = []
+            for _ in range(2):
+                wrapper = SQLiteDatabaseWrapper(settings_dict, alias='pragmas')
+                try:
+                    with wrapper.cursor() as cursor:
+                        cursor.execute('PRAGMA journal_mode')
+                        modes.append(cursor.fetchone()[0])
+                        # Only a second configure_sqlite run would switch it back
+                        cursor.execute('PRAGMA journal_mode = DELETE')
+                finally:
+                    wrapper.close()
+        self.assertEqual(modes, ['wal', 'delete'])
+
+    def test_connections_are_not_persistent_by_default(self):
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], 0)
+
+    def locked_view(self, failures, error='database is locked'):
+        calls = []
+
+        @retry_on_lock
+        def view(value):
+            calls.append(value)
+            if len(calls) <= failures:
+                raise OperationalError(error)
+            AppointmentDailyStat.objects.count()
+            return value
+
+        return view, calls
+
+    @override_settings(WASH_DB_RETRY={'ATTEMPTS': 3, 'BASE_DELAY': 0.01, 'MAX_DELAY': 0.01})
+    def test_retry_on_lock(self):
+        with mock.patch('wash.db.time.sleep') as sleep:
+            view, calls = self.locked_view(failures=2)
+            self.assertEqual(view('ok'), 'ok')
+            self.assertEqual(len(calls), 3)
+            self.assertEqual(sleep.call_count, 2)
+
+            # Gives up after ATTEMPTS
+            view, calls = self.locked_view(failures=3)
+            with self.assertRaisesMessage(OperationalError, 'database is locked'):
+                view('ok')
+            self.assertEqual(len(calls), 3)
+
+            # Other errors aren't retried
+            view, calls = self.locked_view(failures=1, error='no such table: wash_client')
+            with self.assertRaises(OperationalError):
+                view('ok')
+            self.assertEqual(len(calls), 1)
+
+            # Nor failures inside a transaction, which is broken by then
+            view, calls = self.locked_view(failures=1)
+            with self.assertRaises(OperationalError), transaction.atomic():
+                view('ok')
+            self.assertEqual(len(calls), 1)
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """replica_reads views read the replica, except for a client that just wrote (ReplicaPinMiddleware)"""
+
+    # Resolved in setUpClass, once the replica alias exists
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        # A second SQLite alias, as REPLICA_DB_PATH would configure
+        cls.directory = tempfile.mkdtemp()
+        connections.settings[REPLICA] = {
+            **connections.settings['default'], 'NAME': os.path.join(cls.directory, 'replica.sqlite3'),
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        identity_cache.clear()
+        self.admin = Admin.objects.create(full_name='Admin', email='admin@wash.dz', password='x')
+        self.clients = [
+            Client.objects.create(full_name=f'Client {i}', email=f'c{i}@wash.dz', phone=f'055500016{i}',
+                                  age=30, password='x')
+            for i in range(3)
+        ]
+        call_command('sync_replica', stdout=io.StringIO())
+
+    def client_ids(self, api, headers=None):
+        response = api.get('/api/admin/clients/', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return {client['id'] for client in response.json()}
+
+    def test_router(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Client))
+        view = replica_reads(lambda request: router.db_for_read(Client))
+        self.assertEqual(view(RequestFactory().get('/')), REPLICA)
+        self.assertIsNone(view(RequestFactory().post('/')))
+        with transaction.atomic():
+            self.assertIsNone(view(RequestFactory().get('/')))
+
+        def writes(request):
+            router.db_for_write(Client)
+            return router.db_for_read(Client)
+
+        self.assertIsNone(replica_reads(writes)(RequestFactory().get('/')))
+
+    def test_pinned_after_a_write(self):
+        admin = api_client_for(self.admin, 'admin')
+        everyone = {client.id for client in self.clients}
+        self.assertEqual(self.client_ids(admin), everyone)
+
+        # Written on default only: the replica hasn't been synced yet
+        deleted = self.clients[0].id
+        self.assertEqual(admin.delete(f'/api/admin/client/{deleted}/').status_code, 204)
+        self.assertIn(PIN_COOKIE, admin.cookies)
+
+        # The admin who deleted sees it at once; other clients read the (stale) replica
+        self.assertEqual(self.client_ids(admin), everyone - {deleted})
+        self.assertEqual(self.client_ids(api_client_for(self.admin, 'admin')), everyone)
+
+        # Once the pin has expired the replica is used again
+        admin.cookies[PIN_COOKIE] = str(time.time() - 1)
+        self.assertEqual(self.client_ids(admin), everyone)
+        call_command('sync_replica', stdout=io.StringIO())
+        self.assertEqual(self.client_ids(admin), everyone - {deleted})
+
+    def test_pinned_by_the_header(self):
+        writer = api_client_for(self.admin, 'admin')
+        deleted = self.clients[0].id
+        response = writer.delete(f'/api/admin/client/{deleted}/', headers={'Origin': 'http://localhost:5173'})
+        self.assertIn(PIN_HEADER, response['Access-Control-Expose-Headers'])
+
+        # A cross-origin client sends no cookie, only the header it was given
+        admin = api_client_for(self.admin, 'admin')
+        everyone = {client.id for client in self.clients}
+        self.assertEqual(self.client_ids(admin), everyone)
+        self.assertEqual(self.client_ids(admin, {PIN_HEADER: response[PIN_HEADER]}), everyone - {deleted})
+        self.assertEqual(self.client_ids(admin, {PIN_HEADER: str(time.time() - 1)}), everyone)
+        self.assertEqual(self.client_ids(admin, {PIN_HEADER: 'soon'}), everyone)
+
+    def test_async_lists_read_the_replica(self):
+        # Written on default only, after the last sync
+        employee = ExternEmployee.objects.create(
+            full_name='Employee', email='employee@wash.dz', phone='0555000169', age=25, password='x',
+        )
+        AppointmentDomicile.objects.create(
+            client=self.clients[0], time=datetime.time(9), car_type='SUV', car_name='Golf', wash_type='Full',
+            place='Alger', price='1000',
+        )
+        api = api_client_for(employee, 'extern_employee')
+        # The account itself is read from default
+        response = api.get('/api/appointments_domicile/get_all?paginate=false')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json(), [])
+        call_command('sync_replica', stdout=io.StringIO())
+        self.assertEqual(len(api.get('/api/appointments_domicile/get_all?paginate=false').json()), 1)
+
+    def test_reads_do_not_pin(self):
+        admin = api_client_for(self.admin, 'admin')
+        self.client_ids(admin)
+        self.assertNotIn(PIN_COOKIE, admin.cookies)
+
+
+class ImageVariantTests(TestCase):
+    """Resized copies of uploaded photos (wash/images.py)"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client_user = Client.objects.create(
+            full_name='Client', email='client@wash.dz', phone='0555000170', age=30, password='x',
+        )
+
+    def upload(self, name, color, image_format='PNG'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 300), color).save(buffer, format=image_format)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def set_photo(self, client, upload):
+        serializer = ClientSerializer(client, data={'photo': upload}, partial=True)
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer.save()
+
+    def thumb_color(self, client):
+        with client.photo.storage.open(images.variant_name(client.photo.name, 'thumb', 'jpg')) as thumb:
+            return Image.open(thumb).convert('RGB').getpixel((10, 10))
+
+    def test_variant_name_keeps_the_extension(self):
+        self.assertEqual(images.variant_name('clients/a.png', 'thumb', 'webp'), 'clients/variants/a.png.thumb.webp')
+        self.assertNotEqual(images.variant_name('clients/a.png', 'thumb', 'jpg'),
+                            images.variant_name('clients/a.jpg', 'thumb', 'jpg'))
+
+    def test_same_stem_different_extension(self):
+        other = Client.objects.create(full_name='Other', email='other@wash.dz', phone='0555000171', age=30,
+                                      password='x')
+        first = self.set_photo(self.client_user, self.upload('a.png', (255, 0, 0)))
+        second = self.set_photo(other, self.upload('a.jpg', (0, 0, 255), 'JPEG'))
+        self.assertEqual(first.photo.name, 'clients/a.png')
+        self.assertEqual(second.photo.name, 'clients/a.jpg')
+
+        first_urls = images.variant_urls(first.photo, first.photo_variants_manifest)
+        second_urls = images.variant_urls(second.photo, second.photo_variants_manifest)
+        self.assertEqual(set(first_urls), set(images.VARIANT_SIZES))
+        self.assertEqual(set(first_urls['thumb']), set(images.VARIANT_FORMATS))
+        self.assertNotEqual(first_urls, second_urls)
+        # Each user's thumbnail is built from their own photo
+        self.assertEqual(self.thumb_color(first), (254, 0, 0))
+        self.assertGreater(self.thumb_color(second)[2], 200)
+
+    def test_failed_generation_lists_no_variants(self):
+        self.client_user.photo.save('broken.png', ContentFile(b'not an image'))
+        self.assertIsNone(images.build_variants(self.client_user, 'photo'))
+        self.assertIsNone(images.variant_urls(self.client_user.photo, self.client_user.photo_variants_manifest))
+        self.assertIsNone(ClientDetailSerializer(self.client_user).data['photo_variants'])
+        AppointmentDomicile.objects.create(
+            client=self.client_user, time=datetime.time(9), car_type='SUV', car_name='Golf', wash_type='Full',
+            place='Alger', price='1500',
+        )
+        data = AppointmentDomicileWithClientProjection(project_domicile(AppointmentDomicile.objects.all()), many=True).data
+        self.assertIsNone(data[0]['client_info']['photo_variants'])
+
+    def test_replacing_the_photo_deletes_the_old_variants(self):
+        first = self.set_photo(self.client_user, self.upload('me.png', (255, 0, 0)))
+        storage, old_name = first.photo.storage, first.photo.name
+        self.assertTrue(all(storage.exists(name) for name in images.variant_names(old_name)))
+
+        client = self.set_photo(Client.objects.get(pk=self.client_user.pk), self.upload('new.png', (0, 255, 0)))
+        self.assertFalse(any(storage.exists(name) for name in images.variant_names(old_name)))
+        self.assertTrue(all(storage.exists(name) for name in images.variant_names(client.photo.name)))
+        self.assertEqual(self.thumb_color(client), (0, 255, 1))
+
+    def test_lists_do_not_stat_the_storage(self):
+        client = self.set_photo(self.client_user, self.upload('me.png', (255, 0, 0)))
+        AppointmentDomicile.objects.create(
+            client=client, time=datetime.time(9), car_type='SUV', car_name='Golf', wash_type='Full',
+            place='Alger', price='1500',
+        )
+        with mock.patch.object(FileSystemStorage, 'exists') as exists:
+            clients = ClientDetailSerializer(Client.objects.all(), many=True).data
+            rows = AppointmentDomicileWithClientProjection(
+                project_domicile(AppointmentDomicile.objects.all()), many=True).data
+        exists.assert_not_called()
+        self.assertEqual(set(clients[0]['photo_variants']), set(images.VARIANT_SIZES))
+        self.assertEqual(rows[0]['client_info']['photo_variants'], clients[0]['photo_variants'])
+
+    def test_manifest_of_an_older_photo_is_ignored(self):
+        client = self.set_photo(self.client_user, self.upload('me.png', (255, 0, 0)))
+        Client.objects.filter(pk=client.pk).update(photo='clients/other.png')
+        client.refresh_from_db()
+        self.assertIsNone(images.variant_urls(client.photo, client.photo_variants_manifest))
+
+
+class MediaServingTests(TestCase):
+    """/media/ files (wash/media.py): validators, 304, ranges, traversal and X-Accel-Redirect"""
+
+    content = bytes(range(256)) * 4
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root, WASH_MEDIA={'MAX_AGE': 3600})
+        override.enable()
+        self.addCleanup(override.disable)
+        os.makedirs(os.path.join(self.media_root, 'clients'))
+        for name in ('photo.png', 'a b.png'):
+            with open(os.path.join(self.media_root, 'clients', name), 'wb') as f:
+                f.write(self.content)
+
+    def get(self, path='/media/clients/photo.png', **headers):
+        return self.client.get(path, headers=headers)
+
+    def test_full_response(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('max-age=3600', response['Cache-Control'])
+        self.assertIn('public', response['Cache-Control'])
+        self.assertTrue(response['ETag'].startswith('"'))
+
+        head = self.client.head('/media/clients/photo.png')
+        self.assertEqual(head.status_code, 200)
+        self.assertEqual(head['Content-Length'], str(len(self.content)))
+        self.assertEqual(head.content, b'')
+
+    def test_not_modified(self):
+        first = self.get()
+        for headers in ({'If-None-Match': first['ETag']}, {'If-Modified-Since': first['Last-Modified']}):
+            with self.subTest(headers):
+                response = self.get(**headers)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertEqual(response['ETag'], first['ETag'])
+        self.assertEqual(self.get(**{'If-None-Match': '"other"'}).status_code, 200)
+        self.assertEqual(self.get(**{'If-Modified-Since': 'Thu, 01 Jan 2015 00:00:00 GMT'}).status_code, 200)
+
+    def test_ranges(self):
+        size = len(self.content)
+        for header, start, end in (('bytes=2-5', 2, 5), ('bytes=-3', size - 3, size - 1),
+                                   ('bytes=1000-', 1000, size - 1), ('bytes=1020-5000', 1020, size - 1)):
+            with self.subTest(header):
+                response = self.get(Range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(b''.join(response.streaming_content), self.content[start:end + 1])
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{size}')
+                self.assertEqual(response['Content-Length'], str(end - start + 1))
+
+        response = self.get(Range=f'bytes={size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{size}')
+        self.assertIn('no-store', response['Cache-Control'])
+        self.assertNotIn('public', response['Cache-Control'])
+        # Several ranges, malformed ranges (last < first too) and a stale If-Range get the whole file
+        for headers in ({'Range': 'bytes=0-1,4-5'}, {'Range': 'items=0-1'}, {'Range': 'bytes=500-100'},
+                        {'Range': f'bytes={size + 10}-5'}, {'Range': 'bytes=0-1', 'If-Range': '"stale"'}):
+            with self.subTest(headers):
+                self.assertEqual(self.get(**headers).status_code, 200)
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(Range='bytes=0-1', **{'If-Range': etag}).status_code, 206)
+
+    def test_path_traversal(self):
+        with open(os.path.join(os.path.dirname(self.media_root), 'secret.txt'), 'w') as f:
+            self.addCleanup(os.remove, f.name)
+            f.write('secret')
+        for path in ('/media/../secret.txt', '/media/clients/../../secret.txt', '/media/%2e%2e/secret.txt',
+                     f'/media/{os.path.dirname(self.media_root)}/secret.txt', '/media/clients/',
+                     '/media/clients', '/media/clients/missing.png', '/media/clients/photo.png%00.txt'):
+            with self.subTest(path):
+                self.assertEqual(self.get(path).status_code, 404)
+
+    def test_accel_redirect(self):
+        with override_settings(WASH_MEDIA={'ACCEL_REDIRECT_PREFIX': '/protected-media/'}):
+            response = self.get('/media/clients/a b.png')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['X-Accel-Redirect'], '/protected-media/clients/a%20b.png')
+            self.assertEqual(response['Content-Type'], 'image/png')
+            self.assertEqual(response.content, b'')
+            # Conditional requests are still answered by Django
+            self.assertEqual(self.get('/media/clients/a b.png', **{'If-None-Match': response['ETag']}).status_code, 304)
+            self.assertEqual(self.get('/media/../secret.txt').status_code, 404)
+
+
+class ConditionalListTests(TestCase):
+    """ETag / 304 on the paginated lists: each page is validated from its own rows"""
+
+    def setUp(self):
+        identity_cache.clear()
+        self.client_user = Client.objects.create(
+            full_name='Client', email='client@wash.dz', phone='0555000180', age=30, password='x',
+        )
+        self.api = api_client_for(self.client_user, 'client')
+        self.appointments = [
+            AppointmentDomicile.objects.create(
+                client=self.client_user, time=datetime.time(9 + i), car_type='SUV', car_name=f'Car {i}',
+                wash_type='Full', place='Alger', price='1500',
+            )
+            for i in range(6)
+        ]
+
+    def get(self, query='?page_size=2', etag=None):
+        headers = {'If-None-Match': etag} if etag else {}
+        return self.api.get('/api/appointments_domicile/get' + query, headers=headers)
+
+    def page_two(self):
+        return '?page_size=2&cursor=' + self.get().json()['next']
+
+    def touch(self, appointment):
+        appointment.car_name += ' (edited)'
+        appointment.save()
+
+    def test_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            cached = self.get(etag=etag)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+        self.assertEqual(cached['ETag'], etag)
+        self.assertIn('private', cached['Cache-Control'])
+        self.assertIn('Authorization', cached['Vary'])
+        # Another page, another ETag
+        self.assertNotEqual(self.get('?page_size=3')['ETag'], etag)
+
+    def test_change_on_another_page(self):
+        first, second = self.get(), self.get(self.page_two())
+        # The last row of the last page: outside page 1 and its look-ahead row
+        self.touch(self.appointments[-1])
+        self.assertEqual(self.get(etag=first['ETag']).status_code, 304)
+        self.assertEqual(self.get(self.page_two(), etag=second['ETag']).status_code, 304)
+        last_page = '?page_size=2&cursor=' + self.get(self.page_two()).json()['next']
+        self.assertEqual(self.get(last_page).json()['results'][-1]['car_name'], 'Car 5 (edited)')
+
+        AppointmentDomicile.objects.create(
+            client=self.client_user, time=datetime.time(18), car_type='SUV', car_name='New',
+            wash_type='Full', place='Alger', price='1500',
+        )
+        self.assertEqual(self.get(etag=first['ETag']).status_code, 304)
+
+    def test_change_on_this_page(self):
+        etag = self.get()['ETag']
+        self.touch(self.appointments[1])
+        response = self.get(etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][1]['car_name'], 'Car 1 (edited)')
+
+        # A deleted row lets the next one in without moving the count or the timestamps
+        etag = response['ETag']
+        AppointmentDomicile.objects.filter(pk=self.appointments[0].pk).delete()
+        response = self.get(etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.json()['results']],
+                         [self.appointments[1].id, self.appointments[2].id])
+
+        # The embedded client_info
+        etag = response['ETag']
+        self.client_user.full_name = 'Renamed'
+        self.client_user.save()
+        self.assertEqual(self.get(etag=etag).status_code, 200)
+
+    def test_unpaginated_list(self):
+        etag = self.get('?paginate=false')['ETag']
+        self.assertEqual(self.get('?paginate=false', etag=etag).status_code, 304)
+        self.touch(self.appointments[-1])
+        self.assertEqual(self.get('?paginate=false', etag=etag).status_code, 200)
+
+    def test_bad_request_has_no_etag(self):
+        response = self.get('?cursor=bad')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_public_list(self):
+        for i in range(4):
+            Feedback.objects.create(name=f'C{i}', email=f'c{i}@wash.dz', content='ok', rating=5, approved=True)
+        first = self.client.get('/api/feedback/all/?page_size=2')
+        self.assertIn('max-age=60', first['Cache-Control'])
+        # Newest first: the oldest feedback is on the last page
+        oldest = Feedback.objects.order_by('created_at', 'id').first()
+        oldest.content = 'edited'
+        oldest.save()
+        cached = self.client.get('/api/feedback/all/?page_size=2', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(cached.status_code, 304)
+
+
+class JSONParityTests(TestCase):
+    """ORJSONRenderer against DRF's JSONRenderer"""
+
+    def test_renderer(self):
+        cases = [
+            {'a': 1, 'nested': [1, 2.5, None, True, 'é😀']},
+            2 ** 64, -2 ** 63 - 1, 0.1, 1.0,
+            datetime.datetime(2025, 1, 2, 3, 4, 5, 678901),
+            datetime.datetime(2025, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc),
+            datetime.datetime(2025, 1, 2, 3, 4, 5, tzinfo=datetime.timezone(datetime.timedelta(hours=1))),
+            datetime.date(2025, 1, 2), datetime.time(9, 15, 30, 123456), datetime.timedelta(hours=1, seconds=3),
+            Decimal('1500.50'), uuid.UUID(int=5), ErrorDetail('غير صالح', code='invalid'), gettext_lazy('lazy'),
+            (1, 2), {1: 'a', 2.5: 'b', None: 'c'}, b'bytes', 'line\u2028separator\u2029', frozenset([1]),
+            ReturnDict({'a': 1}, serializer=None), ReturnList([1], serializer=None),
+        ]
+        for data in cases:
+            with self.subTest(data=data):
+                self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        # Same value, other spelling
+        self.assertEqual(json.loads(ORJSONRenderer().render([1e20])), json.loads(JSONRenderer().render([1e20])))
+        # Indented output is the stock renderer's
+        context = {'indent': 2}
+        self.assertEqual(ORJSONRenderer().render({'a': [1]}, 'application/json', context),
+                         JSONRenderer().render({'a': [1]}, 'application/json', context))
+
+    def test_renderer_non_finite_floats(self):
+        """Documented difference: null where the stock renderer raises"""
+        for value in (float('nan'), float('inf'), -float('inf')):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    JSONRenderer().render([value])
+                self.assertEqual(ORJSONRenderer().render([value]), b'[null]')
+
+    def test_default_classes(self):
+        self.assertIs(api_settings.DEFAULT_RENDERER_CLASSES[0], ORJSONRenderer)
+        self.assertIs(api_settings.DEFAULT_PARSER_CLASSES[0], JSONParser)
+        response = self.client.post('/api/auth/client/login/', b'{"email": ', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.json()['detail'])
+
+
+class RefreshLeaderboardCommandTests(TransactionTestCase):
+    """refresh_leaderboard --interval retries lock errors and survives failed refreshes"""
+
+    class Stop(Exception):
+        pass
+
+    def setUp(self):
+        ExternEmployee.objects.create(
+            full_name='Employee', email='employee@wash.dz', phone='0555000190', age=25, password='x',
+        )
+
+    def run_command(self, side_effect, iterations, *args):
+        """Run the command with rebuild_leaderboard failing as side_effect says, for `iterations` loops"""
+        real_rebuild = rollups.rebuild_leaderboard
+        effects = iter(side_effect)
+
+        def rebuild(*rebuild_args):
+            effect = next(effects, None)
+            if effect is not None:
+                raise effect
+            return real_rebuild(*rebuild_args)
+
+        sleeps = []
+
+        def sleep(seconds):
+            # The retry backoff (WASH_DB_RETRY delays are 0 here) doesn't count as a loop
+            if seconds:
+                sleeps.append(seconds)
+                if len(sleeps) >= iterations:
+                    raise self.Stop
+
+        stdout = io.StringIO()
+        with mock.patch('wash.management.commands.refresh_leaderboard.rebuild_leaderboard', side_effect=rebuild), \
+                mock.patch('time.sleep', side_effect=sleep):
+            try:
+                call_command('refresh_leaderboard', *args, stdout=stdout)
+            except self.Stop:
+                pass
+        return stdout.getvalue()
+
+    @override_settings(WASH_DB_RETRY={'ATTEMPTS': 3, 'BASE_DELAY': 0, 'MAX_DELAY': 0})
+    def test_lock_errors_are_retried(self):
+        output = self.run_command([OperationalError('database is locked')] * 2, 1)
+        self.assertIn('leaderboard refreshed for 1 extern employee(s)', output)
+        self.assertEqual(LeaderboardEntry.objects.count(), 4)
+
+    @override_settings(WASH_DB_RETRY={'ATTEMPTS': 2, 'BASE_DELAY': 0, 'MAX_DELAY': 0})
+    def test_interval_loop_survives_failures(self):
+        errors = [OperationalError('database is locked')] * 2 + [OperationalError('disk I/O error')]
+        with self.assertLogs('wash.management.commands.refresh_leaderboard', 'ERROR') as logs:
+            output = self.run_command(errors, 3, '--interval', '60')
+        # Two failed iterations (locked after every retry, then another error), then a refresh
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(output.count('leaderboard refreshed'), 1)
+        self.assertEqual(LeaderboardEntry.objects.count(), 4)
+
+    def test_single_refresh_raises(self):
+        with self.assertRaises(OperationalError):
+            self.run_command([OperationalError('disk I/O error')], 1)
+
+
+class ClaimTests(TransactionTestCase):
+    """appointments_domicile/<id>/claim: one conditional UPDATE, exactly one winner"""
+
+    def setUp(self):
+        self.client_user = Client.objects.create(
+            full_name='Client', email='client@wash.dz', phone='0555000150', age=30, password='x',
+        )
+        self.employees = [
+            ExternEmployee.objects.create(
+                full_name=f'Employee {i}', email=f'e{i}@wash.dz', phone='0555000151', age=25, password='x',
+            )
+            for i in range(4)
+        ]
+        identity_cache.clear()
+
+    def appointment(self):
+        return AppointmentDomicile.objects.create(
+            client=self.client_user, time=datetime.time(9), car_type='SUV', car_name='Golf', wash_type='Full',
+            place='Alger', price='1000',
+        )
+
+    def claim(self, employee, appointment_id):
+        api = api_client_for(employee, 'extern_employee')
+        return api.post(f'/api/appointments_domicile/{appointment_id}/claim')
+
+    def test_one_winner_per_race(self):
+        appointments = [self.appointment() for _ in range(5)]
+        barrier = threading.Barrier(len(self.employees))
+        responses = {appointment.id: [] for appointment in appointments}
+        lock = threading.Lock()
+
+        def worker(employee):
+            try:
+                for appointment in appointments:
+                    barrier.wait()
+                    response = self.claim(employee, appointment.id)
+                    with lock:
+                        responses[appointment.id].append((employee.id, response.status_code))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(employee,)) for employee in self.employees]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for appointment in appointments:
+            codes = sorted(code for _, code in responses[appointment.id])
+            self.assertEqual(codes, [200, 400, 400, 400])
+            winner = next(employee_id for employee_id, code in responses[appointment.id] if code == 200)
+            appointment.refresh_from_db()
+            self.assertEqual((appointment.status, appointment.extern_employee_id), ('In Progress', winner))
+
+    def test_already_claimed(self):
+        appointment = self.appointment()
+        self.assertEqual(self.claim(self.employees[0], appointment.id).status_code, 200)
+        response = self.claim(self.employees[1], appointment.id)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['status'], 'In Progress')
+        self.assertEqual(response.json()['claimed_by'], self.employees[0].id)
+
+    def test_unknown_appointment(self):
+        self.assertEqual(self.claim(self.employees[0], 999999).status_code, 404)
+
+    def test_updated_at_and_stats(self):
+        appointment = self.appointment()
+        before = appointment.updated_at
+        self.assertEqual(AppointmentDailyStat.objects.get(status='Pending').count, 1)
+
+        response = self.claim(self.employees[0], appointment.id)
+        self.assertEqual(response.status_code, 200, response.content)
+        appointment.refresh_from_db()
+        self.assertGreater(appointment.updated_at, before)
+        self.assertEqual(
+            list(AppointmentDailyStat.objects.exclude(count=0).values_list('status', 'employee', 'count', 'revenue')),
+            [('In Progress', self.employees[0].id, 1, Decimal('1000'))],
+        )
+
+
+class HotQueryPlanTests(TestCase):
+    """
+    The list/filter queries behind the appointment and feedback endpoints must be
+    answered from an index: a bare "SCAN <table>" or a temp B-tree sort fails the test.
+    """
+    FULL_SCAN = re.compile(r'\bSCAN wash_\w+\s*$|USE TEMP B-TREE', re.MULTILINE)
+
+    def hot_querysets(self):
+        now = timezone.now()
+        return {
+            'pending list': keyset_queryset(
+                AppointmentDomicile.objects.filter(status='Pending'), ID_ORDERING, (50, None)),
+            'pending next page': keyset_queryset(
+                AppointmentDomicile.objects.filter(status='Pending'), ID_ORDERING, (50, [10])),
+            'extern employee appointments': AppointmentDomicile.objects.filter(
+                extern_employee_id=1, status='In Progress'),
+            'client domicile appointments': AppointmentDomicile.objects.filter(
+                client_id=1, status='Pending'),
+            'client location appointments': AppointmentLocation.objects.filter(
+                client_id=1, status='Pending'),
+            'location day stats': AppointmentLocation.objects.filter(
+                date=now.date(), status='Completed'),
+            'domicile created_at range': AppointmentDomicile.objects.filter(
+                created_at__gte=now - datetime.timedelta(days=1), created_at__lt=now),
+            'approved feedback': keyset_queryset(
+                Feedback.objects.filter(approved=True), CREATED_AT_ORDERING, (50, None)),
+            'approved feedback next page': keyset_queryset(
+                Feedback.objects.filter(approved=True), CREATED_AT_ORDERING, (50, [now.isoformat(), 10])),
+            'leaderboard top': LeaderboardEntry.objects.filter(metric='week', rank__lte=10).order_by('rank'),
+            'leaderboard employee': LeaderboardEntry.objects.filter(extern_employee_id=1),
+            'pending near': AppointmentDomicile.objects.filter(status='Pending').filter(
+                Q(grid_cell__range=(10, 20), status='Pending') | Q(grid_cell__range=(36010, 36020), status='Pending')),
+        }
+
+    @skipUnlessDBFeature('supports_explaining_query_execution')
+    def test_hot_queries_use_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN output is SQLite specific')
+        for name, queryset in self.hot_querysets().items():
+            with self.subTest(name):
+                plan = queryset.explain()
+                self.assertIsNone(self.FULL_SCAN.search(plan), f'{name}:\n{plan}')
+
+    @skipUnlessDBFeature('supports_explaining_query_execution')
+    def test_pending_near_searches_each_range(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN output is SQLite specific')
+        # Without the index condition in each range the whole index is scanned
+        plan = self.hot_querysets()['pending near'].explain()
+        self.assertIn('MULTI-INDEX OR', plan)
+        self.assertNotIn('SCAN', plan)
+
+
+
+class ProjectionParityTests(TestCase):
+    """
+    The values() projections behind the appointment lists must render exactly
+    the JSON of the WithClient serializers they replace.
+    """
+    def setUp(self):
+        with_photo = Client.objects.create(
+            full_name='عميل', email='photo@wash.dz', phone='0555000001', age=30,
+            password='x', photo='clients/me.png',
+        )
+        without_photo = Client.objects.create(
+            full_name='Client', email='plain@wash.dz', phone='0555000002', age=41, password='x',
+        )
+        employee = ExternEmployee.objects.create(
+            full_name='Employee', email='employee@wash.dz', phone='0555000003', age=25, password='x',
+        )
+        for client, extern_employee, price, latitude, longitude in (
+            (with_photo, employee, '1500.5', 36.7538, 3.0588),
+            (without_photo, None, '800', None, None),
+            (with_photo, None, '99999999.99', -33.5, 151),
+        ):
+            AppointmentDomicile.objects.create(
+                client=client, extern_employee=extern_employee, time=datetime.time(9, 15, 30),
+                car_type='SUV', car_name='Golf', wash_type='Full', place='باب الزوار', price=price,
+                latitude=latitude, longitude=longitude,
+            )
+            AppointmentLocation.objects.create(
+                client=client, date=datetime.date(2025, 3, 1), time=datetime.time(17, 45),
+                car_type='Sedan', car_name='Clio', wash_type='Basic', price=price,
+            )
+
+    def assertSameJSON(self, projection, rows, serializer, objects):
+        renderer = ORJSONRenderer()
+        for context in ({}, {'request': RequestFactory().get('/')}):
+            with self.subTest(context=context):
+                self.assertEqual(
+                    renderer.render(projection(list(rows), many=True, context=context).data),
+                    renderer.render(serializer(list(objects), many=True, context=context).data),
+                )
+
+    def test_domicile(self):
+        queryset = AppointmentDomicile.objects.order_by('id')
+        self.assertSameJSON(
+            AppointmentDomicileWithClientProjection, project_domicile(queryset),
+            AppointmentDomicileWithClientSerializer, queryset.select_related('client'),
+        )
+
+    def test_location(self):
+        queryset = AppointmentLocation.objects.order_by('id')
+        self.assertSameJSON(
+            AppointmentLocationWithClientProjection, project_location(queryset),
+            AppointmentLocationWithClientSerializer, queryset.select_related('client'),
+        )
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            AppointmentDomicileWithClientProjection(
+                project_domicile(AppointmentDomicile.objects.all()), many=True).data
+
+
+class BatchCreateTests(TestCase):
+    """appointments_*/create/batch: one insert for the valid items, one result per item"""
+    def setUp(self):
+        self.client_user = Client.objects.create(
+            full_name='Fleet', email='fleet@wash.dz', phone='0555000010', age=40, password='x',
+        )
+        self.api = api_client_for(self.client_user, 'client')
+
+    def domicile_item(self, **overrides):
+        item = {'time': '09:00', 'car_type': 'SUV', 'car_name': 'Golf', 'wash_type': 'Full',
+                'place': 'Alger', 'price': '1500.00'}
+        item.update(overrides)
+        return item
+
+    def test_all_valid(self):
+        items = [self.domicile_item(car_name=f'Car {i}') for i in range(30)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.post('/api/appointments_domicile/create/batch', {'appointments': items}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "wash_appointmentdomicile"')]
+        self.assertEqual(len(inserts), 1)
+
+        results = response.json()['results']
+        self.assertEqual([r['appointment']['car_name'] for r in results], [f'Car {i}' for i in range(30)])
+        self.assertEqual(AppointmentDomicile.objects.filter(client=self.client_user, status='Pending').count(), 30)
+        stat = AppointmentDailyStat.objects.get(channel='domicile', status='Pending', wash_type='Full')
+        self.assertEqual((stat.count, stat.revenue), (30, Decimal('45000.00')))
+
+    def test_partial(self):
+        items = [
+            {'date': '2025-03-01', 'time': '10:00', 'car_type': 'Sedan', 'car_name': 'Clio',
+             'wash_type': 'Basic', 'price': '800'},
+            {'date': 'not a date', 'time': '10:00', 'car_type': 'Sedan', 'car_name': 'Clio',
+             'wash_type': 'Basic', 'price': '800'},
+        ]
+        response = self.api.post('/api/appointments_location/create/batch', items, format='json')
+        self.assertEqual(response.status_code, 207, response.content)
+        first, second = response.json()['results']
+        self.assertEqual((first['index'], first['status']), (0, 201))
+        self.assertEqual((second['index'], second['status']), (1, 400))
+        self.assertIn('date', second['errors'])
+        self.assertEqual(AppointmentLocation.objects.count(), 1)
+
+    def test_limits(self):
+        url = '/api/appointments_domicile/create/batch'
+        self.assertEqual(self.api.post(url, {'appointments': []}, format='json').status_code, 400)
+        too_many = [self.domicile_item()] * 101
+        self.assertEqual(self.api.post(url, too_many, format='json').status_code, 400)
+        self.assertEqual(self.api.post(url, [{'price': 'x'}], format='json').status_code, 400)
+        self.assertFalse(AppointmentDomicile.objects.exists())
+
+
+class BulkTransitionTests(TestCase):
+    """appointments_*/status/bulk: one permission-scoped read, one UPDATE, bookkeeping in bulk"""
+    def setUp(self):
+        self.client_user = Client.objects.create(
+            full_name='Client', email='client@wash.dz', phone='0555000020', age=30, password='x',
+        )
+        self.employee = ExternEmployee.objects.create(
+            full_name='Employee', email='employee@wash.dz', phone='0555000021', age=25, password='x',
+        )
+        self.other = ExternEmployee.objects.create(
+            full_name='Other', email='other@wash.dz', phone='0555000022', age=25, password='x',
+        )
+        self.mine = [
+            AppointmentDomicile.objects.create(
+                client=self.client_user, extern_employee=self.employee, status='In Progress',
+                time=datetime.time(9), car_type='SUV', car_name='Golf', wash_type='Full', place='Alger', price='1000',
+            )
+            for _ in range(3)
+        ]
+        self.theirs = AppointmentDomicile.objects.create(
+            client=self.client_user, extern_employee=self.other, status='In Progress',
+            time=datetime.time(9), car_type='SUV', car_name='Golf', wash_type='Full', place='Alger', price='1000',
+        )
+        # A history row left from an earlier completion must not be counted twice
+        ExternEmployeeHistory.objects.create(
+            extern_employee=self.employee, client=self.client_user, appointment=self.mine[0], cars_washed=1,
+        )
+
+    def test_employee_completes_own_appointments(self):
+        api = api_client_for(self.employee, 'extern_employee')
+        ids = [a.id for a in self.mine] + [self.theirs.id, 999]
+        with CaptureQueriesContext(connection) as queries:
+            response = api.post(
+                '/api/appointments_domicile/status/bulk', {'ids': ids, 'status': 'Completed'}, format='json'
+            )
+        self.assertEqual(response.status_code, 207, response.content)
+        self.assertEqual([r['status'] for r in response.json()['results']], [200, 200, 200, 404, 404])
+        updates = [q for q in queries if q['sql'].startswith('UPDATE "wash_appointmentdomicile"')]
+        self.assertEqual(len(updates), 1)
+
+        self.assertEqual(AppointmentDomicile.objects.filter(status='Completed').count(), 3)
+        self.assertEqual(AppointmentDomicile.objects.get(id=self.theirs.id).status, 'In Progress')
+        history = dict(ExternEmployeeHistory.objects.values_list('appointment_id', 'cars_washed'))
+        self.assertEqual(history, {self.mine[0].id: 1, self.mine[1].id: 1, self.mine[2].id: 1})
+        self.employee.refresh_from_db()
+        self.assertEqual((self.employee.total_cars_washed, self.employee.total_clients), (3, 1))
+        stats = dict(AppointmentDailyStat.objects.filter(channel='domicile').values_list('status', 'count'))
+        self.assertEqual(stats, {'In Progress': 1, 'Completed': 3})
+
+    def test_validation_and_permissions(self):
+        url = '/api/appointments_domicile/status/bulk'
+        admin = api_client_for(Admin.objects.create(full_name='Admin', email='admin@wash.dz', password='x'), 'admin')
+        self.assertEqual(admin.post(url, {'ids': [self.theirs.id], 'status': 'Done'}, format='json').status_code, 400)
+        self.assertEqual(admin.post(url, {'ids': ['x'], 'status': 'Completed'}, format='json').status_code, 400)
+        client = api_client_for(self.client_user, 'client')
+        self.assertEqual(client.post(url, {'ids': [self.theirs.id], 'status': 'Completed'}, format='json').status_code, 403)
+
+        response = admin.post(url, {'ids': [self.theirs.id], 'status': 'Completed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['updated'], 1)
+
+
+class EmployeeHistoryTests(TestCase):
+    """History rows are written once per completion and summarized on the employee rows"""
+    def setUp(self):
+        self.clients = [
+            Client.objects.create(full_name=f'Client {i}', email=f'c{i}@wash.dz', phone='0555000030', age=30, password='x')
+            for i in range(2)
+        ]
+        self.employee = ExternEmployee.objects.create(
+            full_name='Employee', email='employee@wash.dz', phone='0555000031', age=25, password='x',
+        )
+        self.intern = InternEmployee.objects.create(
+            full_name='Intern', email='intern@wash.dz', phone='0555000032', age=25, password='x',
+        )
+
+    def domicile(self, client):
+        return AppointmentDomicile.objects.create(
+            client=client, extern_employee=self.employee, status='In Progress', time=datetime.time(9),
+            car_type='SUV', car_name='Golf', wash_type='Full', place='Alger', price='1000',
+        )
+
+    def test_resaving_a_completed_appointment_counts_once(self):
+        first, second, third = self.domicile(self.clients[0]), self.domicile(self.clients[0]), self.domicile(self.clients[1])
+        for appointment in (first, second, third):
+            appointment.status = 'Completed'
+            appointment.save()
+        first.car_name = 'Polo'
+        first.save()
+        # Back and forth through another status does not count it again either
+        AppointmentDomicile.objects.get(id=second.id).save()
+        second.status = 'In Progress'
+        second.save()
+        second.status = 'Completed'
+        second.save()
+
+        self.assertEqual(list(ExternEmployeeHistory.objects.values_list('cars_washed', flat=True)), [1, 1, 1])
+        self.employee.refresh_from_db()
+        self.assertEqual((self.employee.total_cars_washed, self.employee.total_clients), (3, 2))
+
+        api = api_client_for(self.employee, 'extern_employee')
+        with CaptureQueriesContext(connection) as queries:
+            data = api.get('/api/extern_employee/details/').json()
+        self.assertEqual((data['total_cars_washed'], data['total_clients']), (3, 2))
+        self.assertFalse([q for q in queries if 'SUM(' in q['sql'] or 'COUNT(' in q['sql']])
+
+        # Deleting a client removes its history and updates the counters
+        self.clients[1].delete()
+        self.employee.refresh_from_db()
+        self.assertEqual((self.employee.total_cars_washed, self.employee.total_clients), (2, 1))
+
+    def test_location_is_credited_to_its_intern_employee(self):
+        unassigned = AppointmentLocation.objects.create(
+            client=self.clients[0], date=datetime.date(2025, 3, 1), time=datetime.time(9),
+            car_type='SUV', car_name='Golf', wash_type='Full', price='500', status='Completed',
+        )
+        self.assertFalse(InternEmployeeHistory.objects.exists())
+
+        api = api_client_for(self.intern, 'intern_employee')
+        appointment = AppointmentLocation.objects.create(
+            client=self.clients[0], date=datetime.date(2025, 3, 1), time=datetime.time(10),
+            car_type='SUV', car_name='Golf', wash_type='Full', price='500',
+        )
+        response = api.put(f'/api/appointments_location/{appointment.id}/', {'status': 'Completed'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        history = InternEmployeeHistory.objects.get()
+        self.assertEqual((history.intern_employee_id, history.appointment_id), (self.intern.id, appointment.id))
+        self.intern.refresh_from_db()
+        self.assertEqual(self.intern.total_cars_washed, 1)
+        self.assertIsNone(AppointmentLocation.objects.get(id=unassigned.id).intern_employee_id)
+
+    def assertTotals(self, employee, cars_washed, clients):
+        employee.refresh_from_db()
+        self.assertEqual((employee.total_cars_washed, employee.total_clients), (cars_washed, clients))
+
+    def test_leaving_completed_removes_the_history_row(self):
+        first, second, third = self.domicile(self.clients[0]), self.domicile(self.clients[0]), self.domicile(self.clients[1])
+        for appointment in (first, second, third):
+            appointment.status = 'Completed'
+            appointment.save()
+        self.assertTotals(self.employee, 3, 2)
+
+        first.status = 'In Progress'
+        first.save()
+        self.assertTotals(self.employee, 2, 2)
+        third = AppointmentDomicile.objects.get(id=third.id)
+        third.status = 'Deleted'
+        third.save()
+        self.assertTotals(self.employee, 1, 1)
+        self.assertEqual(list(ExternEmployeeHistory.objects.values_list('appointment_id', flat=True)), [second.id])
+
+        # Completing it again counts it again
+        first.status = 'Completed'
+        first.save()
+        self.assertTotals(self.employee, 2, 1)
+
+    def test_bulk_transition_out_of_completed(self):
+        appointments = [self.domicile(client) for client in self.clients] + [self.domicile(self.clients[0])]
+        api = api_client_for(self.employee, 'extern_employee')
+        ids = [appointment.id for appointment in appointments]
+        response = api.post('/api/appointments_domicile/status/bulk', {'ids': ids, 'status': 'Completed'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTotals(self.employee, 3, 2)
+
+        response = api.post('/api/appointments_domicile/status/bulk', {'ids': ids[1:], 'status': 'Deleted'},
+                            format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTotals(self.employee, 1, 1)
+        self.assertEqual(list(ExternEmployeeHistory.objects.values_list('appointment_id', flat=True)), [ids[0]])
+
+        # Location appointments, through the intern employee's history
+        location = AppointmentLocation.objects.create(
+            client=self.clients[0], date=datetime.date(2025, 3, 1), time=datetime.time(10),
+            car_type='SUV', car_name='Golf', wash_type='Full', price='500',
+        )
+        intern = api_client_for(self.intern, 'intern_employee')
+        for target, totals in (('Completed', (1, 1)), ('In Progress', (0, 0))):
+            response = intern.post('/api/appointments_location/status/bulk', {'ids': [location.id], 'status': target},
+                                   format='json')
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertTotals(self.intern, *totals)
+        self.assertFalse(InternEmployeeHistory.objects.exists())
+
+
+class RatingTests(TestCase):
+    """Ratings keep a count and sum on the employee; final_rating is never aggregated on read"""
+    def setUp(self):
+        self.employee = ExternEmployee.objects.create(
+            full_name='Employee', email='employee@wash.dz', phone='0555000041', age=25, password='x',
+        )
+        self.clients = []
+        for i in range(3):
+            client = Client.objects.create(
+                full_name=f'Client {i}', email=f'r{i}@wash.dz', phone='0555000040', age=30, password='x',
+            )
+            AppointmentDomicile.objects.create(
+                client=client, extern_employee=self.employee, status='Completed', time=datetime.time(9),
+                car_type='SUV', car_name='Golf', wash_type='Full', place='Alger', price='1000',
+            )
+            self.clients.append(client)
+        self.url = f'/api/extern_employee/{self.employee.id}/rating/'
+
+    def rate(self, client, rating):
+        return api_client_for(client, 'client').post(self.url, {'rating': rating}, format='json')
+
+    def test_ratings_update_the_stored_average(self):
+        self.assertEqual(self.rate(self.clients[0], 5).status_code, 201)
+        self.assertEqual(self.rate(self.clients[1], 4).status_code, 201)
+        response = self.rate(self.clients[1], 2)  # changes the rating, not the count
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'rating': 2, 'final_rating': 3.5, 'rating_count': 2})
+
+        api = api_client_for(self.clients[2], 'client')
+        with CaptureQueriesContext(connection) as queries:
+            details = api.get(f'/api/extern_employee/{self.employee.id}/').json()
+        self.assertEqual((details['final_rating'], details['rating_count']), (3.5, 2))
+        self.assertFalse([q for q in queries if 'wash_rating' in q['sql']])
+
+        self.clients[0].delete()
+        self.employee.refresh_from_db()
+        self.assertEqual((self.employee.rating_count, self.employee.rating_sum, self.employee.final_rating), (1, 2, 2.0))
+
+    def test_rules(self):
+        stranger = Client.objects.create(full_name='S', email='s@wash.dz', phone='0555000042', age=30, password='x')
+        self.assertEqual(self.rate(stranger, 5).status_code, 403)
+        self.assertEqual(self.rate(self.clients[0], 6).status_code, 400)
+        self.assertFalse(Rating.objects.exists())
+
+    def test_recompute_ratings_repairs_drift(self):
+        self.rate(self.clients[0], 5)
+        self.rate(self.clients[1], 3)
+        ExternEmployee.objects.filter(id=self.employee.id).update(rating_count=9, rating_sum=1, final_rating=0.1)
+        call_command('recompute_ratings', stdout=io.StringIO())
+        self.employee.refresh_from_db()
+        self.assertEqual((self.employee.rating_count, self.employee.rating_sum, self.employee.final_rating), (2, 8, 4.0))
+
+
+class LeaderboardTests(TestCase):
+    """The leaderboard is computed by refresh_leaderboard and served with one query"""
+    def setUp(self):
+        self.client_user = Client.objects.create(
+            full_name='Client', email='client@wash.dz', phone='0555000050', age=30, password='x',
+        )
+        self.employees = [
+            ExternEmployee.objects.create(
+                full_name=f'Employee {i}', email=f'e{i}@wash.dz', phone='0555000051', age=25, password='x',
+                final_rating=rating,
+            )
+            for i, rating in enumerate([3.0, 4.5, 4.5])
+        ]
+        # Employee 0: 2 cars this week, 1 claimed appointment left; employee 1: 1 car last month
+        for employee, status, completed_at in (
+            (self.employees[0], 'Completed', timezone.now()),
+            (self.employees[0], 'Completed', timezone.now()),
+            (self.employees[0], 'In Progress', None),
+            (self.employees[1], 'Completed', timezone.now() - datetime.timedelta(days=62)),
+        ):
+            appointment = AppointmentDomicile.objects.create(
+                client=self.client_user, extern_employee=employee, status=status, time=datetime.time(9),
+                car_type='SUV', car_name='Golf', wash_type='Full', place='Alger', price='1000',
+            )
+            if completed_at:
+                ExternEmployeeHistory.objects.filter(appointment=appointment).update(completed_at=completed_at)
+        call_command('refresh_leaderboard', stdout=io.StringIO())
+        self.api = api_client_for(Admin.objects.create(full_name='Admin', email='admin@wash.dz', password='x'), 'admin')
+        # Warm the identity cache so the counts below are the leaderboard's own queries
+        identity_cache.clear()
+        self.api.get('/api/admin/leaderboard/')
+
+    def top(self, metric, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.api.get('/api/admin/leaderboard/', {'metric': metric, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(queries), 1)
+        return [(r['employee_id'], r['value']) for r in response.json()['results']]
+
+    def test_rankings(self):
+        e0, e1, e2 = (employee.id for employee in self.employees)
+        # Ties keep the id order
+        self.assertEqual(self.top('rating'), [(e1, 4.5), (e2, 4.5), (e0, 3.0)])
+        self.assertEqual(self.top('rating', limit=1), [(e1, 4.5)])
+        self.assertEqual(self.top('month')[0], (e0, 2))
+        self.assertEqual(self.top('completion'), [(e1, 1.0), (e0, 2 / 3), (e2, 0.0)])
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.api.get(f'/api/admin/leaderboard/{e0}/').json()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(data['ranks']['week'], {'rank': 1, 'value': 2.0, 'out_of': 3})
+        self.assertEqual(data['ranks']['rating']['rank'], 3)
+
+    def test_errors(self):
+        self.assertEqual(self.api.get('/api/admin/leaderboard/', {'metric': 'speed'}).status_code, 400)
+        self.assertEqual(self.api.get('/api/admin/leaderboard/', {'limit': 'x'}).status_code, 400)
+        self.assertEqual(self.api.get('/api/admin/leaderboard/999/').status_code, 404)
+
+
+class NearbyPendingTests(TestCase):
+    """pending/near must return exactly what a full scan would, nearest first"""
+    CENTER = (36.7538, 3.0588)
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.client_user = Client.objects.create(
+            full_name='Client', email='client@wash.dz', phone='0555000060', age=30, password='x',
+        )
+        AppointmentDomicile.objects.bulk_create([
+            AppointmentDomicile(
+                client=self.client_user, time=datetime.time(9), car_type='SUV', car_name='Golf', wash_type='Full',
+                place='Alger', price='1000', status='Pending' if i % 5 else 'Completed',
+                latitude=self.CENTER[0] + rng.uniform(-0.3, 0.3), longitude=self.CENTER[1] + rng.uniform(-0.3, 0.3),
+            )
+            for i in range(400)
+        ])
+        for appointment in AppointmentDomicile.objects.all():
+            appointment.save()  # fills grid_cell
+        # Pending without coordinates: never returned
+        AppointmentDomicile.objects.create(
+            client=self.client_user, time=datetime.time(9), car_type='SUV', car_name='Golf', wash_type='Full',
+            place='Alger', price='1000',
+        )
+        self.employee = ExternEmployee.objects.create(
+            full_name='Employee', email='employee@wash.dz', phone='0555000061', age=25, password='x',
+        )
+
+    def scan(self, latitude, longitude, radius_km, limit):
+        rows = AppointmentDomicile.objects.filter(status='Pending', latitude__isnull=False)
+        distances = sorted(
+            (geo.haversine_km(latitude, longitude, row.latitude, row.longitude), row.id) for row in rows
+        )
+        return [pk for distance, pk in distances if distance <= radius_km][:limit]
+
+    def test_matches_a_full_scan(self):
+        rng = random.Random(11)
+        for _ in range(20):
+            latitude = self.CENTER[0] + rng.uniform(-0.35, 0.35)
+            longitude = self.CENTER[1] + rng.uniform(-0.35, 0.35)
+            radius_km, limit = rng.choice([0.5, 3, 10, 50]), rng.choice([1, 5, 30])
+            found = geo.nearest(
+                AppointmentDomicile.objects.filter(status='Pending'), latitude, longitude, radius_km, limit
+            )
+            self.assertEqual([row['id'] for _, row in found], self.scan(latitude, longitude, radius_km, limit))
+
+    def test_high_latitudes(self):
+        # Columns are ~0.2 km wide at 78°: the search used to OR together too many ranges for SQLite
+        rng = random.Random(13)
+        for center in ((78.22, 15.65), (-77.85, 166.67), (89.95, 0.0)):
+            appointments = [
+                AppointmentDomicile(
+                    client=self.client_user, time=datetime.time(9), car_type='SUV', car_name='Golf',
+                    wash_type='Full', place='Nord', price='1000',
+                    latitude=max(-90, min(90, center[0] + rng.uniform(-0.6, 0.6))),
+                    longitude=center[1] + rng.uniform(-3, 3),
+                )
+                for _ in range(150)
+            ]
+            for appointment in appointments:
+                appointment.save()
+            for radius_km, limit in ((50, 5), (50, 100), (5, 10)):
+                found = geo.nearest(
+                    AppointmentDomicile.objects.filter(status='Pending'), center[0], center[1], radius_km, limit
+                )
+                self.assertEqual(
+                    [row['id'] for _, row in found], self.scan(center[0], center[1], radius_km, limit)
+                )
+
+        api = api_client_for(self.employee, 'extern_employee')
+        response = api.get('/api/appointments_domicile/pending/near', {'lat': 78.22, 'lng': 15.65, 'radius_km': 50})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([r['id'] for r in response.json()['results']], self.scan(78.22, 15.65, 50, 20))
+
+    def test_many_ranges_read_only_the_circle(self):
+        # Columns are ~0.2 km wide at 78°: the last rings have more than MAX_RANGES ranges
+        far = AppointmentDomicile.objects.create(
+            client=self.client_user, time=datetime.time(9), car_type='SUV', car_name='Golf', wash_type='Full',
+            place='Nord', price='1000', latitude=78.22, longitude=120.0,
+        )
+        with CaptureQueriesContext(connection) as queries:
+            found = geo.nearest(AppointmentDomicile.objects.filter(status='Pending'), 78.22, 15.65, 50, 5,
+                                index_condition=Q(status='Pending'))
+        self.assertEqual([row['id'] for _, row in found], self.scan(78.22, 15.65, 50, 5))
+        ranges = []
+        for query in queries:
+            bounds = re.findall(r'BETWEEN (\d+) AND (\d+)', query['sql'])
+            self.assertLessEqual(len(bounds), geo.MAX_RANGES)
+            ranges += [(int(first), int(last)) for first, last in bounds]
+        self.assertGreater(len(ranges), geo.MAX_RANGES)
+        # In the same rows as the circle, but far east: no query reads its cell
+        self.assertFalse(any(first <= far.grid_cell <= last for first, last in ranges))
+
+    def test_endpoint(self):
+        api = api_client_for(self.employee, 'extern_employee')
+        response = api.get('/api/appointments_domicile/pending/near', {'lat': 36.75, 'lng': 3.06, 'limit': 5})
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()['results']
+        self.assertEqual([r['id'] for r in results], self.scan(36.75, 3.06, 10, 5))
+        self.assertEqual([r['distance_km'] for r in results], sorted(r['distance_km'] for r in results))
+        self.assertTrue(all(r['status'] == 'Pending' for r in results))
+
+        for params in ({'lat': 95, 'lng': 3}, {'lat': 'x', 'lng': 3}, {'lat': 36, 'lng': 3, 'radius_km': -1}):
+            self.assertEqual(api.get('/api/appointments_domicile/pending/near', params).status_code, 400)
+
+    def test_coordinates_come_together(self):
+        api = api_client_for(self.client_user, 'client')
+        item = {'time': '09:00', 'car_type': 'SUV', 'car_name': 'Golf', 'wash_type': 'Full',
+                'place': 'Alger', 'price': '1500.00'}
+        self.assertEqual(api.post('/api/appointments_domicile/create', {**item, 'latitude': 36.7}, format='json').status_code, 400)
+        response = api.post('/api/appointments_domicile/create', {**item, 'latitude': 36.7, 'longitude': 3.1}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(AppointmentDomicile.objects.latest('id').grid_cell, geo.grid_cell(36.7, 3.1))
+
+
+class RouteTests(TestCase):
+    """extern_employee/appointments/route/ orders the employee's In Progress appointments"""
+    # Stops on a line going east from the start, ~0.9 km apart
+    START = (36.75, 3.0)
+
+    def setUp(self):
+        routing.plan_cache.clear()
+        self.client_user = Client.objects.create(
+            full_name='Client', email='client@wash.dz', phone='0555000070', age=30, password='x',
+        )
+        self.employee = ExternEmployee.objects.create(
+            full_name='Employee', email='employee@wash.dz', phone='0555000071', age=25, password='x',
+        )
+        self.other = ExternEmployee.objects.create(
+            full_name='Other', email='other@wash.dz', phone='0555000072', age=25, password='x',
+        )
+        # Created in a shuffled order so the id order isn't the route
+        self.line = [self.appointment(step) for step in (3, 1, 4, 2, 5)]
+        self.unlocated = self.appointment(None)
+        self.appointment(6, employee=self.other)
+        self.appointment(7, status='Completed')
+
+    def appointment(self, step, employee=None, status='In Progress', time=datetime.time(9)):
+        return AppointmentDomicile.objects.create(
+            client=self.client_user, extern_employee=employee or self.employee, status=status, time=time,
+            car_type='SUV', car_name='Golf', wash_type='Full', place='Alger', price='1000',
+            latitude=None if step is None else self.START[0],
+            longitude=None if step is None else self.START[1] + step * 0.01,
+        )
+
+    def test_route_follows_the_line(self):
+        api = api_client_for(self.employee, 'extern_employee')
+        response = api.get('/api/extern_employee/appointments/route/', {'lat': self.START[0], 'lng': self.START[1]})
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()['results']
+        by_step = sorted(self.line, key=lambda a: a.longitude)
+        self.assertEqual([r['id'] for r in results], [a.id for a in by_step] + [self.unlocated.id])
+
+        leg = geo.haversine_km(self.START[0], self.START[1], self.START[0], self.START[1] + 0.01)
+        self.assertAlmostEqual(results[0]['leg_km'], leg, places=2)
+        self.assertAlmostEqual(results[4]['cumulative_km'], 5 * leg, places=2)
+        self.assertEqual(response.json()['total_km'], results[4]['cumulative_km'])
+        self.assertIsNone(results[5]['leg_km'])
+        self.assertEqual(results[0]['eta'], '09:00')
+
+    def test_time_windows_come_before_distance(self):
+        # The farthest stop is booked two hours before the others
+        far = self.line[4]
+        far.time = datetime.time(7)
+        far.save()
+        api = api_client_for(self.employee, 'extern_employee')
+        results = api.get('/api/extern_employee/appointments/route/', {'lat': self.START[0], 'lng': self.START[1]}).json()['results']
+        self.assertEqual(results[0]['id'], far.id)
+        self.assertEqual(results[0]['late_minutes'], 0)
+
+    def test_two_opt_undoes_crossings(self):
+        # Random points, distance only: no single segment reversal may shorten the result
+        config = {**routing.DEFAULTS, 'LATE_KM_PER_MINUTE': 0}
+        rng = random.Random(3)
+        for _ in range(20):
+            stops = [(i, 36.7 + rng.uniform(0, 0.1), 3.0 + rng.uniform(0, 0.1), 540) for i in range(8)]
+            planner = routing.RoutePlanner(stops, start=(36.7, 3.0), config=config)
+            order = planner.two_opt(planner.nearest_neighbour())
+            for i in range(len(order) - 1):
+                for j in range(i + 1, len(order)):
+                    reversed_order = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                    self.assertGreaterEqual(planner.cost(reversed_order), planner.cost(order) - 1e-9)
+
+    def test_plan_is_cached_until_the_appointments_change(self):
+        api = api_client_for(self.employee, 'extern_employee')
+        params = {'lat': self.START[0], 'lng': self.START[1]}
+        with mock.patch('wash.routing.plan_route', wraps=routing.plan_route) as plan_route:
+            first = api.get('/api/extern_employee/appointments/route/', params).json()
+            self.assertEqual(api.get('/api/extern_employee/appointments/route/', params).json(), first)
+            self.assertEqual(plan_route.call_count, 1)
+
+            self.line[0].status = 'Completed'
+            self.line[0].save()
+            second = api.get('/api/extern_employee/appointments/route/', params).json()
+            self.assertEqual(plan_route.call_count, 2)
+            self.assertNotIn(self.line[0].id, [r['id'] for r in second['results']])
+
+    def test_invalid_parameters(self):
+        api = api_client_for(self.employee, 'extern_employee')
+        for params in ({'lat': 36.7}, {'lat': 'x', 'lng': 3}, {'depart': '25:00'}):
+            self.assertEqual(api.get('/api/extern_employee/appointments/route/', params).status_code, 400)
+        self.assertEqual(api_client_for(self.client_user, 'client').get('/api/extern_employee/appointments/route/').status_code, 403)
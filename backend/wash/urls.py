@@ -13,6 +13,7 @@ from .views import (
     get_update_delete_extern_employee,
     get_update_delete_intern_employee,
     extern_employee_appointments,
+    extern_employee_route,
     intern_employee_appointments,
     get_client_for_appointment_domicile,
     get_client_for_appointment_location,
@@ -20,6 +21,14 @@ from .views import (
     get_update_appointment_location,
     create_appointment_domicile,
     create_appointment_location,
+    create_appointments_domicile_batch,
+    create_appointments_location_batch,
+    bulk_update_appointments_domicile_status,
+    bulk_update_appointments_location_status,
+    rate_extern_employee,
+    get_pending_appointments_near,
+    get_leaderboard,
+    get_employee_leaderboard_rank,
     update_client_profile,
     get_all_clients,
     get_delete_client,
@@ -27,19 +36,20 @@ from .views import (
     get_intern_appointments_stats,
     get_intern_appointments_revenue,
     get_extern_appointments_revenue,
-    get_client_feedbacks,
+    get_appointments_revenue_range,
     create_feedback,
     get_admin_feedbacks,
     approve_feedback,
     feedback_summary,
-    get_pending_appointments,
     claim_appointment,
+    issue_pending_stream_ticket,
     update_extern_employee_profile,
     update_intern_employee_profile,
-    get_extern_employee_public_details,
     delete_feedback,
     exchange_token
 )
+from . import async_views
+from .async_views import pending_appointments_stream, async_client_login, async_admin_login
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 urlpatterns = [
@@ -48,6 +58,9 @@ urlpatterns = [
     path('auth/extern_employee/login/', extern_employee_login, name='extern_employee_login'),
     path('auth/intern_employee/login/', intern_employee_login, name='intern_employee_login'),
     path('auth/admin/login/', admin_login, name='admin_login'),
+    # Same logins with password hashing off the request thread (best under ASGI)
+    path('auth/client/login/async/', async_client_login, name='async_client_login'),
+    path('auth/admin/login/async/', async_admin_login, name='async_admin_login'),
     path('auth/refresh/', refresh_token, name='refresh_token'),
     path('auth/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     
@@ -78,6 +91,7 @@ urlpatterns = [
     
     # Appointments
     path('extern_employee/appointments/', extern_employee_appointments, name='extern_employee_appointments'),
+    path('extern_employee/appointments/route/', extern_employee_route, name='extern_employee_route'),
     path('intern_employee/appointments/', intern_employee_appointments, name='intern_employee_appointments'),
     path('extern_employee/profile/', update_extern_employee_profile, name='update_extern_employee_profile'),
     path('intern_employee/profile/', update_intern_employee_profile, name='update_intern_employee_profile'),
@@ -86,17 +100,25 @@ urlpatterns = [
    #  path('appointment_domicile/<int:appointment_id>/client/', get_client_for_appointment_domicile, name='get_client_for_appointment_domicile'),
    # path('appointment_location/<int:appointment_id>/client/', get_client_for_appointment_location, name='get_client_for_appointment_location'),
     
-    # Get and update appointments
-    path('appointments_domicile/get_all', get_pending_appointments, name='get_all_appointments_domicile'),
+    # Get and update appointments (the list endpoints use the async views)
+    path('appointments_domicile/get_all', async_views.get_pending_appointments, name='get_all_appointments_domicile'),
+    path('appointments_domicile/pending/near', get_pending_appointments_near, name='pending_appointments_near'),
     path('appointments_domicile/<int:appointment_id>/claim', claim_appointment, name='claim_appointment'),
-    path('appointments_domicile/get', get_update_appointment_domicile, name='get_all_claimed_appointments_domicile'),
+    # SSE feed of pending appointments (ASGI only)
+    path('appointments_domicile/stream', pending_appointments_stream, name='pending_appointments_stream'),
+    path('appointments_domicile/stream/ticket', issue_pending_stream_ticket, name='pending_appointments_stream_ticket'),
+    path('appointments_domicile/get', async_views.get_appointments_domicile, name='get_all_claimed_appointments_domicile'),
     path('appointments_domicile/<int:appointment_id>/', get_update_appointment_domicile, name='update_appointment_domicile'),
-    path('appointments_location/get', get_update_appointment_location, name='get_all_appointments_location'),
+    path('appointments_location/get', async_views.get_appointments_location, name='get_all_appointments_location'),
     path('appointments_location/<int:appointment_id>/', get_update_appointment_location, name='update_appointment_location'),
     
     #create appointment
     path('appointments_domicile/create',create_appointment_domicile , name='create_appointment_domicile'),
     path('appointments_location/create',create_appointment_location , name='create_appointment_location'),
+    path('appointments_domicile/create/batch', create_appointments_domicile_batch, name='create_appointments_domicile_batch'),
+    path('appointments_location/create/batch', create_appointments_location_batch, name='create_appointments_location_batch'),
+    path('appointments_domicile/status/bulk', bulk_update_appointments_domicile_status, name='bulk_update_appointments_domicile_status'),
+    path('appointments_location/status/bulk', bulk_update_appointments_location_status, name='bulk_update_appointments_location_status'),
     
     
     #get all clients by admin and delete client by admin
@@ -109,6 +131,9 @@ urlpatterns = [
     #calculate appointments revenues
     path('admin/appointments/revenue/i', get_intern_appointments_revenue, name='appointment_revenue'),
     path('admin/appointments/revenue/e', get_extern_appointments_revenue, name='appointment_revenue'),
+    path('admin/appointments/revenue/range', get_appointments_revenue_range, name='appointment_revenue_range'),
+    path('admin/leaderboard/', get_leaderboard, name='leaderboard'),
+    path('admin/leaderboard/<int:employee_id>/', get_employee_leaderboard_rank, name='employee_leaderboard_rank'),
     #get all feedbacks by admin and approve feedback by admin
     path('admin/feedbacks/', get_admin_feedbacks, name='admin_feedbacks'),
     path('admin/feedbacks/<int:pk>/approve/', approve_feedback, name='approve_feedback'),
@@ -119,9 +144,10 @@ urlpatterns = [
     path('client/profile/<int:pk>/', get_delete_client, name='get_update_delete_client'),
     # feedback  
     path('feedback/',create_feedback, name='create_feedback'),
-    path('feedback/all/',get_client_feedbacks, name='client_feedbacks'),
+    path('feedback/all/', async_views.get_client_feedbacks, name='client_feedbacks'),
     
-    path('extern_employee/<int:employee_id>/', get_extern_employee_public_details),
+    path('extern_employee/<int:employee_id>/', async_views.get_extern_employee_public_details),
+    path('extern_employee/<int:employee_id>/rating/', rate_extern_employee, name='rate_extern_employee'),
     
 path('token/', exchange_token, name='token_exchange'),
     ]
\ No newline at end of file
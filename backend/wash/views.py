@@ -6,9 +6,12 @@ from django.contrib.auth import authenticate,logout
 from rest_framework.authtoken.models import Token
 
 from rest_framework.views import APIView
-from datetime import datetime
+import math
+from datetime import datetime, timedelta
+from django.conf import settings
 from django.utils import timezone
-from django.db.models import Count, Sum
+from django.db import transaction
+from django.db.models import Sum, Prefetch, Q
 
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.response import Response
@@ -20,7 +23,7 @@ from .serializers import (
     InternEmployeeDetailSerializer,
     InternEmployeeHistorySerializer
 )
-from .authoo import CustomJWTAuthentication
+from .authoo import CustomJWTAuthentication, ClaimsJWTAuthentication, get_stream_ticket_max_age, issue_stream_ticket
 from rest_framework.permissions import IsAuthenticated
 
 
@@ -45,10 +48,16 @@ from .models import (
     AppointmentDomicile, 
     AppointmentLocation,
     ExternEmployeeHistory,
-    InternEmployeeHistory
+    InternEmployeeHistory,
+    AppointmentDailyStat
 )
 
 from .mohper import IsClient, IsExternEmployee, IsInternEmployee, IsAdmin
+from .pagination import paginated_response, CREATED_AT_ORDERING
+from . import conditional, events, geo, revenue, routing
+from .batch import batch_create, bulk_transition
+from .db import retry_on_lock
+from .routers import replica_reads
 
 # تسجيل العميل
 @api_view(['POST'])
@@ -60,7 +69,6 @@ def register_client(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 from rest_framework.permissions import IsAdminUser
-from rest_framework.permissions import AllowAny
 # تسجيل الموظف الخارجي
 @api_view(['POST'])
 @authentication_classes([CustomJWTAuthentication])
@@ -108,22 +116,15 @@ def get_extern_employee_details(request):
         employee_data = ExternEmployeeDetailSerializer(extern_employee).data
         
         # Get their history records
-        history_records = ExternEmployeeHistory.objects.filter(extern_employee=extern_employee)
+        history_records = ExternEmployeeHistory.objects.filter(extern_employee=extern_employee).select_related('client', 'appointment')
         history_data = ExternEmployeeHistorySerializer(history_records, many=True).data
         
-        # Safely calculate totals
-        try:
-            total_cars_washed = sum(record.cars_washed for record in history_records)
-        except Exception as e:
-            # If there's an error calculating, default to 0
-            total_cars_washed = 0
-            
-        # Compile response
+        # Totals are kept on the employee row (EmployeeHistoryMixin)
         response_data = {
             'employee': employee_data,
             'history': history_data,
-            'total_cars_washed': total_cars_washed,
-            'total_clients': history_records.values('client').distinct().count()
+            'total_cars_washed': extern_employee.total_cars_washed,
+            'total_clients': extern_employee.total_clients,
         }
         
         return Response(response_data)
@@ -159,15 +160,15 @@ def get_intern_employee_details(request):
         employee_data = InternEmployeeDetailSerializer(intern_employee).data
         
         # Get their history records
-        history_records = InternEmployeeHistory.objects.filter(intern_employee=intern_employee)
+        history_records = InternEmployeeHistory.objects.filter(intern_employee=intern_employee).select_related('client', 'appointment')
         history_data = InternEmployeeHistorySerializer(history_records, many=True).data
         
-        # Compile response
+        # Totals are kept on the employee row (EmployeeHistoryMixin)
         response_data = {
             'employee': employee_data,
             'history': history_data,
-            'total_cars_washed': sum(record.cars_washed for record in history_records),
-            'total_clients': history_records.values('client').distinct().count()
+            'total_cars_washed': intern_employee.total_cars_washed,
+            'total_clients': intern_employee.total_clients,
         }
         
         return Response(response_data)
@@ -182,32 +183,29 @@ def get_intern_employee_details(request):
 @api_view(['GET'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def get_all_extern_employees_details(request):
     """
-    Admin endpoint to get details of all extern employees with their history
+    Admin endpoint to get details of all extern employees with their history.
+    Runs a fixed number of queries whatever the number of employees.
     """
-    # Get all extern employees
-    extern_employees = ExternEmployee.objects.all()
-    
-    response_data = []
+    # Totals are stored on the employee rows and history is prefetched with its client/appointment
+    extern_employees = ExternEmployee.objects.prefetch_related(
+        Prefetch(
+            'externemployeehistory_set',
+            queryset=ExternEmployeeHistory.objects.select_related('client', 'appointment'),
+        )
+    ).order_by('id')
     
-    for employee in extern_employees:
-        # Get employee details
-        employee_data = ExternEmployeeDetailSerializer(employee).data
-        
-        # Get history records
-        history_records = ExternEmployeeHistory.objects.filter(extern_employee=employee)
-        history_data = ExternEmployeeHistorySerializer(history_records, many=True).data
-        
-        # Compile employee data
-        employee_info = {
-            'employee': employee_data,
-            'history': history_data,
-            'total_cars_washed': sum(record.cars_washed for record in history_records),
-            'total_clients': history_records.values('client').distinct().count()
+    response_data = [
+        {
+            'employee': ExternEmployeeDetailSerializer(employee).data,
+            'history': ExternEmployeeHistorySerializer(employee.externemployeehistory_set.all(), many=True).data,
+            'total_cars_washed': employee.total_cars_washed,
+            'total_clients': employee.total_clients,
         }
-        
-        response_data.append(employee_info)
+        for employee in extern_employees
+    ]
     
     return Response(response_data)
 
@@ -215,32 +213,28 @@ def get_all_extern_employees_details(request):
 @api_view(['GET'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated])
+@replica_reads
 def get_all_intern_employees_details(request):
     """
-    Admin endpoint to get details of all intern employees with their history
+    Admin endpoint to get details of all intern employees with their history.
+    Runs a fixed number of queries whatever the number of employees.
     """
-    # Get all intern employees
-    intern_employees = InternEmployee.objects.all()
-    
-    response_data = []
+    intern_employees = InternEmployee.objects.prefetch_related(
+        Prefetch(
+            'internemployeehistory_set',
+            queryset=InternEmployeeHistory.objects.select_related('client', 'appointment'),
+        )
+    ).order_by('id')
     
-    for employee in intern_employees:
-        # Get employee details
-        employee_data = InternEmployeeDetailSerializer(employee).data
-        
-        # Get history records
-        history_records = InternEmployeeHistory.objects.filter(intern_employee=employee)
-        history_data = InternEmployeeHistorySerializer(history_records, many=True).data
-        
-        # Compile employee data
-        employee_info = {
-            'employee': employee_data,
-            'history': history_data,
-            'total_cars_washed': sum(record.cars_washed for record in history_records),
-            'total_clients': history_records.values('client').distinct().count()
+    response_data = [
+        {
+            'employee': InternEmployeeDetailSerializer(employee).data,
+            'history': InternEmployeeHistorySerializer(employee.internemployeehistory_set.all(), many=True).data,
+            'total_cars_washed': employee.total_cars_washed,
+            'total_clients': employee.total_clients,
         }
-        
-        response_data.append(employee_info)
+        for employee in intern_employees
+    ]
     
     return Response(response_data)
 
@@ -360,53 +354,120 @@ def get_update_delete_intern_employee(request, pk):
         return Response({"error": "الموظف غير موجود"}, status=status.HTTP_404_NOT_FOUND)
 
 
+def _float_param(query_params, name, default=None):
+    raw = query_params.get(name)
+    if raw is None:
+        return default
+    try:
+        value = float(raw)
+    except ValueError:
+        return None
+    return value if math.isfinite(value) else None
+
+
 @api_view(['GET'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated, IsExternEmployee])
-def get_pending_appointments(request):
+def get_pending_appointments_near(request):
+    """
+    The ?limit= pending appointments nearest to ?lat=&lng= within ?radius_km=,
+    nearest first, with their distance. Appointments booked without coordinates
+    are not included. Uses the grid index (wash/geo.py), not a scan of every pending row.
+    """
+    config = {'DEFAULT_RADIUS_KM': 10, 'MAX_RADIUS_KM': 50, 'DEFAULT_LIMIT': 20, 'MAX_LIMIT': 100}
+    config.update(getattr(settings, 'WASH_NEARBY', {}))
+    latitude = _float_param(request.query_params, 'lat')
+    longitude = _float_param(request.query_params, 'lng')
+    if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return Response({"error": "إحداثيات غير صالحة (lat, lng)"}, status=status.HTTP_400_BAD_REQUEST)
+    radius_km = _float_param(request.query_params, 'radius_km', config['DEFAULT_RADIUS_KM'])
+    if radius_km is None or radius_km <= 0:
+        return Response({"error": "نصف القطر غير صالح"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = int(request.query_params.get('limit', config['DEFAULT_LIMIT']))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return Response({"error": "العدد غير صالح"}, status=status.HTTP_400_BAD_REQUEST)
+    radius_km = min(radius_km, config['MAX_RADIUS_KM'])
+    limit = min(limit, config['MAX_LIMIT'])
+
+    pending = Q(status='Pending')
+    found = geo.nearest(
+        AppointmentDomicile.objects.filter(pending), latitude, longitude, radius_km, limit, index_condition=pending
+    )
+    appointments = AppointmentDomicile.objects.in_bulk([row['id'] for _, row in found])
+    results = []
+    for distance, row in found:
+        data = AppointmentDomicileSerializer(appointments[row['id']]).data
+        data['distance_km'] = round(distance, 3)
+        results.append(data)
+    return Response({'radius_km': radius_km, 'results': results})
+
+
+@api_view(['POST'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated, IsExternEmployee])
+def issue_pending_stream_ticket(request):
     """
-    View for external employees to see all 'Pending' appointments,
-    even those not assigned to them yet.
+    Short-lived ticket for opening appointments_domicile/stream?ticket=... with
+    EventSource, so the JWT itself never goes into a URL (and the access logs).
     """
-    pending_appointments = AppointmentDomicile.objects.filter(status='Pending')
-    serializer = AppointmentDomicileSerializer(pending_appointments, many=True)
-    return Response(serializer.data)
+    response = Response({
+        'ticket': issue_stream_ticket(request.user),
+        'expires_in': get_stream_ticket_max_age(),
+    })
+    response['Cache-Control'] = 'no-store'
+    return response
 
 
 @api_view(['POST'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated, IsExternEmployee])
+@retry_on_lock
 def claim_appointment(request, appointment_id):
     """
     External employee claims a pending appointment.
     Assigns it to them and updates the status to 'In Progress'.
+    The claim is a single conditional UPDATE, so when several employees
+    claim at the same time exactly one of them wins.
     """
-    try:
-        appointment = AppointmentDomicile.objects.get(id=appointment_id)
-        
-        if appointment.status != 'Pending':
+    with transaction.atomic():
+        claimed = AppointmentDomicile.objects.filter(id=appointment_id, status='Pending').update(
+            extern_employee_id=request.user.id,
+            status='In Progress',
+            updated_at=timezone.now(),
+        )
+        if claimed:
+            # update() bypasses save(), so move the appointment between stats buckets here
+            appointment = AppointmentDomicile.objects.get(id=appointment_id)
+            pending = {**appointment.stats_values(), 'status': 'Pending', 'extern_employee_id': None}
+            AppointmentDailyStat.record_change('domicile', appointment.stats_bucket(pending), appointment.stats_bucket())
+
+    if not claimed:
+        current = AppointmentDomicile.objects.filter(id=appointment_id).values('status', 'extern_employee_id').first()
+        if current is None:
             return Response(
-                {"error": "لا يمكن حجز موعد غير قيد الانتظار."},
-                status=status.HTTP_400_BAD_REQUEST
+                {"error": "الموعد غير موجود"},
+                status=status.HTTP_404_NOT_FOUND
             )
-
-        # Assign current employee
-        appointment.extern_employee = request.user  # assuming user is linked to ExternEmployee
-        appointment.status = 'In Progress'
-        appointment.save()
-
-        serializer = AppointmentDomicileSerializer(appointment)
-        return Response(serializer.data, status=status.HTTP_200_OK)
-
-    except AppointmentDomicile.DoesNotExist:
         return Response(
-            {"error": "الموعد غير موجود"},
-            status=status.HTTP_404_NOT_FOUND
+            {
+                "error": "لا يمكن حجز موعد غير قيد الانتظار.",
+                "status": current['status'],
+                "claimed_by": current['extern_employee_id'],
+            },
+            status=status.HTTP_400_BAD_REQUEST
         )
 
+    events.appointment_claimed(appointment_id, request.user.id)
+
+    serializer = AppointmentDomicileSerializer(appointment)
+    return Response(serializer.data, status=status.HTTP_200_OK)
+
 # Get and create appointments for extern employee
 @api_view(['GET'])
-@authentication_classes([CustomJWTAuthentication])
+@authentication_classes([ClaimsJWTAuthentication])
 @permission_classes([IsAuthenticated, IsExternEmployee])
 def extern_employee_appointments(request):
     """
@@ -418,6 +479,49 @@ def extern_employee_appointments(request):
         return Response(serializer.data)
 
 
+@api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication])
+@permission_classes([IsAuthenticated, IsExternEmployee])
+def extern_employee_route(request):
+    """
+    The employee's In Progress appointments in visiting order (wash/routing.py),
+    with the distance of each leg, the running total and the estimated time.
+    Optional ?lat=&lng= start point and ?depart=HH:MM. The plan is cached until
+    the appointments change.
+    """
+    start = None
+    if 'lat' in request.query_params or 'lng' in request.query_params:
+        latitude = _float_param(request.query_params, 'lat')
+        longitude = _float_param(request.query_params, 'lng')
+        if latitude is None or longitude is None or not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return Response({"error": "إحداثيات غير صالحة (lat, lng)"}, status=status.HTTP_400_BAD_REQUEST)
+        # ~100 m: a GPS position that moves a little keeps the cached plan
+        start = (round(latitude, 3), round(longitude, 3))
+    depart = None
+    if 'depart' in request.query_params:
+        try:
+            depart = routing.minutes_of(datetime.strptime(request.query_params['depart'], '%H:%M').time())
+        except ValueError:
+            return Response({"error": "وقت الانطلاق غير صالح (HH:MM)"}, status=status.HTTP_400_BAD_REQUEST)
+
+    appointments = list(
+        AppointmentDomicile.objects.filter(extern_employee=request.user.id, status='In Progress')
+    )
+    signature = routing.plan_signature(appointments, start, depart)
+    plan = routing.plan_cache.get(request.user.id, signature)
+    if plan is None:
+        plan = routing.plan_route(appointments, start, depart)
+        routing.plan_cache.set(request.user.id, signature, plan)
+
+    by_id = {appointment.id: appointment for appointment in appointments}
+    results = []
+    for stop in plan['stops']:
+        data = AppointmentDomicileSerializer(by_id[stop['id']]).data
+        data.update({key: value for key, value in stop.items() if key != 'id'})
+        results.append(data)
+    return Response({'total_km': plan['total_km'], 'results': results})
+
+
 # Get and create appointments for intern employee
 @api_view(['GET'])
 @authentication_classes([CustomJWTAuthentication])
@@ -467,6 +571,7 @@ def get_client_for_appointment_location(request, appointment_id):
 @api_view(['POST'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated, IsClient])
+@retry_on_lock
 def create_appointment_domicile(request):
     serializer = CreateAppointmentDomicileSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
@@ -480,6 +585,7 @@ def create_appointment_domicile(request):
 @api_view(['POST'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated, IsClient])
+@retry_on_lock
 def create_appointment_location(request):
     serializer = CreateAppointmentLocationSerializer(data=request.data, context={'request': request})
     if serializer.is_valid():
@@ -488,27 +594,44 @@ def create_appointment_location(request):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+# POST several appointments at once (fleet bookings)
+
+@api_view(['POST'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated, IsClient])
+@retry_on_lock
+def create_appointments_domicile_batch(request):
+    """
+    Body: {"appointments": [...]} (or the list itself), each item like appointments_domicile/create.
+    Valid items are inserted together; the response has one result per item.
+    """
+    return batch_create(
+        request, CreateAppointmentDomicileSerializer, AppointmentDomicileSerializer, 'domicile'
+    )
+
+
+@api_view(['POST'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated, IsClient])
+@retry_on_lock
+def create_appointments_location_batch(request):
+    """
+    Body: {"appointments": [...]} (or the list itself), each item like appointments_location/create.
+    Valid items are inserted together; the response has one result per item.
+    """
+    return batch_create(
+        request, CreateAppointmentLocationSerializer, AppointmentLocationSerializer, 'location'
+    )
+
 # Get and update all appointments domicile
 @api_view(['GET', 'PUT'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def get_update_appointment_domicile(request, appointment_id=None):
     """
-    Get all appointments domicile, get a specific appointment, or update a specific one
+    Get or update a specific appointment domicile (the list is async_views.get_appointments_domicile)
     """
-    if appointment_id is None and request.method == 'GET':
-        # Get all appointments
-        if hasattr(request.user, 'user_type') and request.user.user_type == 'extern_employee':
-            appointments = AppointmentDomicile.objects.filter(extern_employee=request.user.id)
-        elif hasattr(request.user, 'user_type') and request.user.user_type == 'client':
-            appointments = AppointmentDomicile.objects.filter(client=request.user.id)
-        else:
-            appointments = AppointmentDomicile.objects.all()
-            
-        serializer = AppointmentDomicileWithClientSerializer(appointments, many=True)
-        return Response(serializer.data)
-    
-    elif appointment_id is not None and request.method == 'GET':
+    if appointment_id is not None and request.method == 'GET':
         # Get a specific appointment by ID
         try:
             appointment = AppointmentDomicile.objects.get(id=appointment_id)
@@ -548,25 +671,31 @@ def get_update_appointment_domicile(request, appointment_id=None):
     
     return Response({"error": "طلب غير صالح"}, status=status.HTTP_400_BAD_REQUEST)
 
+# Move several appointments to a new status at once (e.g. closing out a day)
+@api_view(['POST'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated, IsAdmin | IsExternEmployee])
+@retry_on_lock
+def bulk_update_appointments_domicile_status(request):
+    """
+    Body: {"ids": [...], "status": "Completed"}. Extern employees can only change
+    their own appointments, admins any of them.
+    """
+    scope = AppointmentDomicile.objects.all()
+    if request.user.user_type == 'extern_employee':
+        scope = scope.filter(extern_employee=request.user.id)
+    return bulk_transition(request, scope, 'domicile', history=ExternEmployeeHistory)
+
+
 # Get and update all appointments location
 @api_view(['GET', 'PUT'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated]) 
 def get_update_appointment_location(request, appointment_id=None):
     """
-    Get all appointments location, get a specific appointment, or update a specific one
+    Get or update a specific appointment location (the list is async_views.get_appointments_location)
     """
-    if appointment_id is None and request.method == 'GET':
-        # Get all appointments
-        if hasattr(request.user, 'user_type') and request.user.user_type == 'client':
-            appointments = AppointmentLocation.objects.filter(client=request.user.id)
-        else:
-            appointments = AppointmentLocation.objects.all()
-            
-        serializer = AppointmentLocationWithClientSerializer(appointments, many=True)
-        return Response(serializer.data)
-    
-    elif appointment_id is not None and request.method == 'GET':
+    if appointment_id is not None and request.method == 'GET':
         # Get a specific appointment by ID
         try:
             appointment = AppointmentLocation.objects.get(id=appointment_id)
@@ -592,14 +721,34 @@ def get_update_appointment_location(request, appointment_id=None):
             
             serializer = AppointmentLocationSerializer(appointment, data=request.data, partial=True)
             if serializer.is_valid():
-                serializer.save()
+                # The intern employee working on an unassigned appointment takes it
+                if getattr(request.user, 'user_type', None) == 'intern_employee' and appointment.intern_employee_id is None:
+                    serializer.save(intern_employee_id=request.user.id)
+                else:
+                    serializer.save()
                 return Response(serializer.data)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except AppointmentLocation.DoesNotExist:
             return Response({"error": "الموعد غير موجود"}, status=status.HTTP_404_NOT_FOUND)
-    
+
     return Response({"error": "طلب غير صالح"}, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated, IsAdmin | IsInternEmployee])
+@retry_on_lock
+def bulk_update_appointments_location_status(request):
+    """
+    Body: {"ids": [...], "status": "Completed"}. An intern employee making the call
+    takes the appointments that have no intern employee yet.
+    """
+    assign = None
+    if request.user.user_type == 'intern_employee':
+        assign = {'intern_employee': request.user.id}
+    return bulk_transition(
+        request, AppointmentLocation.objects.all(), 'location', history=InternEmployeeHistory, assign=assign,
+    )
+
 @api_view(['POST'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated, IsAdmin])
@@ -614,6 +763,7 @@ def register_admin(request):
 @api_view(['GET'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated, IsAdmin])
+@replica_reads
 def get_all_clients(request):
     """
     Admin endpoint to get details of all clients
@@ -621,10 +771,8 @@ def get_all_clients(request):
     # Get all clients
     clients = Client.objects.all()
     
-    # Serialize client data
-    serializer = ClientDetailSerializer(clients, many=True)
-    
-    return Response(serializer.data)
+    # Serialize client data (paginated with ?page_size= / ?cursor=)
+    return paginated_response(request, clients, ClientDetailSerializer)
 
 # Get, delete a client
 @api_view(['GET', 'DELETE'])
@@ -652,6 +800,9 @@ def get_delete_client(request, pk):
 @api_view(['GET', 'PUT'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated, IsClient])
+@conditional.conditional(
+    lambda request: Client.objects.filter(email=request.user.email), conditional.PRIVATE_DETAIL
+)
 def update_client_profile(request):
     """
     Get or update the currently authenticated client's profile
@@ -679,6 +830,7 @@ def update_client_profile(request):
 @api_view(['GET'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated, IsAdmin])
+@replica_reads
 def get_extern_appointments_stats(request):
     """
     Admin endpoint to get statistics about extern employee appointments
@@ -700,17 +852,10 @@ def get_extern_appointments_stats(request):
         # Use today's date by default
         stats_date = timezone.now().date()
     
-    # Get all appointments for the specified date
-    appointments = AppointmentDomicile.objects.filter(date=stats_date)
-    
-    # Get count of total appointments
-    total_appointments = appointments.count()
-    
-    # Get count of appointments by status
-    status_counts = appointments.values('status').annotate(count=Count('status'))
-    
-    # Get count of appointments by wash type
-    wash_type_counts = appointments.values('wash_type').annotate(count=Count('wash_type'))
+    # Read the pre-aggregated buckets for this date (a handful of rows)
+    buckets = AppointmentDailyStat.objects.filter(day=stats_date, channel='domicile').values(
+        'status', 'wash_type', 'employee', 'count'
+    )
     
     # Convert status counts to a more user-friendly format
     status_stats = {
@@ -719,17 +864,21 @@ def get_extern_appointments_stats(request):
         'Completed': 0,
         'Deleted': 0
     }
-    
-    for item in status_counts:
-        status_stats[item['status']] = item['count']
-    
-    # Convert wash type counts to a dictionary
     wash_type_stats = {}
-    for item in wash_type_counts:
-        wash_type_stats[item['wash_type']] = item['count']
+    total_appointments = 0
+    employees = set()
+    
+    for item in buckets:
+        if not item['count']:
+            continue
+        total_appointments += item['count']
+        status_stats[item['status']] = status_stats.get(item['status'], 0) + item['count']
+        wash_type_stats[item['wash_type']] = wash_type_stats.get(item['wash_type'], 0) + item['count']
+        if item['employee'] != AppointmentDailyStat.NO_EMPLOYEE:
+            employees.add(item['employee'])
     
-    # Get count of unique extern employees who have appointments on this date
-    total_employees = appointments.values('extern_employee').distinct().count()
+    # Unique extern employees with appointments on this date (the buckets are per employee)
+    total_employees = len(employees)
     
     # Compile response
     response_data = {
@@ -745,6 +894,7 @@ def get_extern_appointments_stats(request):
 @api_view(['GET'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated, IsAdmin])
+@replica_reads
 def get_intern_appointments_stats(request):
     """
     Admin endpoint to get statistics about extern employee appointments
@@ -766,23 +916,8 @@ def get_intern_appointments_stats(request):
         # Use today's date by default
         stats_date = timezone.now().date()
     
-    # Get all appointments for the specified date
-    appointments = AppointmentLocation.objects.filter(date=stats_date)
-    
-    # Get count of appointments by wash type
-    wash_type_counts = appointments.values('wash_type').annotate(count=Count('wash_type'))
-    
-    
-    # Get count of total appointments
-    total_appointments = appointments.count()
-    
-    # Get count of appointments by status
-    status_counts = appointments.values('status').annotate(count=Count('status'))
-    
-    # Convert wash type counts to a dictionary
-    wash_type_stats = {}
-    for item in wash_type_counts:
-        wash_type_stats[item['wash_type']] = item['count']
+    # Read the pre-aggregated buckets for this date (a handful of rows)
+    buckets = AppointmentDailyStat.objects.filter(day=stats_date, channel='location').values('status', 'wash_type', 'count')
     
     # Convert to a more user-friendly format
     status_stats = {
@@ -791,12 +926,15 @@ def get_intern_appointments_stats(request):
         'Completed': 0,
         'Deleted': 0
     }
+    wash_type_stats = {}
+    total_appointments = 0
     
-    for item in status_counts:
-        status_stats[item['status']] = item['count']
-    
-    # Get count of unique extern employees who have appointments on this date
-    
+    for item in buckets:
+        if not item['count']:
+            continue
+        total_appointments += item['count']
+        status_stats[item['status']] = status_stats.get(item['status'], 0) + item['count']
+        wash_type_stats[item['wash_type']] = wash_type_stats.get(item['wash_type'], 0) + item['count']
     
     # Compile response
     response_data = {
@@ -811,6 +949,7 @@ def get_intern_appointments_stats(request):
 @api_view(['GET'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated, IsAdmin])
+@replica_reads
 def get_intern_appointments_revenue(request):
     """
     Calculate total revenue for all completed intern appointments for a specific date
@@ -832,19 +971,20 @@ def get_intern_appointments_revenue(request):
             # Use today's date by default
             stats_date = timezone.now().date()
         
-        # Get all completed appointments for the specified date
-        appointments_completed = AppointmentLocation.objects.filter(
-            date=stats_date,
+        # Sum the pre-aggregated completed buckets for the specified date
+        totals = AppointmentDailyStat.objects.filter(
+            day=stats_date,
+            channel='location',
             status='Completed'
-        )
+        ).aggregate(total=Sum('revenue'), count=Sum('count'))
         
-        # Calculate total revenue, handle case where no appointments exist
-        total_revenue = appointments_completed.aggregate(total=Sum('price'))['total'] or 0
+        # Handle case where no appointments exist
+        total_revenue = totals['total'] or 0
         
         response_data = {
             'date': stats_date.strftime('%Y-%m-%d'),
             'total_revenue': float(total_revenue),  # Convert Decimal to float for JSON serialization
-            'appointment_count': appointments_completed.count()
+            'appointment_count': totals['count'] or 0
         }
         
         return Response(response_data)
@@ -862,6 +1002,7 @@ def get_intern_appointments_revenue(request):
 @api_view(['GET'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated, IsAdmin])
+@replica_reads
 def get_extern_appointments_revenue(request):
     """
     Calculate total revenue for all completed intern appointments for a specific date
@@ -883,19 +1024,20 @@ def get_extern_appointments_revenue(request):
             # Use today's date by default
             stats_date = timezone.now().date()
         
-        # Get all completed appointments for the specified date
-        appointments_completed = AppointmentDomicile.objects.filter(
-            date=stats_date,
+        # Sum the pre-aggregated completed buckets for the specified date
+        totals = AppointmentDailyStat.objects.filter(
+            day=stats_date,
+            channel='domicile',
             status='Completed'
-        )
+        ).aggregate(total=Sum('revenue'), count=Sum('count'))
         
-        # Calculate total revenue, handle case where no appointments exist
-        total_revenue = appointments_completed.aggregate(total=Sum('price'))['total'] or 0
+        # Handle case where no appointments exist
+        total_revenue = totals['total'] or 0
         
         response_data = {
             'date': stats_date.strftime('%Y-%m-%d'),
             'total_revenue': float(total_revenue),  # Convert Decimal to float for JSON serialization
-            'appointment_count': appointments_completed.count()
+            'appointment_count': totals['count'] or 0
         }
         
         return Response(response_data)
@@ -908,8 +1050,123 @@ def get_extern_appointments_revenue(request):
             {"error": "An error occurred while processing your request."},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+@api_view(['GET'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated, IsAdmin])
+@replica_reads
+def get_appointments_revenue_range(request):
+    """
+    Revenue of completed appointments between ?from= and ?to= (YYYY-MM-DD),
+    grouped by ?bucket=day|week|month, with an optional ?breakdown=wash_type|car_type
+    and ?channel=domicile|location (both by default).
+    One grouped query per channel; amounts are Decimal strings.
+    """
+    try:
+        date_from = datetime.strptime(request.GET.get('from', ''), '%Y-%m-%d').date()
+        date_to = datetime.strptime(request.GET.get('to', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return Response(
+            {"error": "Invalid date format. Please use from=YYYY-MM-DD&to=YYYY-MM-DD"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    bucket = request.GET.get('bucket', 'day')
+    breakdown = request.GET.get('breakdown') or None
+    channel = request.GET.get('channel')
+    channels = [channel] if channel else list(revenue.CHANNELS)
+
+    if date_from > date_to:
+        return Response({"error": "'from' must be before 'to'"}, status=status.HTTP_400_BAD_REQUEST)
+    if bucket not in revenue.TRUNC_FUNCTIONS:
+        return Response({"error": "bucket must be day, week or month"}, status=status.HTTP_400_BAD_REQUEST)
+    if breakdown is not None and breakdown not in revenue.BREAKDOWNS:
+        return Response({"error": "breakdown must be wash_type or car_type"}, status=status.HTTP_400_BAD_REQUEST)
+    if any(c not in revenue.CHANNELS for c in channels):
+        return Response({"error": "channel must be domicile or location"}, status=status.HTTP_400_BAD_REQUEST)
+    if date_to == date_to.max:
+        return Response({"error": "'to' is out of range"}, status=status.HTTP_400_BAD_REQUEST)
+    if revenue.count_periods(date_from, date_to, bucket) > revenue.MAX_PERIODS:
+        return Response({"error": "Date range too large for this bucket"}, status=status.HTTP_400_BAD_REQUEST)
+
+    response_data = {
+        'from': date_from.strftime('%Y-%m-%d'),
+        'to': date_to.strftime('%Y-%m-%d'),
+        'bucket': bucket,
+        'breakdown': breakdown,
+    }
+    for c in channels:
+        response_data[c] = revenue.revenue_series(c, date_from, date_to, bucket, breakdown)
+
+    return Response(response_data)
+
+
+from .models import LeaderboardEntry
+LEADERBOARD_METRICS = dict(LeaderboardEntry.METRIC_CHOICES)
+
+
+@api_view(['GET'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated, IsAdmin])
+@replica_reads
+def get_leaderboard(request):
+    """
+    Top ?limit= extern employees on ?metric=rating|week|month|completion, read from
+    the table refreshed by the refresh_leaderboard command (one indexed query).
+    """
+    config = {'DEFAULT_LIMIT': 10, 'MAX_LIMIT': 100}
+    config.update(getattr(settings, 'WASH_LEADERBOARD', {}))
+    metric = request.GET.get('metric', 'rating')
+    if metric not in LEADERBOARD_METRICS:
+        return Response(
+            {"error": "metric must be one of: " + ", ".join(LEADERBOARD_METRICS)}, status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        limit = int(request.GET.get('limit', config['DEFAULT_LIMIT']))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return Response({"error": "limit must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+    entries = list(
+        LeaderboardEntry.objects.filter(metric=metric, rank__lte=min(limit, config['MAX_LIMIT']))
+        .order_by('rank')
+        .values('rank', 'extern_employee_id', 'full_name', 'value', 'out_of', 'computed_at')
+    )
+    return Response({
+        'metric': metric,
+        'computed_at': entries[0]['computed_at'] if entries else None,
+        'out_of': entries[0]['out_of'] if entries else 0,
+        'results': [
+            {'rank': e['rank'], 'employee_id': e['extern_employee_id'], 'full_name': e['full_name'], 'value': e['value']}
+            for e in entries
+        ],
+    })
+
+
+@api_view(['GET'])
+@authentication_classes([CustomJWTAuthentication])
+@permission_classes([IsAuthenticated, IsAdmin])
+@replica_reads
+def get_employee_leaderboard_rank(request, employee_id):
+    """
+    Rank and value of one extern employee on every leaderboard metric (one indexed query).
+    """
+    entries = list(
+        LeaderboardEntry.objects.filter(extern_employee_id=employee_id)
+        .values('metric', 'full_name', 'rank', 'value', 'out_of', 'computed_at')
+    )
+    if not entries:
+        return Response({"error": "الموظف غير موجود في الترتيب"}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'employee_id': employee_id,
+        'full_name': entries[0]['full_name'],
+        'computed_at': entries[0]['computed_at'],
+        'ranks': {e['metric']: {'rank': e['rank'], 'value': e['value'], 'out_of': e['out_of']} for e in entries},
+    })
         
-from .models import Feedback
+from .models import Feedback, FeedbackCounter
 from .serializers import FeedbackSerializer
 @api_view(['POST'])
 @authentication_classes([CustomJWTAuthentication])
@@ -917,6 +1174,7 @@ from .serializers import FeedbackSerializer
 def create_feedback(request):
     serializer = FeedbackSerializer(data=request.data)
     if serializer.is_valid():
+        # Feedback.save() keeps FeedbackCounter up to date
         serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -947,25 +1205,16 @@ def approve_feedback(request, pk):
 def delete_feedback(req, pk):
     try:
         feedback = Feedback.objects.get(pk=pk)
+        # FeedbackCounter is updated by the post_delete receiver (wash/signals.py)
         feedback.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
     except Feedback.DoesNotExist:
         return Response(status=status.HTTP_404_NOT_FOUND)
 
-@api_view(['GET'])
-@authentication_classes([CustomJWTAuthentication])
-@authentication_classes([AllowAny])
-def get_client_feedbacks(request):
-    """
-    Clients can see all approved feedback from everyone
-    """
-    feedbacks = Feedback.objects.filter(approved=True)
-    serializer = FeedbackSerializer(feedbacks, many=True)
-    return Response(serializer.data)
-
 @api_view(['GET'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated, IsAdmin])
+@replica_reads
 def get_admin_feedbacks(request):
     """
     Admins can see all feedback and optionally filter by approval status
@@ -979,8 +1228,7 @@ def get_admin_feedbacks(request):
     else:
         feedbacks = Feedback.objects.all()
     
-    serializer = FeedbackSerializer(feedbacks, many=True)
-    return Response(serializer.data)
+    return paginated_response(request, feedbacks, FeedbackSerializer, ordering=CREATED_AT_ORDERING)
 
 from django.db.models import Count, Avg
 
@@ -988,6 +1236,7 @@ from django.db.models import Count, Avg
 @api_view(['GET'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated, IsAdmin])
+@replica_reads
 def feedback_summary(request):
     """
     Get summary statistics for feedback:
@@ -995,17 +1244,15 @@ def feedback_summary(request):
     - Count of not approved feedback
     - Count of approved feedback
     - Average rating
+    Reads the maintained FeedbackCounter row, so the cost doesn't depend on the number of feedback rows.
     """
     try:
-        # Get total count
-        total_count = Feedback.objects.count()
-        
-        # Get approved counts
-        approved_count = Feedback.objects.filter(approved=True).count()
-        not_approved_count = Feedback.objects.filter(approved=False).count()
+        counts = FeedbackCounter.get_counts()
         
-        # Calculate average rating
-        avg_rating = Feedback.objects.aggregate(avg_rating=Avg('rating'))['avg_rating']
+        total_count = counts['total']
+        approved_count = counts['approved']
+        not_approved_count = total_count - approved_count
+        avg_rating = counts['rating_sum'] / total_count if total_count else None
         
         # Create summary data
         summary = {
@@ -1023,29 +1270,48 @@ def feedback_summary(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
         
-# Get public extern employee details by ID (for clients)
-@api_view(['GET'])
+
+
+from .models import Rating
+from .serializers import RatingSerializer
+# Rate an extern employee (clients they served)
+@api_view(['POST'])
 @authentication_classes([CustomJWTAuthentication])
 @permission_classes([IsAuthenticated, IsClient])
-def get_extern_employee_public_details(request, employee_id):
+@retry_on_lock
+def rate_extern_employee(request, employee_id):
     """
-    Allow a client to retrieve public details (full_name, phone, final_rating)
-    of an extern employee using their ID.
+    Body: {"rating": 1..5}. A client has one rating per employee and can change it;
+    the employee's totals and final_rating are updated in one statement.
     """
-    try:
-        extern_employee = ExternEmployee.objects.get(id=employee_id)
+    serializer = RatingSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    value = serializer.validated_data['rating']
 
-        # Only return selected fields
-        public_data = {
-            "full_name": extern_employee.full_name,
-            "phone": extern_employee.phone,
-            "final_rating": extern_employee.final_rating
-        }
+    served = AppointmentDomicile.objects.filter(
+        client=request.user.id, extern_employee=employee_id, status='Completed'
+    ).exists()
+    if not served:
+        return Response(
+            {"error": "لا يمكنك تقييم موظف لم يقدّم لك خدمة"}, status=status.HTTP_403_FORBIDDEN
+        )
 
-        return Response(public_data)
-    
-    except ExternEmployee.DoesNotExist:
-        return Response({"error": "الموظف غير موجود"}, status=status.HTTP_404_NOT_FOUND)
+    with transaction.atomic():
+        ratings = Rating.objects.filter(client=request.user.id, extern_employee=employee_id)
+        previous = ratings.values_list('rating', flat=True).first()
+        if previous is None:
+            Rating.objects.create(client_id=request.user.id, extern_employee_id=employee_id, rating=value)
+            ExternEmployee.apply_rating(employee_id, count=1, rating_sum=value)
+        else:
+            ratings.update(rating=value, date=timezone.now())
+            ExternEmployee.apply_rating(employee_id, rating_sum=value - previous)
+
+    totals = ExternEmployee.objects.values('final_rating', 'rating_count').get(id=employee_id)
+    return Response(
+        {"rating": value, **totals},
+        status=status.HTTP_201_CREATED if previous is None else status.HTTP_200_OK,
+    )
 
 
 ## CREATE GOOGLE AUTH 
@@ -1,5 +1,5 @@
 import axios from "axios";
-import { ACCESS_TOKEN } from "./constants";
+import { ACCESS_TOKEN, PRIMARY_UNTIL } from "./constants";
 import { IP_ADDRESS } from "./constants";
 const apiUrl = `http://${IP_ADDRESS}:8000/`;
 
@@ -13,6 +13,11 @@ api.interceptors.request.use(
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
     }
+    // Read our own writes: the backend's pin cookie isn't sent cross-origin
+    const primaryUntil = sessionStorage.getItem(PRIMARY_UNTIL);
+    if (primaryUntil && Number(primaryUntil) * 1000 > Date.now()) {
+      config.headers[PRIMARY_UNTIL] = primaryUntil;
+    }
     return config;
   },
   (error) => {
@@ -20,4 +25,12 @@ api.interceptors.request.use(
   }
 );
 
+api.interceptors.response.use((response) => {
+  const primaryUntil = response.headers[PRIMARY_UNTIL.toLowerCase()];
+  if (primaryUntil) {
+    sessionStorage.setItem(PRIMARY_UNTIL, primaryUntil);
+  }
+  return response;
+});
+
 export default api;
\ No newline at end of file
@@ -1,5 +1,7 @@
 export const ACCESS_TOKEN = "access";
 export const REFRESH_TOKEN = "refresh"
+// Replica pin of the backend (wash/routers.py), echoed back after a write
+export const PRIMARY_UNTIL = "X-Wash-Primary-Until"
 
 export const IP_ADDRESS = "145.223.69.97"
 